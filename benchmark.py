@@ -0,0 +1,507 @@
+import os
+import sys
+import json
+import math
+import asyncio
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logging_setup import setup_logging
+
+logger = logging.getLogger("benchmark")
+
+# ==============================
+# FIXTURE PAGES
+# ==============================
+
+PRODUCT_PAGE = """<!DOCTYPE html>
+<html><head>
+<title>{title} Price in India - Buy {title} online at Flipkart.com</title>
+<link rel="canonical" href="http://www.flipkart.com/{slug}/p/itm{item}?pid={pid}">
+<meta property="og:title" content="{title}">
+<script type="application/ld+json">[{{"@context":"http://schema.org","@type":"Product","name":"{title}",
+"offers":{{"@type":"Offer","price":{price},"priceCurrency":"INR","availability":"http://schema.org/InStock",
+"seller":{{"@type":"Organization","name":"RetailNet"}}}}}}]</script>
+</head><body>
+<div id="container"><h1 class="yhB1nd"><span class="B_NuCI">{title}</span></h1>
+<div class="CEmiEU"><div class="Nx9bqj CxhGGd">&#8377;{price_text}</div><div class="yRaY8j A6+E6v">&#8377;{mrp_text}</div></div>
+<div id="sellerName"><span><span>RetailNet</span></span></div>
+{filler}
+</div>
+<script>window.__INITIAL_STATE__={{"pageDataV4":{{"page":{{"data":{{"pricing":{{"finalPrice":{{"value":{price}}},"mrp":{{"value":{mrp}}}}}}}}}}}}}</script>
+</body></html>
+"""
+
+BLOCK_PAGE = """<!DOCTYPE html><html><head><title>Are you a human?</title></head>
+<body><h1>Please verify you are a human</h1><div class="g-recaptcha"></div></body></html>"""
+
+NOT_FOUND_PAGE = """<!DOCTYPE html><html><head><title>Page not found</title></head><body>404</body></html>"""
+
+# Product pages carry a lot of unrelated markup; roughly 150 KB of it
+FILLER = "\n".join(
+    f'<div class="_1AtVbE col-12-12"><a class="s1Q9rs" href="/item-{i}/p/itm{i:013d}">Related item {i}</a>'
+    f'<div class="_30jeq3">&#8377;{1000 + i:,}</div></div>'
+    for i in range(1200)
+)
+
+def product_id(n):
+    return f"itm{n:013d}", f"BNCHPID{n:09d}"
+
+def base_price(n):
+    return 500 + (n * 37) % 90000
+
+def render_product(n, cycle, recorded=None):
+    """HTML for product n; the price drifts a little from one cycle to the next."""
+    if recorded:
+        return recorded[n % len(recorded)]
+    rng = random.Random(n * 7919 + cycle)
+    base = base_price(n)
+    price = base - rng.choice([0, 0, 0, 0, 50, 100]) + rng.choice([0, 0, 0, 25])
+    mrp = int(base * 1.3)
+    item, pid = product_id(n)
+    return PRODUCT_PAGE.format(
+        title=f"Benchmark Product {n}", slug=f"benchmark-product-{n}", item=item[3:], pid=pid,
+        price=price, price_text=f"{price:,}", mrp=mrp, mrp_text=f"{mrp:,}", filler=FILLER,
+    )
+
+# ==============================
+# FIXTURE SERVER
+# ==============================
+
+class FixtureServer:
+    """Local stand-in for Flipkart, reached by the fetcher as its HTTP proxy.
+
+    Requests keep their real flipkart.com URLs, so link parsing, short-link
+    resolution and product keys behave exactly as in production.
+    """
+
+    def __init__(self, latency_ms=50, jitter_ms=25, block_rate=0.0, error_rate=0.0,
+                 not_found_rate=0.0, recorded=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.block_rate = block_rate
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.recorded = recorded
+        self.cycle = 0
+        self.requests = 0
+        self.served = {"product": 0, "redirect": 0, "blocked": 0, "error": 0, "not_found": 0}
+        self._lock = threading.Lock()
+        # The default listen backlog of 5 drops connections when --pipeline opens dozens at once
+        server_class = type("FixtureHTTPServer", (ThreadingHTTPServer,), {"request_queue_size": 256})
+        self._httpd = server_class(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def proxy_url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, name="fixture-server", daemon=True).start()
+
+    def stop(self):
+        self._httpd.shutdown()
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests = 0
+            self.served = dict.fromkeys(self.served, 0)
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests += 1
+            self.served[kind] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body="", headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                delay = max(0.0, random.gauss(server.latency_ms, server.jitter_ms)) / 1000
+                time.sleep(delay)
+                url = urlparse(self.path)
+                if url.path.startswith("/s/"):
+                    n = int(url.path[3:])
+                    item, pid = product_id(n)
+                    server._count("redirect")
+                    return self._send(302, headers={
+                        "Location": f"http://www.flipkart.com/benchmark-product-{n}/p/{item}?pid={pid}"})
+
+                roll = random.random()
+                if roll < server.error_rate:
+                    server._count("error")
+                    return self._send(500, "Internal Server Error")
+                roll -= server.error_rate
+                if roll < server.block_rate:
+                    server._count("blocked")
+                    # Rate limits, forbidden and a CAPTCHA page served with 200 all count as blocks
+                    return self._send(random.choice([403, 429, 200]), BLOCK_PAGE)
+                roll -= server.block_rate
+                if roll < server.not_found_rate:
+                    server._count("not_found")
+                    return self._send(404, NOT_FOUND_PAGE)
+
+                try:
+                    n = int(url.path.rsplit("/p/itm", 1)[1])
+                except (IndexError, ValueError):
+                    server._count("not_found")
+                    return self._send(404, NOT_FOUND_PAGE)
+                server._count("product")
+                return self._send(200, render_product(n, server.cycle, server.recorded))
+
+        return Handler
+
+# ==============================
+# MEASUREMENT
+# ==============================
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+def latency_summary(seconds):
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 1) if seconds else None,
+        "p95_ms": round(percentile(seconds, 95) * 1000, 1) if seconds else None,
+        "p99_ms": round(percentile(seconds, 99) * 1000, 1) if seconds else None,
+        "max_ms": round(max(seconds) * 1000, 1) if seconds else None,
+    }
+
+class RssSampler:
+    """Samples the RSS of this process and all its children (browsers, fetch workers)."""
+
+    def __init__(self, rss_fn, interval=0.25):
+        self.rss_fn = rss_fn
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.rss_fn(os.getpid()))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ==============================
+# SCENARIO
+# ==============================
+
+def histogram_summary(histogram):
+    """latency_summary() for a metrics histogram, pooling every label; bucket-interpolated."""
+    count = histogram.count()
+    def ms(q):
+        return round(histogram.quantile(q, None) * 1000, 1) if count else None
+    return {"count": count, "p50_ms": ms(0.5), "p95_ms": ms(0.95), "p99_ms": ms(0.99)}
+
+def extract_benchmark(pages, repeat):
+    """Time reading the price from embedded page data against parsing a DOM and trying selectors."""
+    from bs4 import BeautifulSoup
+    from page_data import extract_embedded
+    from product_fetcher import PRICE_SELECTORS, parse_price
+
+    def embedded(page):
+        return extract_embedded(page).get("price")
+
+    def selectors(page):
+        soup = BeautifulSoup(page, "html.parser")
+        for selector in PRICE_SELECTORS:
+            tag = soup.select_one(selector)
+            if tag:
+                return parse_price(tag.get_text(strip=True))
+        return None
+
+    result = {}
+    for name, read in (("embedded", embedded), ("selectors", selectors)):
+        seconds, hits = [], 0
+        for _ in range(repeat):
+            for page in pages:
+                started = time.perf_counter()
+                hits += read(page) is not None
+                seconds.append(time.perf_counter() - started)
+        result[name] = latency_summary(seconds) | {"hit_rate": round(hits / len(seconds), 3) if seconds else None}
+    return result
+
+def run_size(n, args, server, workdir):
+    """Add products through the bot's add path, then run one full check cycle over n tracked items.
+
+    Everything from link resolution to alert queuing is the bot's own code;
+    only the network is swapped for the fixture server. The bot's storage,
+    registry, engine and pipeline are rebuilt for each size.
+    """
+    # Imported here: the environment must be configured before these modules load
+    import flipkart_price_alert as bot
+    from storage import Storage
+    from registry import ProductRegistry
+    from price_history import PriceHistory
+    from check_engine import CheckEngine, HostThrottle
+    from product_fetcher import classify_snapshot, tier_stats, drain_fetch_stats
+    from fetch_workers import FETCH_PROCESSES, get_fetch_worker_pool
+    from browser_pool import process_tree_rss_mb
+    from check_pipeline import CheckPipeline
+    from metrics import METRICS, STAGE_SECONDS, FETCH_SECONDS, BROWSER_LAUNCHES
+
+    server.reset_counts()
+    METRICS.drain()
+    storage = Storage(os.path.join(workdir, f"bench_{n}.db"))
+    storage.init()
+    bot.STORAGE = storage
+    bot.REGISTRY = ProductRegistry(storage)
+    bot.PRICE_HISTORY = PriceHistory(storage)
+    # The outbox is never started: alerts are only written to its table, where they are counted
+    bot.OUTBOX.storage = storage
+    bot.CHECK_ENGINE = CheckEngine(workers=args.workers, max_in_flight=args.fetchers if args.pipeline else args.workers,
+                                   throttle=HostThrottle(args.host_delay, args.host_delay), classify=classify_snapshot)
+    drain_fetch_stats()
+
+    # --pipeline: adds and the cycle go through the asyncio pipeline on this loop, as in CHECK_MODE=async
+    loop = asyncio.new_event_loop() if args.pipeline else None
+    pipeline = None
+    if args.pipeline:
+        pipeline = bot.PIPELINE = CheckPipeline(bot.CHECK_ENGINE, bot.REGISTRY.subscribers, bot.apply_snapshot,
+                                                fetchers=args.fetchers)
+
+        async def start_pipeline():
+            pipeline.start()
+        loop.run_until_complete(start_pipeline())
+
+    def link_for(i):
+        if random.random() < args.short_link_ratio:
+            return f"http://dl.flipkart.com/s/{i}"
+        item, pid = product_id(i)
+        return f"http://www.flipkart.com/benchmark-product-{i}/p/{item}?pid={pid}"
+
+    with RssSampler(process_tree_rss_mb) as sampler:
+        # Add path: what a user sending a link runs through, for a sample of the items
+        add_seconds = []
+        for i in range(min(n, args.adds)):
+            chat_id, link = 1000 + i % 50, link_for(i)
+            started = time.perf_counter()
+            try:
+                if pipeline is not None:
+                    loop.run_until_complete(bot.add_product_async(chat_id, link))
+                else:
+                    bot.add_product(chat_id, link)
+            except Exception as e:
+                logger.debug("Add failed for %s: %s", link, e)
+            add_seconds.append(time.perf_counter() - started)
+        added = len(bot.REGISTRY)
+
+        # The rest are seeded directly; several chats share some products, as in real use
+        conn = storage.connection()
+        with conn:
+            conn.execute("BEGIN")
+            for i in range(min(n, args.adds), n):
+                product = i if i % 10 else i // 10
+                item, pid = product_id(product)
+                storage.add_subscription({
+                    "chat_id": 1000 + i % 50, "product_key": f"pid:{pid}",
+                    "product_link": f"http://www.flipkart.com/benchmark-product-{product}/p/{item}?pid={pid}",
+                    "title": f"Benchmark Product {product}",
+                    "initial_price": base_price(product), "last_price": base_price(product),
+                })
+        bot.REGISTRY.load()
+
+        # Check cycle: every product once, through check_product_group or the pipeline
+        server.cycle += 1
+        FETCH_SECONDS.drain()
+        groups = {}
+        for item in bot.REGISTRY.all():
+            groups.setdefault(item["product_key"], []).append(item)
+
+        async def pipeline_cycle():
+            for key in groups:
+                await pipeline.submit(key)
+            await pipeline.join()
+
+        started = time.perf_counter()
+        if pipeline is not None:
+            loop.run_until_complete(pipeline_cycle())
+            ok = pipeline.checked
+        else:
+            results = bot.CHECK_ENGINE.map(bot.check_product_group, list(groups.values()))
+            ok = sum(1 for result in results if getattr(result, "price", None) is not None)
+        cycle_seconds = time.perf_counter() - started
+
+    result = {
+        "items": n,
+        "products": len(groups),
+        "adds": latency_summary(add_seconds) | {"added": added},
+        "cycle_seconds": round(cycle_seconds, 3),
+        "checks_per_second": round(len(groups) / cycle_seconds, 2) if cycle_seconds else None,
+        # From the production fetch histogram, including fetches merged in from worker processes
+        "fetch": histogram_summary(FETCH_SECONDS),
+        "succeeded": ok,
+        "failed": len(groups) - ok,
+        "alerts": len(storage.outbox_pending()),
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        # Counted in this process and in every fetch worker, whose metrics are merged on each reply
+        "browser_launches": sum(BROWSER_LAUNCHES.values().values()),
+        "tiers": tier_stats(),
+        "stages": {
+            labels[0]: {"count": sum(counts), "p50_ms": round(STAGE_SECONDS.quantile(0.5, labels) * 1000, 1),
+                        "p95_ms": round(STAGE_SECONDS.quantile(0.95, labels) * 1000, 1)}
+            for labels, (counts, _) in STAGE_SECONDS.snapshot().items()
+        },
+        "engine": bot.CHECK_ENGINE.stats(),
+        "server": dict(server.served, requests=server.requests),
+    }
+    if FETCH_PROCESSES > 0:
+        result["fetch_workers"] = get_fetch_worker_pool().stats()
+    if pipeline is not None:
+        result["pipeline"] = pipeline.stats()
+        loop.run_until_complete(pipeline.stop())
+        loop.close()
+    bot.CHECK_ENGINE.shutdown()
+    return result
+
+def compare(previous_path, runs):
+    """Print cycle time and p95 changes against an earlier results file."""
+    with open(previous_path) as f:
+        previous = {run["items"]: run for run in json.load(f)["runs"]}
+    print("\nitems   cycle_s (prev → now)      fetch p95 ms (prev → now)")
+    for run in runs:
+        old = previous.get(run["items"])
+        if not old:
+            continue
+        print(f"{run['items']:>5}   {old['cycle_seconds']:>8} → {run['cycle_seconds']:<8} "
+              f"{old['fetch']['p95_ms']} → {run['fetch']['p95_ms']}")
+
+# ==============================
+# MAIN
+# ==============================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline check-cycle benchmark against a local Flipkart stand-in.")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="comma-separated tracked item counts")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--adds", type=int, default=20, help="items added through the add path per size")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=25)
+    parser.add_argument("--block-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.0)
+    parser.add_argument("--short-link-ratio", type=float, default=0.0,
+                        help="share of added links given as dl.flipkart.com short links (each costs the 2-5 s resolve delay)")
+    parser.add_argument("--host-delay", type=float, default=0.0, help="politeness gap per host in seconds")
+    parser.add_argument("--browser", action="store_true", help="allow escalation to Chrome on HTTP misses")
+    parser.add_argument("--processes", type=int, default=0, help="fetch worker processes (FETCH_PROCESSES)")
+    parser.add_argument("--pipeline", action="store_true", help="run adds and the cycle through the asyncio check pipeline")
+    parser.add_argument("--fetchers", type=int, default=64, help="concurrent pipeline fetches with --pipeline")
+    parser.add_argument("--fixtures", help="directory of recorded product pages (*.html) to serve instead of synthetic ones")
+    parser.add_argument("--extract-repeat", type=int, default=20,
+                        help="passes over the pages for the embedded-data versus selector timing (0 to skip)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging()
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="flipkart-bench-")
+
+    recorded = None
+    if args.fixtures:
+        recorded = []
+        for name in sorted(os.listdir(args.fixtures)):
+            if name.endswith(".html"):
+                with open(os.path.join(args.fixtures, name), encoding="utf-8") as f:
+                    recorded.append(f.read())
+
+    server = FixtureServer(args.latency_ms, args.jitter_ms, args.block_rate, args.error_rate,
+                           args.not_found_rate, recorded)
+    server.start()
+
+    # Route all fetches through the fixture server and keep state out of the working tree
+    os.environ["HTTP_PROXY"] = os.environ["http_proxy"] = server.proxy_url
+    os.environ.pop("NO_PROXY", None)
+    os.environ.pop("no_proxy", None)
+    os.environ["BROWSER_FALLBACK"] = "1" if args.browser else "0"
+    os.environ["FETCH_PROCESSES"] = str(args.processes)
+    os.environ["RESOLUTION_CACHE_FILE"] = os.path.join(workdir, "url_cache.json")
+    os.environ["SELECTOR_STATS_FILE"] = os.path.join(workdir, "selector_stats.json")
+    os.environ["DB_FILE"] = os.path.join(workdir, "tracked_products.db")
+    os.environ["CHECK_MODE"] = "async" if args.pipeline else "local"
+    # The bot module refuses to load without a token; the outbox is never started, so nothing is sent
+    os.environ.setdefault("TELEGRAM_TOKEN", "benchmark")
+
+    runs = []
+    for size in (int(value) for value in args.sizes.split(",") if value.strip()):
+        logger.info("Benchmarking %s tracked items...", size)
+        run = run_size(size, args, server, workdir)
+        runs.append(run)
+        logger.info("%s items: cycle %ss, fetch p50/p95/p99 %s/%s/%s ms, peak RSS %s MB, browser launches %s",
+                    size, run["cycle_seconds"], run["fetch"]["p50_ms"], run["fetch"]["p95_ms"],
+                    run["fetch"]["p99_ms"], run["peak_rss_mb"], run["browser_launches"])
+    server.stop()
+
+    extract = None
+    if args.extract_repeat > 0:
+        pages = recorded or [render_product(n, 0) for n in range(10)]
+        extract = extract_benchmark(pages, args.extract_repeat)
+        logger.info("Price extraction p50: embedded data %s ms, selectors %s ms",
+                    extract["embedded"]["p50_ms"], extract["selectors"]["p50_ms"])
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "runs": runs,
+        "extract": extract,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("Results written to %s", args.output)
+    if args.compare:
+        compare(args.compare, runs)
+
+if __name__ == "__main__":
+    main()
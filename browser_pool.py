@@ -0,0 +1,322 @@
+import os
+import time
+import atexit
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+from metrics import STAGE_SECONDS, BROWSER_LAUNCHES
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+]
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "50"))
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "700"))
+BROWSER_CHECKOUT_TIMEOUT = float(os.getenv("BROWSER_CHECKOUT_TIMEOUT", "300"))
+
+# Lean fetch: skip images, media, fonts and trackers; only the DOM and its scripts are needed
+LEAN_FETCH = os.getenv("LEAN_FETCH", "1") != "0"
+
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.m3u8", "*.mp3",
+    # Flipkart's image CDN
+    "*rukminim*.flixcart.com*",
+    # Third-party analytics and ads
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*facebook.net*", "*facebook.com*",
+    "*hotjar.com*", "*clarity.ms*", "*branch.io*", "*appsflyer.com*",
+]
+
+LEAN_CHROME_ARGS = [
+    '--blink-settings=imagesEnabled=false',
+    '--disable-extensions',
+    '--disable-gpu',
+    '--mute-audio',
+    '--no-first-run',
+    '--disable-sync',
+    '--disable-default-apps',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication',
+]
+
+# ==============================
+# DRIVER SETUP
+# ==============================
+
+def build_chrome_options(user_agent=None):
+    """Build headless Chrome options shared by every pooled driver."""
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    # Ensure Chromium binary is correctly located in Linux/containers
+    try:
+        options.binary_location = os.environ.get("CHROME_BIN", "/usr/bin/chromium")
+    except Exception:
+        pass
+    options.add_argument('--disable-blink-features=AutomationControlled')
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+    options.add_argument(f'--user-agent={user_agent or random.choice(USER_AGENTS)}')
+    if LEAN_FETCH:
+        # Return control once the DOM is parsed instead of waiting for every subresource
+        options.page_load_strategy = 'eager'
+        for argument in LEAN_CHROME_ARGS:
+            options.add_argument(argument)
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.media_stream": 2,
+            "profile.default_content_setting_values.notifications": 2,
+        })
+    return options
+
+def create_driver(user_agent=None):
+    """Launch a new headless Chrome webdriver."""
+    options = build_chrome_options(user_agent)
+    try:
+        driver = webdriver.Chrome(options=options)
+    except Exception:
+        # Fallback: auto-install driver for host EC2 without Docker
+        logger.debug("Falling back to webdriver-manager for ChromeDriver...")
+        service = ChromeService(ChromeDriverManager().install())
+        driver = webdriver.Chrome(service=service, options=options)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    if LEAN_FETCH:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+        except Exception as e:
+            logger.debug("Could not enable request blocking: %s", e)
+    return driver
+
+PAGE_METRICS_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+let bytes = nav ? (nav.transferSize || 0) : 0;
+for (const r of resources) { bytes += r.transferSize || 0; }
+return {bytes: bytes, resources: resources.length};
+"""
+
+def page_metrics(driver):
+    """Bytes transferred and resource count for the current page, from the Resource Timing API.
+
+    Cross-origin resources without Timing-Allow-Origin report zero bytes, so
+    this is a lower bound.
+    """
+    try:
+        return driver.execute_script(PAGE_METRICS_SCRIPT) or {}
+    except Exception:
+        return {}
+
+def process_tree_rss_mb(root_pid):
+    """Sum resident memory of a process and all its descendants (Linux /proc only)."""
+    if not root_pid or not os.path.isdir("/proc"):
+        return 0.0
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; ppid is the second field after ')'
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+    total_kb = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total_kb += int(f.read().split()[1]) * page_kb
+        except (OSError, IndexError, ValueError):
+            pass
+        stack.extend(children.get(pid, []))
+    return total_kb / 1024
+
+# ==============================
+# DRIVER POOL
+# ==============================
+
+class PooledDriver:
+    """A long-lived webdriver plus the bookkeeping used to decide when to recycle it."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.time()
+
+    def rss_mb(self):
+        try:
+            return process_tree_rss_mb(self.driver.service.process.pid)
+        except Exception:
+            return 0.0
+
+    def is_healthy(self):
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.debug("Error closing driver: %s", e)
+
+class DriverPool:
+    """Bounded pool of warm headless drivers with checkout/checkin and recycling.
+
+    Drivers are launched lazily, so a sweep pays browser startup once per
+    concurrent user of the pool rather than once per product.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES,
+                 max_rss_mb=BROWSER_MAX_RSS_MB, driver_factory=create_driver):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.driver_factory = driver_factory
+
+        self._idle = []
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.launches = 0
+        self.recycles = 0
+
+    def checkout(self, timeout=BROWSER_CHECKOUT_TIMEOUT):
+        """Borrow a healthy driver, launching one if the pool is not yet full."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Driver pool is shut down")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use + len(self._idle) < self.size:
+                    pooled = None
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for a free browser")
+                self._cond.wait(remaining)
+
+        try:
+            if pooled is not None and not pooled.is_healthy():
+                logger.debug("Pooled driver failed health check, replacing it")
+                pooled.quit()
+                with self._cond:
+                    self.recycles += 1
+                pooled = None
+            if pooled is None:
+                logger.info("Launching pooled Chrome webdriver...")
+                with STAGE_SECONDS.time("browser_launch"):
+                    pooled = PooledDriver(self.driver_factory())
+                with self._cond:
+                    self.launches += 1
+                BROWSER_LAUNCHES.inc()
+            return pooled
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, pooled, broken=False):
+        """Return a driver to the pool, recycling it if broken, worn out or bloated."""
+        pooled.pages += 1
+        recycle = broken or self._closed
+        if not recycle and self.max_pages and pooled.pages >= self.max_pages:
+            logger.debug("Recycling driver after %s pages", pooled.pages)
+            recycle = True
+        if not recycle and self.max_rss_mb:
+            rss = pooled.rss_mb()
+            if rss > self.max_rss_mb:
+                logger.debug("Recycling driver using %.0f MB RSS", rss)
+                recycle = True
+
+        if recycle:
+            pooled.quit()
+
+        with self._cond:
+            if recycle:
+                self.recycles += 1
+            self._in_use -= 1
+            if not recycle:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def driver(self, timeout=BROWSER_CHECKOUT_TIMEOUT):
+        """Context manager yielding a raw webdriver; crashes mark it for recycling."""
+        pooled = self.checkout(timeout)
+        broken = False
+        try:
+            yield pooled.driver
+        except Exception:
+            broken = not pooled.is_healthy()
+            raise
+        finally:
+            self.checkin(pooled, broken=broken)
+
+    def shutdown(self):
+        """Quit every idle driver; drivers still in use are quit on checkin."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            pooled.quit()
+        if idle:
+            logger.debug("Driver pool shut down (%s drivers closed)", len(idle))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "launches": self.launches,
+                "recycles": self.recycles,
+            }
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_driver_pool():
+    """Process-wide driver pool, created on first use and closed at exit."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = DriverPool()
+            atexit.register(_default_pool.shutdown)
+        return _default_pool
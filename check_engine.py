@@ -0,0 +1,450 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, Future
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+CHECK_WORKERS = int(os.getenv("CHECK_WORKERS", "4"))
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", str(CHECK_WORKERS)))
+
+# Politeness gap between two requests to the same host, in seconds. Every product
+# lives on flipkart.com, so this is the crawl rate: the same 5-10 s the
+# sequential checker slept between products
+HOST_DELAY_MIN = float(os.getenv("HOST_DELAY_MIN", "5"))
+HOST_DELAY_MAX = float(os.getenv("HOST_DELAY_MAX", "10"))
+
+# A host's circuit opens when this many of its last BREAKER_WINDOW fetches were blocked
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_BLOCK_THRESHOLD = int(os.getenv("BREAKER_BLOCK_THRESHOLD", "3"))
+# Pause before the first probe; doubles each time a probe is blocked again
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "300"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", "3600"))
+
+# Longest an async fetch waits for a host slot before re-checking (slots freed
+# by threads do not wake the event loop)
+ASYNC_SLOT_POLL = 0.5
+# Scheduled async fetches that may hold a politeness slot while waiting for it.
+# The rest wait in line without one, so an interactive fetch, which skips the
+# line, is never queued behind more than this many throttle delays
+THROTTLE_WAITERS = int(os.getenv("THROTTLE_WAITERS", "2"))
+
+# Successful results younger than this can be reused by callers that allow it
+FRESH_RESULT_TTL = float(os.getenv("FRESH_RESULT_TTL", "60"))
+
+# Fetch outcomes, as reported by the engine's classify function
+OUTCOME_OK = "ok"
+OUTCOME_NOT_FOUND = "not_found"
+OUTCOME_BLOCKED = "blocked"
+OUTCOME_ERROR = "error"
+
+# ==============================
+# HOST THROTTLE
+# ==============================
+
+class HostThrottle:
+    """Spaces out request starts per host with a random jitter.
+
+    Each caller reserves the next free slot for its host under the lock and
+    sleeps outside it, so workers hitting different hosts never wait on each
+    other and workers hitting the same host queue up politely.
+    """
+
+    def __init__(self, min_delay=HOST_DELAY_MIN, max_delay=HOST_DELAY_MAX):
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, url):
+        """Claim the host's next start slot; returns how long to wait for it."""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + random.uniform(self.min_delay, self.max_delay)
+        return slot - now
+
+    def wait(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+# ==============================
+# CIRCUIT BREAKER
+# ==============================
+
+class CircuitOpenError(Exception):
+    """Raised instead of fetching while a host's circuit is open."""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} is blocking us; retrying in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+class HostBreaker:
+    """Circuit breaker plus AIMD concurrency limit for one host.
+
+    Closed: up to `limit` fetches run at once. Each success raises the limit
+    by 1/limit (about +1 per round of successes) and each block halves it.
+    A spike of blocks opens the circuit and every fetch fails fast until the
+    cooldown ends. Then one probe is let through (half-open). A good probe
+    closes the circuit at a limit of 1 and concurrency ramps up again; a
+    blocked probe re-opens it with twice the cooldown.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host, max_limit, window=BREAKER_WINDOW, threshold=BREAKER_BLOCK_THRESHOLD,
+                 cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.host = host
+        self.max_limit = max_limit
+        self.threshold = max(1, threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+
+        self.state = self.CLOSED
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self._recent = deque(maxlen=max(1, window))
+        self._cond = threading.Condition()
+
+        self.outcomes = {OUTCOME_OK: 0, OUTCOME_NOT_FOUND: 0, OUTCOME_BLOCKED: 0, OUTCOME_ERROR: 0}
+        self.opens = 0
+
+    def _try_acquire_locked(self):
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now < self.open_until:
+                raise CircuitOpenError(self.host, self.open_until - now)
+            self.state = self.HALF_OPEN
+            logger.info("Probing %s after %.0fs pause", self.host, self.cooldown, extra={"host": self.host})
+        if self.state == self.HALF_OPEN:
+            if self.in_flight:
+                raise CircuitOpenError(self.host, 0.0)
+            self.in_flight += 1
+            return True
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def try_acquire(self):
+        """Take a fetch slot if one is free; raises CircuitOpenError if open."""
+        with self._cond:
+            return self._try_acquire_locked()
+
+    def acquire(self):
+        """Take a fetch slot, waiting while at the limit; raises CircuitOpenError if open."""
+        with self._cond:
+            while not self._try_acquire_locked():
+                self._cond.wait()
+
+    def release(self, outcome):
+        with self._cond:
+            self.in_flight -= 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self._recent.append(outcome)
+
+            if outcome == OUTCOME_BLOCKED:
+                self.limit = max(1.0, self.limit / 2)
+            elif outcome == OUTCOME_OK and self.state == self.CLOSED:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+            if self.state == self.HALF_OPEN:
+                if outcome in (OUTCOME_OK, OUTCOME_NOT_FOUND):
+                    # The host is serving pages again; start over from one at a time
+                    self.state = self.CLOSED
+                    self.cooldown = self.base_cooldown
+                    self.limit = 1.0
+                    self._recent.clear()
+                    logger.info("Circuit for %s closed, ramping concurrency back up", self.host, extra={"host": self.host})
+                else:
+                    if outcome == OUTCOME_BLOCKED:
+                        self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                    self._open()
+            elif self.state == self.CLOSED and self._recent.count(OUTCOME_BLOCKED) >= self.threshold:
+                self._open()
+            self._cond.notify_all()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + self.cooldown * random.uniform(0.9, 1.1)
+        self.opens += 1
+        self._recent.clear()
+        logger.warning("Circuit for %s opened; pausing fetches for %.0fs", self.host, self.cooldown,
+                       extra={"host": self.host})
+
+    def stats(self):
+        with self._cond:
+            return {
+                "state": self.state,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "opens": self.opens,
+                "retry_in": max(0.0, self.open_until - time.monotonic()) if self.state == self.OPEN else 0.0,
+                **self.outcomes,
+            }
+
+# ==============================
+# SINGLE FLIGHT
+# ==============================
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key and remembers recent good results.
+
+    The first caller for a key runs the call; callers arriving while it runs
+    wait for it and get the same result or exception. Results accepted by
+    `keep` are remembered for `ttl` seconds for callers passing a max_age.
+    """
+
+    def __init__(self, ttl=FRESH_RESULT_TTL, keep=None):
+        self.ttl = ttl
+        self.keep = keep or (lambda result: True)
+        self._calls = {}
+        self._fresh = {}
+        self._lock = threading.Lock()
+        self._stores = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.fresh_hits = 0
+
+    def remember(self, key, result):
+        with self._lock:
+            self._fresh[key] = (time.monotonic(), result)
+            self._stores += 1
+            if self._stores % 256 == 0:
+                cutoff = time.monotonic() - self.ttl
+                self._fresh = {k: entry for k, entry in self._fresh.items() if entry[0] >= cutoff}
+
+    def _fresh_locked(self, key, max_age):
+        if max_age > 0:
+            entry = self._fresh.get(key)
+            if entry and time.monotonic() - entry[0] <= min(max_age, self.ttl):
+                self.fresh_hits += 1
+                return entry
+        return None
+
+    def fresh(self, key, max_age):
+        """A remembered result up to max_age seconds old, or None."""
+        with self._lock:
+            entry = self._fresh_locked(key, max_age)
+        return entry[1] if entry else None
+
+    def count(self, coalesced):
+        """Tally a call made outside do(), e.g. by an async caller."""
+        with self._lock:
+            if coalesced:
+                self.coalesced += 1
+            else:
+                self.calls += 1
+
+    def do(self, key, fn, max_age=0):
+        """Run fn() once per key at a time; serve a remembered result up to max_age seconds old."""
+        with self._lock:
+            entry = self._fresh_locked(key, max_age)
+            if entry:
+                return entry[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+            call.set_exception(e)
+            raise
+        if self.keep(result):
+            self.remember(key, result)
+        with self._lock:
+            del self._calls[key]
+        call.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced,
+                    "fresh_hits": self.fresh_hits, "in_flight": len(self._calls)}
+
+# ==============================
+# CHECK ENGINE
+# ==============================
+
+class CheckEngine:
+    """Runs checks on a thread pool with a global cap on in-flight fetches.
+
+    Every fetch also goes through its host's breaker; `classify` maps a
+    fetch result to one of the OUTCOME_* values that drive it.
+    """
+
+    def __init__(self, workers=CHECK_WORKERS, max_in_flight=MAX_IN_FLIGHT, throttle=None, classify=None,
+                 throttle_waiters=THROTTLE_WAITERS):
+        self.workers = max(1, workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.throttle_waiters = max(1, throttle_waiters)
+        self.throttle = throttle or HostThrottle()
+        self.classify = classify or (lambda result: OUTCOME_OK)
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.flights = SingleFlight(keep=lambda result: self.classify(result) == OUTCOME_OK)
+        # Async fetches in progress per key; per event loop, the event that wakes waiters
+        # for a host slot and the semaphore in front of the throttle
+        self._async_calls = {}
+        self._slot_freed = {}
+        self._throttle_gates = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="price-check")
+
+    def breaker(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._breakers_lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = HostBreaker(host, self.max_in_flight)
+            return breaker
+
+    def fetch(self, url, fetch_fn, key=None, max_age=0):
+        """Run one fetch under the host breaker, the in-flight cap and the per-host throttle.
+
+        With a `key` (the canonical product key), concurrent fetches of the
+        same product share one fetch, and a good result up to `max_age`
+        seconds old is returned without fetching at all. Raises
+        CircuitOpenError without fetching while the host is blocking us.
+        """
+        if key is not None:
+            return self.flights.do(key, lambda: self._fetch(url, fetch_fn), max_age)
+        return self._fetch(url, fetch_fn)
+
+    def remember(self, key, result):
+        """Offer a result fetched elsewhere (e.g. by a fetch node) to later fetches of key."""
+        if self.classify(result) == OUTCOME_OK:
+            self.flights.remember(key, result)
+
+    def _fetch(self, url, fetch_fn):
+        breaker = self.breaker(url)
+        breaker.acquire()
+        outcome = OUTCOME_ERROR
+        try:
+            with self._in_flight:
+                self.throttle.wait(url)
+                result = fetch_fn(url)
+            outcome = self.classify(result)
+            return result
+        finally:
+            breaker.release(outcome)
+
+    async def fetch_async(self, url, fetch_fn, key=None, max_age=0, priority=False):
+        """Coroutine twin of fetch(): awaits fetch_fn(url) and never blocks the event loop.
+
+        Shares the breakers, throttle and fresh-result cache with fetch().
+        Only `throttle_waiters` scheduled fetches hold a politeness slot at a
+        time; a `priority` fetch (a user waiting on a reply) takes the next
+        slot without queueing behind the others. Coalescing is per event
+        loop: concurrent fetch_async() calls for a key share one task.
+        Cancelling one caller does not cancel the fetch the others are
+        waiting on.
+        """
+        if key is None:
+            return await self._fetch_async(url, fetch_fn, priority)
+        result = self.flights.fresh(key, max_age)
+        if result is not None:
+            return result
+        task = self._async_calls.get(key)
+        self.flights.count(coalesced=task is not None)
+        if task is None:
+            task = self._async_calls[key] = asyncio.ensure_future(self._fetch_async(url, fetch_fn, priority))
+            task.add_done_callback(lambda done: self._async_fetch_done(key, done))
+        return await asyncio.shield(task)
+
+    def _async_fetch_done(self, key, task):
+        self._async_calls.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.remember(key, task.result())
+
+    async def _fetch_async(self, url, fetch_fn, priority=False):
+        breaker = self.breaker(url)
+        loop = asyncio.get_running_loop()
+        gate = None
+        if not priority:
+            gate = self._throttle_gates.get(loop)
+            if gate is None:
+                gate = self._throttle_gates[loop] = asyncio.Semaphore(self.throttle_waiters)
+            await gate.acquire()
+        try:
+            while not breaker.try_acquire():
+                freed = self._slot_freed.get(loop)
+                if freed is None:
+                    freed = self._slot_freed[loop] = asyncio.Event()
+                try:
+                    await asyncio.wait_for(freed.wait(), ASYNC_SLOT_POLL)
+                except asyncio.TimeoutError:
+                    pass
+            outcome = OUTCOME_ERROR
+            try:
+                delay = self.throttle.reserve(url)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # The request is starting; the next scheduled fetch may take a slot
+                if gate is not None:
+                    gate.release()
+                    gate = None
+                result = await fetch_fn(url)
+                outcome = self.classify(result)
+                return result
+            finally:
+                breaker.release(outcome)
+                freed = self._slot_freed.pop(loop, None)
+                if freed is not None:
+                    freed.set()
+        finally:
+            if gate is not None:
+                gate.release()
+
+    def submit(self, fn, *args):
+        """Schedule a single call on the worker pool and return its future."""
+        return self._executor.submit(fn, *args)
+
+    def map(self, fn, items):
+        """Apply fn to every item concurrently and return results in input order.
+
+        An exception raised by fn for one item is returned in that item's slot
+        instead of aborting the whole batch.
+        """
+        futures = [self._executor.submit(fn, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self):
+        with self._breakers_lock:
+            breakers = list(self._breakers.values())
+        return {"hosts": {breaker.host: breaker.stats() for breaker in breakers},
+                "single_flight": self.flights.stats()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
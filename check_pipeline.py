@@ -0,0 +1,289 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from check_engine import CircuitOpenError
+from product_fetcher import (ProductSnapshot, HTTP_FIRST, HTTP_TIMEOUT, snapshot_from_response,
+                             wants_browser, record_tier, record_fetch, classify_snapshot)
+from fetch_workers import FETCH_PROCESSES, fetch_isolated
+from flipkart_urls import fetchable_url_async
+from http_client import get_random_headers
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Concurrent fetch coroutines; each costs a few KB, not a thread
+PIPELINE_FETCHERS = int(os.getenv("PIPELINE_FETCHERS", "64"))
+PIPELINE_RESOLVERS = int(os.getenv("PIPELINE_RESOLVERS", "8"))
+# Threads for HTML parsing (CPU-bound) and for waiting on browser fetches
+PIPELINE_PARSERS = int(os.getenv("PIPELINE_PARSERS", "2"))
+PIPELINE_BROWSERS = int(os.getenv("PIPELINE_BROWSERS", str(max(1, FETCH_PROCESSES))))
+# Jobs waiting between two stages; a full queue stops the stage before it
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+# Longest the feeder sleeps before asking the scheduler again
+PIPELINE_POLL = 1.0
+
+STAGES = ("resolve", "fetch", "evaluate")
+
+# ==============================
+# CHECK PIPELINE
+# ==============================
+
+@dataclass
+class CheckJob:
+    """One scheduled check on its way through the stages."""
+    product_key: str
+    items: list = field(default_factory=list)
+    url: str = None
+    snapshot: ProductSnapshot = None
+    done: bool = False
+
+class CheckPipeline:
+    """Scheduled checks as asyncio stages joined by bounded queues.
+
+    The feeder takes due products from the scheduler; resolve looks up the
+    subscribers and the URL to load; fetch runs the tiered fetch through the
+    engine's async path (HTTP with httpx, parsing in a small thread pool,
+    browser escalation in a fetch worker); evaluate records the result and
+    queues alerts on the outbox from one storage thread. A full queue makes
+    the stage in front of it wait, so the feeder stops taking due products
+    when evaluation falls behind.
+
+    `subscribers(key)` returns the items of a product and `apply(items,
+    snapshot)` records and evaluates a result; it runs off the loop.
+    `on_done(key, price)` is called on the loop after every check.
+    Everything runs on the loop that calls start(); stop() cancels the
+    stages and hands unfinished checks back to the scheduler unchanged.
+    """
+
+    def __init__(self, engine, subscribers, apply, scheduler=None, on_done=None,
+                 fetchers=PIPELINE_FETCHERS, resolvers=PIPELINE_RESOLVERS, parsers=PIPELINE_PARSERS,
+                 browsers=PIPELINE_BROWSERS, queue_size=PIPELINE_QUEUE_SIZE):
+        self.engine = engine
+        self.subscribers = subscribers
+        self.apply = apply
+        self.scheduler = scheduler
+        self.on_done = on_done
+        self.fetchers = max(1, fetchers)
+        self.resolvers = max(1, resolvers)
+        self.parsers = max(1, parsers)
+        self.browsers = max(1, browsers)
+        self.queue_size = queue_size
+        self._queues = {}
+        self._tasks = []
+        self._client = None
+        self._parse_executor = None
+        self._browser_executor = None
+        self._storage_executor = None
+        self.fetching = 0
+        self.checked = 0
+        self.failed = 0
+
+    def start(self):
+        """Create the client, executors, queues and stage tasks on the running loop."""
+        limits = httpx.Limits(max_connections=self.fetchers, max_keepalive_connections=self.fetchers)
+        self._client = httpx.AsyncClient(limits=limits, timeout=HTTP_TIMEOUT, follow_redirects=True)
+        self._parse_executor = ThreadPoolExecutor(self.parsers, thread_name_prefix="pipeline-parse")
+        self._browser_executor = ThreadPoolExecutor(self.browsers, thread_name_prefix="pipeline-browser")
+        # SQLite writes and alert queuing stay on one thread, in order
+        self._storage_executor = ThreadPoolExecutor(1, thread_name_prefix="pipeline-storage")
+        self._queues = {stage: asyncio.Queue(self.queue_size) for stage in STAGES}
+
+        workers = [("resolve", self._resolve, self.resolvers), ("fetch", self._fetch, self.fetchers),
+                   ("evaluate", self._evaluate, 1)]
+        for stage, handle, count in workers:
+            for index in range(count):
+                self._tasks.append(asyncio.create_task(self._stage(stage, handle), name=f"pipeline-{stage}-{index}"))
+        if self.scheduler is not None:
+            self._tasks.append(asyncio.create_task(self._feed(), name="pipeline-feeder"))
+        logger.info("Check pipeline started: %s fetchers, %s resolvers, queues of %s",
+                    self.fetchers, self.resolvers, self.queue_size)
+
+    async def stop(self):
+        """Cancel every stage, return queued checks to the scheduler and release the client and threads."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for inbox in self._queues.values():
+            while not inbox.empty():
+                self._requeue(inbox.get_nowait())
+        if self._client is not None:
+            await self._client.aclose()
+        for executor in (self._parse_executor, self._browser_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        if self._storage_executor is not None:
+            # Let the schedule writes already handed to it finish
+            await asyncio.to_thread(self._storage_executor.shutdown)
+        logger.info("Check pipeline stopped")
+
+    # ------------------------------
+    # Stages
+    # ------------------------------
+
+    async def _feed(self):
+        while True:
+            try:
+                key, wait = self.scheduler.poll_due()
+            except Exception:
+                logger.exception("Error polling the scheduler")
+                key, wait = None, PIPELINE_POLL
+            if key is None:
+                await asyncio.sleep(min(wait, PIPELINE_POLL) if wait is not None else PIPELINE_POLL)
+                continue
+            job = CheckJob(key)
+            try:
+                # Blocks while the resolve queue is full: backpressure reaches the scheduler here
+                await self._queues["resolve"].put(job)
+            except asyncio.CancelledError:
+                self._requeue(job)
+                raise
+
+    async def _stage(self, stage, handle):
+        inbox = self._queues[stage]
+        while True:
+            job = await inbox.get()
+            try:
+                await handle(job)
+            except asyncio.CancelledError:
+                self._requeue(job)
+                raise
+            except Exception:
+                logger.exception("Error in %s stage", stage, extra={"product_key": job.product_key})
+                self._finish(job, None)
+            finally:
+                inbox.task_done()
+
+    async def _resolve(self, job):
+        job.items = self.subscribers(job.product_key)
+        if not job.items:
+            self._finish(job, None)
+            return
+        job.url = await self.resolve(job.items[0]["product_link"])
+        await self._queues["fetch"].put(job)
+
+    async def _fetch(self, job):
+        title = job.items[0].get("title", "Unknown Product")
+        started = time.perf_counter()
+        self.fetching += 1
+        try:
+            job.snapshot = await self.fetch(job.url, job.product_key)
+        except CircuitOpenError as e:
+            logger.debug("Skipping %s: %s", title, e, extra={"product_key": job.product_key})
+            self._finish(job, None)
+            return
+        finally:
+            self.fetching -= 1
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, "check")
+        logger.info("Checked %s: %s", title, job.snapshot.price, extra={
+            "product_key": job.product_key, "tier": job.snapshot.source,
+            "outcome": classify_snapshot(job.snapshot), "duration_ms": round(elapsed * 1000, 1),
+        })
+        await self._queues["evaluate"].put(job)
+
+    async def _evaluate(self, job):
+        snapshot = await self.run_storage(self.apply, job.items, job.snapshot)
+        self._finish(job, snapshot.price if snapshot else None)
+
+    def _finish(self, job, price):
+        if job.done:
+            return
+        job.done = True
+        if price is None:
+            self.failed += 1
+        else:
+            self.checked += 1
+        if self.scheduler is not None:
+            # complete() writes the schedule to SQLite, so it runs on the storage thread
+            self._storage_executor.submit(self._complete, job.product_key, price)
+        if self.on_done is not None:
+            try:
+                self.on_done(job.product_key, price)
+            except Exception:
+                logger.exception("Error in check callback")
+
+    def _requeue(self, job):
+        """Give a check cut short by stop() back to the scheduler without counting it as failed."""
+        if job.done:
+            return
+        job.done = True
+        if self.scheduler is not None:
+            self.scheduler.requeue(job.product_key)
+
+    def _complete(self, product_key, price):
+        try:
+            self.scheduler.complete(product_key, price)
+        except Exception:
+            logger.exception("Error rescheduling check", extra={"product_key": product_key})
+
+    async def submit(self, product_key):
+        """Queue one check outside the schedule; waits while the resolve queue is full."""
+        await self._queues["resolve"].put(CheckJob(product_key))
+
+    async def join(self):
+        """Wait until every queued check has been through all stages."""
+        for stage in STAGES:
+            await self._queues[stage].join()
+
+    # ------------------------------
+    # Fetching
+    # ------------------------------
+
+    async def resolve(self, link):
+        """URL to load for a link, following short links without blocking the loop."""
+        return await fetchable_url_async(link, self._client)
+
+    async def fetch(self, url, key=None, max_age=0, priority=False):
+        """Tiered fetch of one URL through the engine's breakers, throttle and single-flight.
+
+        `priority` fetches (a user's /add) skip ahead of scheduled checks waiting on the throttle.
+        """
+        return await self.engine.fetch_async(url, self._fetch_tiered, key=key, max_age=max_age, priority=priority)
+
+    async def _fetch_tiered(self, url):
+        started = time.perf_counter()
+        if HTTP_FIRST:
+            snapshot = await self._fetch_http(url)
+            record_tier("http", snapshot.price is not None)
+            if not wants_browser(snapshot):
+                record_fetch(snapshot, started)
+                return snapshot
+            logger.debug("HTTP tier missed, escalating to browser")
+        # Selenium has no async API; the browser runs in a fetch worker and the loop only awaits it
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._browser_executor, fetch_isolated, url, False)
+
+    async def _fetch_http(self, url):
+        logger.debug("Fetching product snapshot over async HTTP for: %s", url)
+        try:
+            with STAGE_SECONDS.time("http_get"):
+                response = await self._client.get(url, headers=get_random_headers())
+        except httpx.HTTPError as e:
+            logger.debug("HTTP fetch failed: %s: %s", type(e).__name__, e)
+            return ProductSnapshot(url=url, source="http")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._parse_executor, snapshot_from_response,
+                                          url, response.status_code, response.text, str(response.url))
+
+    async def run_storage(self, fn, *args):
+        """Run a blocking storage call on the pipeline's storage thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._storage_executor, fn, *args)
+
+    def stats(self):
+        return {
+            "queued": {stage: inbox.qsize() for stage, inbox in self._queues.items()},
+            "fetching": self.fetching,
+            "checked": self.checked,
+            "failed": self.failed,
+        }
@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+from storage import Storage
+from check_engine import CheckEngine, CircuitOpenError, CHECK_WORKERS
+from product_fetcher import classify_snapshot
+from fetch_workers import fetch_isolated
+from flipkart_urls import RESOLUTION_CACHE, fetchable_url
+from selector_stats import SELECTOR_STATS
+from job_queue import JobQueue, LeaseKeeper, node_id, JOB_POLL_INTERVAL
+from logging_setup import setup_logging
+from metrics import start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Jobs one node works on at once
+NODE_CONCURRENCY = int(os.getenv("NODE_CONCURRENCY", str(CHECK_WORKERS)))
+
+# ==============================
+# FETCH NODE
+# ==============================
+
+def process_job(engine, queue, keeper, job):
+    """Fetch one leased job and report the snapshot (or the error) back to the queue."""
+    keeper.hold(job)
+    result = {"snapshot": None, "error": None}
+    try:
+        snapshot = engine.fetch(fetchable_url(job["url"]), fetch_isolated)
+        result["snapshot"] = snapshot.to_dict()
+    except CircuitOpenError as e:
+        result["error"] = str(e)
+    except Exception as e:
+        logger.exception("Job %s failed", job["id"], extra={"job_id": job["id"], "product_key": job["product_key"]})
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        keeper.release(job)
+    if not queue.complete(job, result):
+        logger.debug("Result for job %s not accepted (lease lost or already reported)", job["id"])
+
+def run_node(queue, concurrency=NODE_CONCURRENCY, owner=None):
+    """Lease and fetch jobs forever, keeping at most `concurrency` in progress."""
+    owner = owner or node_id()
+    engine = CheckEngine(workers=concurrency, classify=classify_snapshot)
+    keeper = LeaseKeeper(queue)
+    keeper.start()
+    slots = threading.BoundedSemaphore(concurrency)
+    logger.info("Fetch node %s started with %s slots", owner, concurrency)
+
+    def on_done(future):
+        slots.release()
+        if future.exception():
+            logger.error("Could not report job result: %s", future.exception())
+
+    while True:
+        slots.acquire()
+        try:
+            jobs = queue.lease(owner)
+        except Exception as e:
+            logger.error("Could not lease jobs: %s", e)
+            jobs = []
+        if not jobs:
+            slots.release()
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        job = jobs[0]
+        logger.debug("Leased job %s (%s, attempt %s)", job["id"], job["product_key"], job["attempts"])
+        engine.submit(process_job, engine, queue, keeper, job).add_done_callback(on_done)
+
+# ==============================
+# MAIN
+# ==============================
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    # Several nodes on one host need distinct METRICS_PORT values
+    start_metrics_server()
+    storage = Storage()
+    storage.init()
+    RESOLUTION_CACHE.load()
+    SELECTOR_STATS.load()
+    run_node(JobQueue(storage))
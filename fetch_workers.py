@@ -0,0 +1,261 @@
+import os
+import signal
+import atexit
+import logging
+import threading
+import multiprocessing
+
+from browser_pool import process_tree_rss_mb
+from product_fetcher import (ProductSnapshot, fetch_product_snapshot, merge_fetch_stats,
+                             FETCH_DEADLINE, HTTP_FIRST, HTTP_TIER_BUDGET)
+from logging_setup import setup_logging
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Worker processes that own the browsers; 0 fetches in the calling thread instead
+FETCH_PROCESSES = int(os.getenv("FETCH_PROCESSES", "2"))
+FETCH_WORKER_MAX_RSS_MB = int(os.getenv("FETCH_WORKER_MAX_RSS_MB", "1024"))
+FETCH_WORKER_MAX_JOBS = int(os.getenv("FETCH_WORKER_MAX_JOBS", "500"))
+# Starting Chrome in a fresh or recycled worker, on top of FETCH_DEADLINE for the page
+BROWSER_LAUNCH_ALLOWANCE = 30
+# A worker that has not answered by then is assumed wedged and killed. Unset, each
+# job gets the worst case of the tiers it runs: HTTP_TIER_BUDGET if it tries HTTP
+# first, then a browser launch and FETCH_DEADLINE
+FETCH_JOB_TIMEOUT = float(os.getenv("FETCH_JOB_TIMEOUT", "0")) or None
+
+# ==============================
+# WORKER PROCESS
+# ==============================
+
+def _worker_main(conn):
+    """Fetch (url, http_first) jobs received on the pipe until told to stop or the parent goes away."""
+    # Own process group, so killing the worker also takes down its Chrome
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    # Spawned workers start with no handlers; LOG_* settings come from the inherited env
+    setup_logging()
+    from browser_pool import get_driver_pool
+    from product_fetcher import drain_fetch_stats
+    from selector_stats import SELECTOR_STATS
+
+    # Selector results go back to the parent, the only process that writes the stats file
+    SELECTOR_STATS.forward()
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        url, http_first = job
+        reply = {"snapshot": None, "error": None}
+        try:
+            reply["snapshot"] = fetch_product_snapshot(url, http_first).to_dict()
+        except Exception as e:
+            reply["error"] = f"{type(e).__name__}: {e}"
+        reply["rss_mb"] = process_tree_rss_mb(os.getpid())
+        # Counts and timings recorded here since the last job, merged into the parent's
+        reply["stats"] = drain_fetch_stats()
+        reply["metrics"] = METRICS.drain()
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            break
+    get_driver_pool().shutdown()
+
+# ==============================
+# WORKER POOL
+# ==============================
+
+class FetchWorker:
+    """Parent-side handle for one worker process and its private pipe."""
+
+    def __init__(self, context, index):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,),
+                                       name=f"fetch-worker-{index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.rss_mb = 0.0
+
+    def kill(self):
+        pid = self.process.pid
+        try:
+            # Only signal the group once the worker has actually become its leader
+            if hasattr(os, "killpg") and os.getpgid(pid) == pid:
+                os.killpg(pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except OSError:
+            pass
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self, timeout=10):
+        """Ask the worker to close its browsers and exit; kill it if it does not."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+class FetchWorkerPool:
+    """Bounded set of fetch worker processes, each with its own browser pool.
+
+    fetch() is thread-safe and blocking: it hands one URL to an idle worker
+    and gets back a compact snapshot dict. Workers start lazily. A worker is
+    retired gracefully after FETCH_WORKER_MAX_JOBS jobs or once its process
+    tree passes FETCH_WORKER_MAX_RSS_MB. It is killed outright if it crashes
+    or does not answer within the job timeout. A replacement starts on the
+    next fetch.
+    """
+
+    def __init__(self, processes=FETCH_PROCESSES, max_rss_mb=FETCH_WORKER_MAX_RSS_MB,
+                 max_jobs=FETCH_WORKER_MAX_JOBS, job_timeout=FETCH_JOB_TIMEOUT):
+        self.processes = max(1, processes)
+        self.max_rss_mb = max_rss_mb
+        self.max_jobs = max_jobs
+        self.job_timeout = job_timeout
+        # Never fork a process that already runs threads and browsers
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._busy = set()
+        self._started = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.jobs = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.restarts = 0
+
+    def _checkout(self):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Fetch worker pool is shut down")
+                if self._idle:
+                    worker = self._idle.pop()
+                    break
+                if len(self._busy) < self.processes:
+                    self._started += 1
+                    worker = FetchWorker(self._context, self._started)
+                    logger.debug("Started fetch worker %s (pid %s)", worker.process.name, worker.process.pid)
+                    break
+                self._cond.wait()
+            self._busy.add(worker)
+            return worker
+
+    def _checkin(self, worker, retire=None):
+        """Return a worker to the pool; retire is None, 'stop' or 'kill'."""
+        if retire == "kill":
+            worker.kill()
+        elif retire == "stop" or self._closed:
+            worker.stop()
+        with self._cond:
+            self._busy.discard(worker)
+            if retire:
+                self.restarts += 1
+            elif not self._closed:
+                self._idle.append(worker)
+            self._cond.notify()
+
+    def timeout_for(self, http_first):
+        """Seconds to wait for a worker's answer before killing it."""
+        if self.job_timeout:
+            return self.job_timeout
+        return (HTTP_TIER_BUDGET if http_first else 0) + BROWSER_LAUNCH_ALLOWANCE + FETCH_DEADLINE
+
+    def fetch(self, url, http_first=HTTP_FIRST):
+        """Fetch one product page in a worker process and return its ProductSnapshot."""
+        timeout = self.timeout_for(http_first)
+        worker = self._checkout()
+        try:
+            worker.conn.send((url, http_first))
+            answered = worker.conn.poll(timeout)
+            reply = worker.conn.recv() if answered else None
+        except (EOFError, OSError) as e:
+            logger.warning("Fetch worker %s died while fetching %s", worker.process.name, url,
+                           extra={"worker": worker.process.name})
+            with self._cond:
+                self.crashes += 1
+            self._checkin(worker, "kill")
+            raise RuntimeError(f"Fetch worker {worker.process.name} died: {type(e).__name__}") from e
+        if reply is None:
+            logger.warning("Killing wedged fetch worker %s while fetching %s", worker.process.name, url,
+                           extra={"worker": worker.process.name})
+            with self._cond:
+                self.timeouts += 1
+            self._checkin(worker, "kill")
+            raise TimeoutError(f"Fetch worker gave no answer in {timeout:.0f}s")
+
+        worker.jobs += 1
+        worker.rss_mb = reply.get("rss_mb", 0.0)
+        merge_fetch_stats(reply.get("stats", {}))
+        METRICS.merge(reply.get("metrics", {}))
+        retire = None
+        if self.max_rss_mb and worker.rss_mb > self.max_rss_mb:
+            logger.debug("Restarting fetch worker %s at %.0f MB RSS", worker.process.name, worker.rss_mb)
+            retire = "stop"
+        elif self.max_jobs and worker.jobs >= self.max_jobs:
+            logger.debug("Restarting fetch worker %s after %s jobs", worker.process.name, worker.jobs)
+            retire = "stop"
+        with self._cond:
+            self.jobs += 1
+        self._checkin(worker, retire)
+
+        if reply["error"]:
+            raise RuntimeError(f"Fetch failed in worker: {reply['error']}")
+        return ProductSnapshot(**reply["snapshot"])
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for worker in idle:
+            worker.stop()
+        if idle:
+            logger.debug("Fetch workers shut down (%s stopped)", len(idle))
+
+    def stats(self):
+        with self._cond:
+            workers = self._idle + list(self._busy)
+            return {
+                "processes": self.processes,
+                "alive": sum(1 for worker in workers if worker.process.is_alive()),
+                "jobs": self.jobs,
+                "timeouts": self.timeouts,
+                "crashes": self.crashes,
+                "restarts": self.restarts,
+                "rss_mb": {worker.process.name: round(worker.rss_mb) for worker in workers},
+            }
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_fetch_worker_pool():
+    """Process-wide fetch worker pool, created on first use and stopped at exit."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = FetchWorkerPool()
+            atexit.register(_default_pool.shutdown)
+        return _default_pool
+
+def fetch_isolated(url, http_first=HTTP_FIRST):
+    """Fetch a product in a worker process, or in this thread when FETCH_PROCESSES is 0."""
+    if FETCH_PROCESSES <= 0:
+        return fetch_product_snapshot(url, http_first)
+    return get_fetch_worker_pool().fetch(url, http_first)
@@ -1,23 +1,30 @@
-import requests
-import json
 import os
 import asyncio
 import time
+import logging
 import threading
-import re
-import random
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
+from browser_pool import get_driver_pool
+from product_fetcher import ProductSnapshot, tier_stats, classify_snapshot
+from fetch_workers import FETCH_PROCESSES, fetch_isolated, get_fetch_worker_pool
+from check_engine import CheckEngine, CircuitOpenError, FRESH_RESULT_TTL, MAX_IN_FLIGHT
+from check_pipeline import CheckPipeline, PIPELINE_FETCHERS
+from flipkart_urls import RESOLUTION_CACHE, fetchable_url, resolve_product_key, resolved_product_key, product_key
+from selector_stats import SELECTOR_STATS
+from storage import Storage
+from price_history import PriceHistory, HISTORY_RAW_DAYS
+from registry import ProductRegistry
+from scheduler import CheckScheduler, CHECK_INTERVAL
+from outbox import Outbox
+from job_queue import JobQueue, JOB_POLL_INTERVAL
+from logging_setup import setup_logging, dropped_records
+from metrics import METRICS, STAGE_SECONDS, CYCLE_SECONDS, start_metrics_server, summary_text
+from profiling import PROFILER, PROFILE_CHECKS
+
+logger = logging.getLogger("flipkart_price_alert")
 
 # ==============================
 # CONFIG
@@ -29,286 +36,141 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 if not TELEGRAM_TOKEN:
     raise SystemExit("ERROR: Telegram token not found in environment variable TELEGRAM_TOKEN")
 
+# Legacy JSON store, imported once into the SQLite database
 DATA_FILE = "tracked_products.json"
-DATA_LOCK = threading.RLock()
 
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-]
+STORAGE = Storage()
+PRICE_HISTORY = PriceHistory(STORAGE)
+REGISTRY = ProductRegistry(STORAGE)
+OUTBOX = Outbox(TELEGRAM_TOKEN, STORAGE)
 
-# ==============================
-# DATA MANAGEMENT
-# ==============================
+# "async" runs checks as an asyncio pipeline on the bot's event loop; "local" runs
+# them on worker threads; "distributed" queues jobs for fetch_node.py workers
+CHECK_MODE = os.getenv("CHECK_MODE", "async")
 
-def ensure_data_file_exists():
-    """Ensure the JSON data file exists."""
-    print(f"[DEBUG] Checking if data file exists: {DATA_FILE}")
-    if not os.path.exists(DATA_FILE):
-        print(f"[DEBUG] Creating new data file: {DATA_FILE}")
-        try:
-            with open(DATA_FILE, "w") as f:
-                json.dump([], f)
-            print(f"[DEBUG] Data file created successfully")
-        except Exception as e:
-            print(f"[ERROR] Failed to create data file: {e}")
-            raise
-    else:
-        print(f"[DEBUG] Data file already exists")
+# In async mode fetches are coroutines, so the per-host limit can go well past the thread count
+CHECK_ENGINE = CheckEngine(classify=classify_snapshot,
+                           max_in_flight=PIPELINE_FETCHERS if CHECK_MODE == "async" else MAX_IN_FLIGHT)
+SCHEDULER = CheckScheduler(storage=STORAGE)
+JOB_QUEUE = JobQueue(STORAGE)
+# Jobs handed to fetch nodes but not yet reported back
+DISTRIBUTED_MAX_OUTSTANDING = int(os.getenv("DISTRIBUTED_MAX_OUTSTANDING", "200"))
 
-def load_data():
-    """Load tracked products from JSON file."""
-    print(f"[DEBUG] Loading data from {DATA_FILE}")
-    ensure_data_file_exists()
-    
-    try:
-        with DATA_LOCK:
-            with open(DATA_FILE, "r") as f:
-                data = json.load(f)
-                print(f"[DEBUG] Loaded {len(data)} products from file")
-                return data
-    except json.JSONDecodeError as e:
-        print(f"[ERROR] Invalid JSON in data file: {e}")
-        print(f"[DEBUG] Creating fresh data file")
-        with open(DATA_FILE, "w") as f:
-            json.dump([], f)
-        return []
-    except Exception as e:
-        print(f"[ERROR] Failed to load data: {e}")
-        return []
+# How often the scheduler picks up added/removed products, and how often
+# history compaction runs, in seconds
+SCHEDULER_SYNC_INTERVAL = 60
+MAINTENANCE_INTERVAL = 3600
 
-def save_data(data):
-    """Save tracked products to JSON file."""
-    print(f"[DEBUG] Saving {len(data)} products to {DATA_FILE}")
-    try:
-        with DATA_LOCK:
-            with open(DATA_FILE, "w") as f:
-                json.dump(data, f, indent=2)
-        print(f"[DEBUG] Data saved successfully")
-    except Exception as e:
-        print(f"[ERROR] Failed to save data: {e}")
+# Chats allowed to use admin commands such as /stats and /profile (comma-separated ids)
+ADMIN_CHAT_IDS = {int(chat_id) for chat_id in os.getenv("ADMIN_CHAT_IDS", "").split(",") if chat_id.strip()}
+# Reply when a short link cannot be followed; the product is not added under the short link
+UNRESOLVED_LINK_REPLY = "Could not open this short link right now. Please try again in a few minutes or send the full product URL."
+
+# Checks covered by a bare /profile
+PROFILE_DEFAULT_CHECKS = 100
 
 # ==============================
-# PRICE FETCHING
+# DATA MANAGEMENT
 # ==============================
 
-def fetch_price_selenium(product_link):
-    """Fetch price using Selenium with comprehensive error handling."""
-    print(f"[DEBUG] Starting price fetch for: {product_link}")
-    
-    driver = None
+def ensure_data_file_exists():
+    """Ensure the database exists and the legacy JSON file has been migrated into it."""
+    logger.debug("Opening database: %s", STORAGE.path)
     try:
-        print("[DEBUG] Setting up Chrome options...")
-        options = Options()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        # Ensure Chromium binary is correctly located in Linux/containers
-        try:
-            options.binary_location = os.environ.get("CHROME_BIN", "/usr/bin/chromium")
-        except Exception:
-            pass
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        
-        selected_user_agent = random.choice(USER_AGENTS)
-        options.add_argument(f'--user-agent={selected_user_agent}')
-        print(f"[DEBUG] Using user agent: {selected_user_agent}")
-        
-        print("[DEBUG] Initializing Chrome webdriver...")
-        try:
-            driver = webdriver.Chrome(options=options)
-        except Exception:
-            # Fallback: auto-install driver for host EC2 without Docker
-            print("[DEBUG] Falling back to webdriver-manager for ChromeDriver...")
-            service = ChromeService(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
-        print(f"[DEBUG] Navigating to: {product_link}")
-        driver.get(product_link)
-        
-        # Wait for page to load
-        time.sleep(3)
-        print("[DEBUG] Page loaded, searching for price...")
-        
-        # Try multiple price selectors
-        price_selectors = [
-            ".Nx9bqj.CxhGGd",
-        ]
-        
-        price = None
-        for i, selector in enumerate(price_selectors, 1):
-            print(f"[DEBUG] Trying selector {i}/{len(price_selectors)}: {selector}")
-            
-            try:
-                price_element = WebDriverWait(driver, 5).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                )
-                
-                price_text = price_element.text.strip()
-                print(f"[DEBUG] Found text: '{price_text}'")
-                
-                if price_text:
-                    # Extract price from text
-                    price_match = re.search(r'₹?[\s]*([0-9,]+)', price_text)
-                    if price_match:
-                        price_str = price_match.group(1).replace(',', '')
-                        price = int(price_str)
-                        print(f"[SUCCESS] Extracted price: ₹{price:,}")
-                        break
-                        
-            except TimeoutException:
-                print(f"[DEBUG] Selector timeout: {selector}")
-                continue
-            except Exception as e:
-                print(f"[DEBUG] Error with selector {selector}: {e}")
-                continue
-        
-        if price is None:
-            print("[WARNING] Could not find price with any selector")
-            try:
-                page_title = driver.title
-                print(f"[DEBUG] Page title: {page_title}")
-                
-                if any(keyword in page_title.lower() for keyword in ["404", "not found", "error"]):
-                    print("[ERROR] Invalid page detected")
-                else:
-                    print("[DEBUG] Valid page but price not found")
-            except Exception as e:
-                print(f"[DEBUG] Error checking page: {e}")
-        
-        return price
-        
-    except WebDriverException as e:
-        print(f"[ERROR] WebDriver error: {e}")
-        return None
+        STORAGE.init()
+        STORAGE.migrate_from_json(DATA_FILE, migration_key)
+        REGISTRY.load()
     except Exception as e:
-        print(f"[ERROR] Unexpected error: {type(e).__name__}: {e}")
-        return None
-    
-    finally:
-        if driver:
-            try:
-                driver.quit()
-                print("[DEBUG] WebDriver closed")
-            except Exception as e:
-                print(f"[DEBUG] Error closing driver: {e}")
+        logger.error("Failed to initialize database: %s", e)
+        raise
 
-def get_product_title_selenium(product_link):
-    """Get product title using Selenium."""
-    print(f"[DEBUG] Fetching title for: {product_link}")
-    
-    driver = None
+def migration_key(product_link):
+    """Key for a legacy JSON entry; it is imported even if its short link cannot be resolved now."""
+    return resolve_product_key(product_link) or product_key(product_link)
+
+def load_data(chat_id=None):
+    """Tracked products from the in-memory registry, optionally only those of one chat."""
     try:
-        options = Options()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        try:
-            options.binary_location = os.environ.get("CHROME_BIN", "/usr/bin/chromium")
-        except Exception:
-            pass
-        options.add_argument(f'--user-agent={random.choice(USER_AGENTS)}')
-        
-        try:
-            driver = webdriver.Chrome(options=options)
-        except Exception:
-            print("[DEBUG] Falling back to webdriver-manager for ChromeDriver (title fetch)...")
-            service = ChromeService(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
-        driver.get(product_link)
-        time.sleep(2)
-        
-        # Try multiple title selectors
-        title_selectors = [
-            "h1.yhB1nd",
-            "h1._35KyD6",
-            ".B_NuCI",
-            "span.B_NuCI", 
-            "h1",
-            "[data-testid='product-title']"
-        ]
-        
-        for selector in title_selectors:
-            try:
-                title_element = driver.find_element(By.CSS_SELECTOR, selector)
-                title = title_element.text.strip()
-                if title:
-                    print(f"[DEBUG] Found title: {title[:50]}...")
-                    return title[:100]  # Limit length
-            except NoSuchElementException:
-                continue
-            except Exception as e:
-                print(f"[DEBUG] Error getting title with {selector}: {e}")
-                continue
-        
-        print("[WARNING] Could not find product title")
-        return "Unknown Product"
-        
+        return REGISTRY.all() if chat_id is None else REGISTRY.for_chat(chat_id)
     except Exception as e:
-        print(f"[ERROR] Error fetching title: {e}")
-        return "Unknown Product"
-    
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception:
-                pass
+        logger.error("Failed to load data: %s", e)
+        return []
 
 # ==============================
 # TELEGRAM FUNCTIONS
 # ==============================
 
 async def send_message_async(context, chat_id, message):
-    """Send message asynchronously."""
+    """Queue a Markdown message on the outbox; it falls back to plain text if Telegram rejects it."""
     try:
-        await context.bot.send_message(chat_id=chat_id, text=message, parse_mode='Markdown')
+        # enqueue() writes to SQLite, which can wait on a long maintenance transaction
+        await asyncio.to_thread(OUTBOX.enqueue, chat_id, message, parse_mode='Markdown')
     except Exception as e:
-        print(f"[ERROR] Failed to send message: {e}")
-        # Try without markdown as fallback
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=message)
-        except Exception as e2:
-            print(f"[ERROR] Failed to send plain message: {e2}")
+        logger.error("Failed to queue message: %s", e, extra={"chat_id": chat_id})
 
 def add_product(chat_id, product_link):
     """Add product to tracking list."""
-    print(f"[DEBUG] Adding product for chat {chat_id}: {product_link}")
+    logger.debug("Adding product: %s", product_link, extra={"chat_id": chat_id})
+    
+    # Duplicates are answered from memory without loading the page again
+    key = resolve_product_key(product_link)
+    if key is None:
+        return None, UNRESOLVED_LINK_REPLY
+    existing = REGISTRY.get(chat_id, key)
+    if existing:
+        return existing["last_price"], f"Already tracking this product!\n\n**Current Price:** ₹{existing['last_price']:,}"
+    
+    # Price and title come from a single page load of the resolved URL
+    try:
+        # Joins a check of the same product already in progress, or reuses one that just finished
+        snapshot = CHECK_ENGINE.fetch(fetchable_url(product_link), fetch_isolated, key=key, max_age=FRESH_RESULT_TTL)
+    except CircuitOpenError as e:
+        logger.warning("Not adding %s: %s", product_link, e, extra={"chat_id": chat_id, "product_key": key})
+        return None, "Flipkart is rate-limiting requests right now. Please try again in a few minutes."
+    return register_product(chat_id, product_link, key, snapshot)
+
+async def add_product_async(chat_id, product_link):
+    """add_product() on the event loop: resolving and fetching go through the check pipeline."""
+    logger.debug("Adding product: %s", product_link, extra={"chat_id": chat_id})
+    
+    url = await PIPELINE.resolve(product_link)
+    key = resolved_product_key(url)
+    if key is None:
+        return None, UNRESOLVED_LINK_REPLY
+    existing = REGISTRY.get(chat_id, key)
+    if existing:
+        return existing["last_price"], f"Already tracking this product!\n\n**Current Price:** ₹{existing['last_price']:,}"
     
-    # First fetch current price
-    current_price = fetch_price_selenium(product_link)
+    try:
+        # The user is waiting: skip ahead of scheduled checks queued on the politeness delay
+        snapshot = await PIPELINE.fetch(url, key, max_age=FRESH_RESULT_TTL, priority=True)
+    except CircuitOpenError as e:
+        logger.warning("Not adding %s: %s", product_link, e, extra={"chat_id": chat_id, "product_key": key})
+        return None, "Flipkart is rate-limiting requests right now. Please try again in a few minutes."
+    return await PIPELINE.run_storage(register_product, chat_id, product_link, key, snapshot)
+
+def register_product(chat_id, product_link, key, snapshot):
+    """Start tracking a freshly fetched product; returns (price, reply)."""
+    current_price = snapshot.price
     if current_price is None:
-        print(f"[ERROR] Could not fetch price for {product_link}")
+        logger.error("Could not fetch price for %s", product_link, extra={"chat_id": chat_id, "product_key": key})
         return None, "Could not fetch price. Please check the URL and try again."
     
-    # Get product title
-    title = get_product_title_selenium(product_link)
+    title = snapshot.title or "Unknown Product"
     
-    # Atomic read-modify-write to avoid races with background checker
-    with DATA_LOCK:
-        data = load_data()
-        
-        # Check if already tracking
-        for item in data:
-            if item["product_link"] == product_link and item["chat_id"] == chat_id:
-                return current_price, f"Already tracking this product!\n\n**Current Price:** ₹{current_price:,}"
-        
-        # Add new product
-        new_product = {
-            "chat_id": chat_id,
-            "product_link": product_link,
-            "title": title,
-            "initial_price": current_price,
-            "last_price": current_price,
-            "added_date": time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        data.append(new_product)
-        save_data(data)
+    # Add new product; the unique (chat_id, product_key) constraint catches duplicates
+    new_product = {
+        "chat_id": chat_id,
+        "product_link": product_link,
+        "product_key": key,
+        "title": title,
+        "initial_price": current_price,
+        "last_price": current_price,
+        "added_date": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    
+    if not REGISTRY.add(new_product):
+        return current_price, f"Already tracking this product!\n\n**Current Price:** ₹{current_price:,}"
     
     success_msg = (
         f"✅ **Product Added Successfully!**\n\n"
@@ -317,89 +179,241 @@ def add_product(chat_id, product_link):
         f"🔔 You'll get alerts when the price drops!"
     )
     
-    print(f"[SUCCESS] Product added for chat {chat_id}")
+    logger.info("Product added", extra={"chat_id": chat_id, "product_key": key})
     return current_price, success_msg
 
+def evaluate_item(item, snapshot):
+    """Apply a fetched snapshot to one subscription, updating it in place and alerting on a drop.
+
+    Returns True when the item was updated.
+    """
+    try:
+        chat_id = item["chat_id"]
+        product_link = item["product_link"]
+        last_price = item["last_price"]
+        title = item.get("title", "Unknown Product")
+        current_price = snapshot.price
+        
+        if current_price is None:
+            logger.debug("Failed to check price for: %s", title)
+            return False
+        
+        logger.debug("%s: ₹%s (was ₹%s)", title, current_price, last_price)
+        
+        # Update price; a single-row write per subscriber
+        item["last_price"] = current_price
+        item["last_checked"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        new_title = None
+        if snapshot.title and title == "Unknown Product":
+            item["title"] = title = new_title = snapshot.title
+        REGISTRY.update_price(chat_id, item["product_key"], current_price, item["last_checked"], new_title)
+        
+        # Check for price drop
+        if current_price < last_price:
+            discount = last_price - current_price
+            discount_percent = (discount / last_price) * 100
+            
+            alert_msg = (
+                f"🎉 **PRICE DROP ALERT!**\n\n"
+                f"📱 **{title}**\n"
+                f"💰 **New Price:** ₹{current_price:,}\n"
+                f"📉 **Was:** ₹{last_price:,}\n"
+                f"💸 **You Save:** ₹{discount:,} ({discount_percent:.1f}% off)\n\n"
+                f"🔗 {product_link}"
+            )
+            
+            # Queued and persisted; the outbox delivers at Telegram's allowed rate
+            try:
+                OUTBOX.enqueue(chat_id, alert_msg)
+                logger.info("Price drop alert queued for %s", title,
+                            extra={"chat_id": chat_id, "product_key": item["product_key"]})
+            except Exception as e:
+                logger.error("Failed to queue alert: %s", e, extra={"chat_id": chat_id})
+        
+        return True
+        
+    except Exception:
+        logger.exception("Error checking product", extra={"product_key": item.get("product_key")})
+        return False
+
+def check_product_group(items):
+    """Fetch one product once and fan the result out to every subscriber of it.
+
+    Returns the snapshot, or None when the fetch itself blew up.
+    """
+    title = items[0].get("title", "Unknown Product")
+    key = items[0]["product_key"]
+    logger.debug("Checking: %s (%s subscribers)", title, len(items))
+    started = time.perf_counter()
+    try:
+        snapshot = CHECK_ENGINE.fetch(fetchable_url(items[0]["product_link"]), fetch_isolated, key=key)
+    except CircuitOpenError as e:
+        logger.debug("Skipping %s: %s", title, e, extra={"product_key": key})
+        return None
+    except Exception as e:
+        logger.error("Error checking product: %s", e, extra={"product_key": key})
+        return None
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.observe(elapsed, "check")
+    logger.info("Checked %s: %s", title, snapshot.price, extra={
+        "product_key": key, "tier": snapshot.source, "outcome": classify_snapshot(snapshot),
+        "duration_ms": round(elapsed * 1000, 1),
+    })
+    return apply_snapshot(items, snapshot)
+
+def apply_snapshot(items, snapshot):
+    """Record a fetched snapshot and evaluate it for every subscriber; returns it, or None on error."""
+    try:
+        with STAGE_SECONDS.time("storage_write"):
+            STORAGE.record_check(items[0]["product_key"], items[0]["product_link"], snapshot)
+            if snapshot.price is not None:
+                PRICE_HISTORY.append(items[0]["product_key"], snapshot.price)
+    except Exception as e:
+        logger.error("Error recording check: %s", e, extra={"product_key": items[0]["product_key"]})
+        return None
+    for item in items:
+        evaluate_item(item, snapshot)
+    return snapshot
+
+def check_product(product_key):
+    """Check one product for all of its current subscribers; returns the fetched price."""
+    items = REGISTRY.subscribers(product_key)
+    if not items:
+        return None
+    snapshot = PROFILER.run(check_product_group, items)
+    return snapshot.price if snapshot else None
+
 def check_prices():
     """Check all tracked products for price changes."""
-    print(f"[INFO] Starting price check at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    with PROFILER.cycle("check_prices"):
+        _check_prices()
+
+def _check_prices():
+    logger.info("Starting price check")
+    started = time.monotonic()
     
     data = load_data()
     if not data:
-        print("[INFO] No products to check")
+        logger.info("No products to check")
         return
     
-    updated = False
+    # Each unique product is fetched once no matter how many users track it
+    groups = {}
     for item in data:
-        try:
-            chat_id = item["chat_id"]
-            product_link = item["product_link"]
-            last_price = item["last_price"]
-            title = item.get("title", "Unknown Product")
-            
-            print(f"[DEBUG] Checking: {title}")
-            current_price = fetch_price_selenium(product_link)
-            
-            if current_price is None:
-                print(f"[WARNING] Failed to check price for: {title}")
-                continue
-            
-            print(f"[INFO] {title}: ₹{current_price:,} (was ₹{last_price:,})")
-            
-            # Update price
-            item["last_price"] = current_price
-            item["last_checked"] = time.strftime("%Y-%m-%d %H:%M:%S")
-            updated = True
-            
-            # Check for price drop
-            if current_price < last_price:
-                discount = last_price - current_price
-                discount_percent = (discount / last_price) * 100
-                
-                alert_msg = (
-                    f"🎉 **PRICE DROP ALERT!**\n\n"
-                    f"📱 **{title}**\n"
-                    f"💰 **New Price:** ₹{current_price:,}\n"
-                    f"📉 **Was:** ₹{last_price:,}\n"
-                    f"💸 **You Save:** ₹{discount:,} ({discount_percent:.1f}% off)\n\n"
-                    f"🔗 {product_link}"
-                )
-                
-                # Send alert (this is synchronous, but for background task it's okay)
-                try:
-                    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-                    requests.post(url, data={"chat_id": chat_id, "text": alert_msg}, timeout=10)
-                    print(f"[SUCCESS] Price drop alert sent for {title}")
-                except Exception as e:
-                    print(f"[ERROR] Failed to send alert: {e}")
-            
-            # Add delay between checks
-            time.sleep(random.uniform(5, 10))
-            
-        except Exception as e:
-            print(f"[ERROR] Error checking product: {e}")
-            continue
-    
-    if updated:
-        # Merge updates with the latest on-disk data to avoid overwriting user additions
-        with DATA_LOCK:
-            current = load_data()
-            # Build index for quick lookup
-            index = {(item["chat_id"], item["product_link"]): i for i, item in enumerate(current)}
-            for updated_item in data:
-                key = (updated_item["chat_id"], updated_item["product_link"])
-                if key in index:
-                    i = index[key]
-                    # Update only mutable fields
-                    current[i]["last_price"] = updated_item.get("last_price", current[i].get("last_price"))
-                    current[i]["last_checked"] = updated_item.get("last_checked", current[i].get("last_checked"))
-                    if "title" in updated_item:
-                        current[i]["title"] = updated_item["title"] or current[i].get("title")
-                else:
-                    # If background discovered an entry not on disk, append it
-                    current.append(updated_item)
-            save_data(current)
-        print("[INFO] Price check completed and data saved")
+        groups.setdefault(item["product_key"], []).append(item)
+    
+    # Every check is committed as it finishes; after a crash, products already
+    # checked in the interrupted cycle are skipped
+    cursor = STORAGE.sweep_cursor("check_prices")
+    if cursor and time.time() - cursor["started_at"] < CHECK_INTERVAL:
+        done = STORAGE.checked_since(cursor["started_at"])
+        groups = {key: items for key, items in groups.items() if key not in done}
+        logger.info("Resuming interrupted check cycle; %s products already checked", len(done))
+    else:
+        STORAGE.set_sweep_cursor("check_prices", {"started_at": time.time()})
+    
+    # Workers run concurrently; politeness delays are applied per host by the engine
+    results = CHECK_ENGINE.map(lambda items: PROFILER.run(check_product_group, items), list(groups.values()))
+    STORAGE.clear_sweep_cursor("check_prices")
+    CYCLE_SECONDS.observe(time.monotonic() - started)
+    checked = sum(1 for result in results if getattr(result, "price", None) is not None)
+    logger.info("Checked %s unique products for %s subscriptions with %s workers in %.1fs (%s succeeded)",
+                len(groups), len(data), CHECK_ENGINE.workers, time.monotonic() - started, checked)
+    run_maintenance()
+
+def run_maintenance():
+    """Keep history and the check log bounded, and report subsystem stats."""
+    try:
+        PRICE_HISTORY.compact()
+        STORAGE.prune_checks(time.time() - HISTORY_RAW_DAYS * 86400)
+    except Exception as e:
+        logger.error("History maintenance failed: %s", e)
+    if FETCH_PROCESSES > 0:
+        logger.info("Fetch workers: %s", get_fetch_worker_pool().stats())
+    # Includes the counts merged in from fetch workers
+    logger.info("Fetch tiers: %s", tier_stats())
+    RESOLUTION_CACHE.save()
+    logger.info("Link resolution cache: %s", RESOLUTION_CACHE.stats())
+    SELECTOR_STATS.save()
+    logger.info("Selector ranking: %s", SELECTOR_STATS.stats())
+    if FETCH_PROCESSES <= 0:
+        logger.info("Browser pool: %s", get_driver_pool().stats())
+    logger.info("Check engine: %s", CHECK_ENGINE.stats())
+    logger.info("Scheduler: %s", SCHEDULER.stats())
+    logger.info("Outbox: %s", OUTBOX.stats())
+    if CHECK_MODE == "distributed":
+        logger.info("Job queue: %s", JOB_QUEUE.stats())
+    if CHECK_MODE == "async":
+        logger.info("Check pipeline: %s", PIPELINE.stats())
+    if dropped_records():
+        logger.warning("Dropped %s log records because the log writer fell behind", dropped_records())
+
+def register_metrics():
+    """Expose the existing subsystem stats as scrape-time metrics."""
+    METRICS.callback("flipkart_outbox_queued", "Messages waiting in the outbox", lambda: OUTBOX.stats()["queued"])
+    METRICS.callback("flipkart_outbox_sent_total", "Messages delivered to Telegram",
+                     lambda: OUTBOX.stats()["sent"], kind="counter")
+    METRICS.callback("flipkart_outbox_failed_total", "Messages Telegram rejected or that ran out of attempts",
+                     lambda: OUTBOX.stats()["failed"], kind="counter")
+    METRICS.callback("flipkart_scheduled_products", "Products on the check schedule",
+                     lambda: SCHEDULER.stats()["products"])
+    METRICS.callback("flipkart_checks_in_flight", "Scheduled checks currently running",
+                     lambda: SCHEDULER.stats().get("in_flight", 0))
+    METRICS.callback("flipkart_resolution_cache_hits_total", "Short-link resolutions answered from cache",
+                     lambda: RESOLUTION_CACHE.stats()["hits"], kind="counter")
+    METRICS.callback("flipkart_resolution_cache_misses_total", "Short-link resolutions that went to the network",
+                     lambda: RESOLUTION_CACHE.stats()["misses"], kind="counter")
+    METRICS.callback("flipkart_single_flight_total", "Fetch requests by how they were served (calls, coalesced, fresh_hits)",
+                     lambda: {name: value for name, value in CHECK_ENGINE.flights.stats().items() if name != "in_flight"},
+                     kind="counter", labelname="result")
+    METRICS.callback("flipkart_host_in_flight", "Fetches running per host",
+                     lambda: {host: stats["in_flight"] for host, stats in CHECK_ENGINE.stats()["hosts"].items()},
+                     labelname="host")
+    METRICS.callback("flipkart_host_concurrency_limit", "Current AIMD concurrency limit per host",
+                     lambda: {host: stats["limit"] for host, stats in CHECK_ENGINE.stats()["hosts"].items()},
+                     labelname="host")
+    METRICS.callback("flipkart_log_records_dropped_total", "Log records dropped because the writer fell behind",
+                     dropped_records, kind="counter")
+    if FETCH_PROCESSES > 0:
+        METRICS.callback("flipkart_fetch_worker_restarts_total", "Fetch worker processes retired or killed",
+                         lambda: get_fetch_worker_pool().restarts, kind="counter")
+        METRICS.callback("flipkart_fetch_worker_rss_mb", "Resident memory of each fetch worker and its Chrome",
+                         lambda: get_fetch_worker_pool().stats()["rss_mb"], labelname="worker")
+    if CHECK_MODE == "distributed":
+        METRICS.callback("flipkart_jobs", "Fetch jobs by state", JOB_QUEUE.stats, labelname="state")
+    if CHECK_MODE == "async":
+        METRICS.callback("flipkart_pipeline_queued", "Checks waiting in front of each pipeline stage",
+                         lambda: PIPELINE.stats()["queued"], labelname="stage")
+        METRICS.callback("flipkart_pipeline_fetching", "Pipeline fetches in progress",
+                         lambda: PIPELINE.stats()["fetching"])
+
+def start_profile(chat_id, args):
+    """Handle /profile [N|cycle]: profile the next N scheduled checks, or one full sweep now."""
+    def report(paths):
+        OUTBOX.enqueue(chat_id, "Profile written:\n" + "\n".join(paths))
+    
+    if PROFILER.active():
+        OUTBOX.enqueue(chat_id, "A profile is already running.")
+    elif args and args[0] == "cycle":
+        def run_cycle():
+            with PROFILER.cycle("check_prices", force=True, on_done=report):
+                check_prices()
+        threading.Thread(target=run_cycle, name="profile-cycle", daemon=True).start()
+        OUTBOX.enqueue(chat_id, "Profiling a full check cycle; files will follow.")
+    elif CHECK_MODE == "distributed":
+        OUTBOX.enqueue(chat_id, "Checks run on fetch nodes in distributed mode; use /profile cycle.")
+    elif args and not (args[0].isdigit() and int(args[0]) >= 1):
+        OUTBOX.enqueue(chat_id, "Usage: /profile [N|cycle], where N is at least 1.")
+    else:
+        count = int(args[0]) if args else PROFILE_DEFAULT_CHECKS
+        if PROFILER.profile_checks(count, on_done=report):
+            OUTBOX.enqueue(chat_id, f"Profiling the next {count} checks; files will follow.")
+        else:
+            OUTBOX.enqueue(chat_id, "A profile is already running.")
+
+# Scheduled checks in async mode; started on the bot's event loop by start_async_checker()
+PIPELINE = CheckPipeline(CHECK_ENGINE, REGISTRY.subscribers, apply_snapshot, SCHEDULER,
+                         on_done=lambda key, price: PROFILER.check_done())
 
 # ==============================
 # TELEGRAM HANDLERS
@@ -413,7 +427,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     text = update.message.text.strip()
     
-    print(f"[DEBUG] Received message from {chat_id}: {text}")
+    logger.debug("Received message: %s", text, extra={"chat_id": chat_id})
     
     if text.lower() in ['/start', '/help']:
         help_text = (
@@ -432,17 +446,29 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif text.lower() == '/list':
         await show_tracked_products(chat_id, context)
         
+    elif text.lower() == '/stats' and chat_id in ADMIN_CHAT_IDS:
+        # Plain text: metric names are full of underscores that Markdown would eat
+        await asyncio.to_thread(lambda: OUTBOX.enqueue(chat_id, summary_text()[:4000]))
+        
+    elif text.lower().startswith('/profile') and chat_id in ADMIN_CHAT_IDS:
+        # Starting a session takes a tracemalloc snapshot, which can take seconds
+        await asyncio.to_thread(start_profile, chat_id, text.split()[1:])
+        
     elif "flipkart.com" in text.lower() and text.startswith("http"):
         # Show processing message
         await send_message_async(context, chat_id, "🔍 Fetching product details... Please wait...")
         
-        # Process in thread to avoid blocking
-        loop = asyncio.get_running_loop()
         try:
-            current_price, result_msg = await loop.run_in_executor(None, add_product, chat_id, text)
+            with STAGE_SECONDS.time("add_product"):
+                if CHECK_MODE == "async":
+                    current_price, result_msg = await add_product_async(chat_id, text)
+                else:
+                    # Process in thread to avoid blocking
+                    loop = asyncio.get_running_loop()
+                    current_price, result_msg = await loop.run_in_executor(None, add_product, chat_id, text)
             await send_message_async(context, chat_id, result_msg)
-        except Exception as e:
-            print(f"[ERROR] Error processing product: {e}")
+        except Exception:
+            logger.exception("Error processing product", extra={"chat_id": chat_id})
             await send_message_async(context, chat_id, "❌ Error processing product. Please try again.")
     
     else:
@@ -453,8 +479,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_tracked_products(chat_id, context):
     """Show user's tracked products."""
-    data = load_data()
-    user_products = [item for item in data if item["chat_id"] == chat_id]
+    user_products = load_data(chat_id)
     
     if not user_products:
         await send_message_async(context, chat_id, 
@@ -484,20 +509,139 @@ async def show_tracked_products(chat_id, context):
     await send_message_async(context, chat_id, message)
 
 def start_price_checker():
-    """Start background price checker."""
+    """Start the background checker that feeds due products from the scheduler to the engine."""
+    if CHECK_MODE == "distributed":
+        start_job_dispatcher()
+        return
+
+    def on_done(product_key, future, slots):
+        try:
+            price = future.result()
+        except Exception as e:
+            logger.error("Error checking product: %s", e, extra={"product_key": product_key})
+            price = None
+        SCHEDULER.complete(product_key, price)
+        PROFILER.check_done()
+        slots.release()
+    
     def price_check_loop():
+        # Never pop more due products than there are workers to run them
+        slots = threading.BoundedSemaphore(CHECK_ENGINE.workers)
+        last_sync = last_maintenance = 0.0
         while True:
             try:
-                check_prices()
-            except Exception as e:
-                print(f"[ERROR] Error in price check loop: {e}")
-            
-            print(f"[INFO] Sleeping for 30 min...")
-            time.sleep(1800)  # 30 minute
+                now = time.monotonic()
+                if now - last_sync >= SCHEDULER_SYNC_INTERVAL:
+                    SCHEDULER.sync(REGISTRY.subscriber_counts())
+                    last_sync = now
+                if now - last_maintenance >= MAINTENANCE_INTERVAL:
+                    run_maintenance()
+                    last_maintenance = now
+                
+                slots.acquire()
+                product_key = SCHEDULER.next_due(timeout=SCHEDULER_SYNC_INTERVAL)
+                if product_key is None:
+                    slots.release()
+                    continue
+                future = CHECK_ENGINE.submit(check_product, product_key)
+                future.add_done_callback(lambda f, key=product_key: on_done(key, f, slots))
+            except Exception:
+                logger.exception("Error in price check loop")
+                time.sleep(5)
     
     thread = threading.Thread(target=price_check_loop, daemon=True)
     thread.start()
-    print("[INFO] Price checker thread started")
+    logger.info("Price checker thread started")
+
+async def start_async_checker(application):
+    """post_init hook: run the check pipeline and its housekeeping on the bot's event loop."""
+    PIPELINE.start()
+    application.bot_data["housekeeping"] = asyncio.create_task(housekeeping_loop())
+
+async def stop_async_checker(application):
+    """post_shutdown hook: cancel housekeeping and drain the pipeline back to the scheduler."""
+    task = application.bot_data.pop("housekeeping", None)
+    if task is not None:
+        task.cancel()
+    await PIPELINE.stop()
+
+async def housekeeping_loop():
+    """Scheduler sync and maintenance for async mode, run on the pipeline's storage thread."""
+    last_maintenance = 0.0
+    while True:
+        try:
+            await PIPELINE.run_storage(SCHEDULER.sync, REGISTRY.subscriber_counts())
+            if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                await PIPELINE.run_storage(run_maintenance)
+                last_maintenance = time.monotonic()
+        except Exception:
+            logger.exception("Error in housekeeping loop")
+        await asyncio.sleep(SCHEDULER_SYNC_INTERVAL)
+
+def start_job_dispatcher():
+    """Coordinator mode: queue due products for fetch nodes and apply the results they report."""
+    outstanding = set()
+    cond = threading.Condition()
+
+    def dispatch_loop():
+        last_sync = last_maintenance = 0.0
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_sync >= SCHEDULER_SYNC_INTERVAL:
+                    SCHEDULER.sync(REGISTRY.subscriber_counts())
+                    last_sync = now
+                if now - last_maintenance >= MAINTENANCE_INTERVAL:
+                    run_maintenance()
+                    last_maintenance = now
+                
+                with cond:
+                    while len(outstanding) >= DISTRIBUTED_MAX_OUTSTANDING:
+                        cond.wait()
+                product_key = SCHEDULER.next_due(timeout=SCHEDULER_SYNC_INTERVAL)
+                if product_key is None:
+                    continue
+                items = REGISTRY.subscribers(product_key)
+                if not items:
+                    SCHEDULER.complete(product_key, None)
+                    continue
+                # A job left over from before a restart counts as already dispatched
+                JOB_QUEUE.submit(product_key, items[0]["product_link"])
+                with cond:
+                    outstanding.add(product_key)
+            except Exception:
+                logger.exception("Error in job dispatch loop")
+                time.sleep(5)
+    
+    def collect_loop():
+        while True:
+            try:
+                results = JOB_QUEUE.take_results()
+            except Exception as e:
+                logger.error("Could not collect job results: %s", e)
+                results = []
+            for job in results:
+                product_key = job["product_key"]
+                price = None
+                result = job["result"] or {"snapshot": None, "error": f"gave up after {job['attempts']} attempts"}
+                if result["snapshot"]:
+                    items = REGISTRY.subscribers(product_key)
+                    snapshot = ProductSnapshot(**result["snapshot"])
+                    CHECK_ENGINE.remember(product_key, snapshot)
+                    snapshot = apply_snapshot(items, snapshot) if items else None
+                    price = snapshot.price if snapshot else None
+                else:
+                    logger.warning("Job failed: %s", result["error"], extra={"product_key": product_key})
+                SCHEDULER.complete(product_key, price)
+                with cond:
+                    outstanding.discard(product_key)
+                    cond.notify()
+            if not results:
+                time.sleep(JOB_POLL_INTERVAL)
+    
+    threading.Thread(target=dispatch_loop, name="job-dispatcher", daemon=True).start()
+    threading.Thread(target=collect_loop, name="job-collector", daemon=True).start()
+    logger.info("Job dispatcher started; run fetch_node.py to process checks")
 
 # ==============================
 # MAIN
@@ -505,20 +649,32 @@ def start_price_checker():
 
 if __name__ == "__main__":
 
-    print("🚀 Starting Flipkart Price Tracker Bot...")
+    setup_logging()
+    logger.info("🚀 Starting Flipkart Price Tracker Bot...")
+    register_metrics()
+    start_metrics_server()
+    if PROFILE_CHECKS > 0 and CHECK_MODE != "distributed":
+        PROFILER.profile_checks(PROFILE_CHECKS)
     
     # Ensure data file exists
     ensure_data_file_exists()
+    RESOLUTION_CACHE.load()
+    SELECTOR_STATS.load()
     
-    # Create Telegram application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Create Telegram application; in async mode the checker lives on its event loop
+    builder = Application.builder().token(TELEGRAM_TOKEN)
+    if CHECK_MODE == "async":
+        builder = builder.post_init(start_async_checker).post_shutdown(stop_async_checker)
+    application = builder.build()
     application.add_handler(MessageHandler(filters.TEXT, handle_message))
     
-    # Start price checker
-    start_price_checker()
+    # Start the message outbox, then the price checker that feeds it
+    OUTBOX.start()
+    if CHECK_MODE != "async":
+        start_price_checker()
     
-    print("🤖 Bot started successfully!")
-    print("📊 Monitoring for price changes every hour...")
+    logger.info("🤖 Bot started successfully!")
+    logger.info("📊 Monitoring for price changes on a per-product schedule...")
     
     # Start bot
     application.run_polling(allowed_updates=Update.ALL_TYPES)
\ No newline at end of file
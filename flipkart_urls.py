@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import atexit
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from http_client import get_shared_session, get_random_headers
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+RESOLUTION_CACHE_FILE = os.getenv("RESOLUTION_CACHE_FILE", "url_cache.json")
+RESOLUTION_TTL = int(os.getenv("RESOLUTION_TTL", str(7 * 24 * 3600)))
+RESOLUTION_NEGATIVE_TTL = int(os.getenv("RESOLUTION_NEGATIVE_TTL", "600"))
+RESOLUTION_CACHE_SIZE = int(os.getenv("RESOLUTION_CACHE_SIZE", "5000"))
+# New entries are written to disk at most this often, and at exit
+RESOLUTION_SAVE_INTERVAL = float(os.getenv("RESOLUTION_SAVE_INTERVAL", "30"))
+
+ITEM_ID_PATTERN = re.compile(r'/p/(itm[0-9a-zA-Z]+)')
+
+# ==============================
+# RESOLUTION CACHE
+# ==============================
+
+class ResolutionCache:
+    """Persistent LRU cache of link -> resolved product URL and key.
+
+    Successful resolutions live for `ttl` seconds and failures for
+    `negative_ttl`, so a broken link is not retried on every fetch. New
+    entries are saved at most every `save_interval` seconds, and the file
+    is written outside the lock so lookups never wait on the disk.
+    """
+
+    def __init__(self, path=RESOLUTION_CACHE_FILE, ttl=RESOLUTION_TTL,
+                 negative_ttl=RESOLUTION_NEGATIVE_TTL, max_size=RESOLUTION_CACHE_SIZE,
+                 save_interval=RESOLUTION_SAVE_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.save_interval = save_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Serialises writers so an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Load entries from disk, dropping expired ones."""
+        with self._lock:
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                return
+            try:
+                with open(self.path, "r") as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error("Failed to load resolution cache: %s", e)
+                return
+            now = time.time()
+            for link, entry in entries:
+                if entry.get("expires_at", 0) > now:
+                    self._entries[link] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            logger.debug("Loaded %s cached link resolutions", len(self._entries))
+
+    def save(self):
+        """Write the cache to disk if it changed since the last save."""
+        with self._save_lock:
+            with self._lock:
+                self._saved_at = time.monotonic()
+                if not self.path or not self._dirty:
+                    return
+                entries = list(self._entries.items())
+                self._dirty = False
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error("Failed to save resolution cache: %s", e)
+                with self._lock:
+                    self._dirty = True
+
+    def get(self, link):
+        """Cached entry for a link, or None on a miss or expiry."""
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            entry = self._entries.get(link)
+            if entry is None or entry["expires_at"] <= time.time():
+                if entry is not None:
+                    del self._entries[link]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(link)
+            self.hits += 1
+            return entry
+
+    def put(self, link, resolved_url, ok):
+        if not self._loaded:
+            self.load()
+        ttl = self.ttl if ok else self.negative_ttl
+        with self._lock:
+            self._entries[link] = {
+                "url": resolved_url,
+                "key": product_key(resolved_url),
+                "ok": ok,
+                "expires_at": time.time() + ttl,
+            }
+            self._entries.move_to_end(link)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= self.save_interval
+        if due:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+RESOLUTION_CACHE = ResolutionCache()
+atexit.register(RESOLUTION_CACHE.save)
+
+# ==============================
+# URL HELPERS
+# ==============================
+
+def is_short_link(url):
+    """True for dl.flipkart.com/s/... links that only redirect to a product."""
+    parsed = urlparse(url)
+    return parsed.netloc.lower().endswith("flipkart.com") and parsed.path.startswith("/s/")
+
+def resolve_flipkart_url(url):
+    """Resolve Flipkart short URLs to actual product URLs, consulting the cache first."""
+    cached = RESOLUTION_CACHE.get(url)
+    if cached is not None:
+        return cached["url"]
+
+    try:
+        session = get_shared_session()
+        headers = get_random_headers()
+
+        # Add random delay
+        time.sleep(random.uniform(2, 5))
+
+        # Follow redirects to get final URL
+        response = session.head(url, headers=headers, allow_redirects=True, timeout=15)
+        return _accept_resolution(url, response.url)
+
+    except Exception as e:
+        logger.warning("Error resolving URL: %s", e, extra={"url": url})
+        RESOLUTION_CACHE.put(url, url, ok=False)
+        return url
+
+async def resolve_flipkart_url_async(url, client):
+    """resolve_flipkart_url() for event loops, following redirects with an httpx.AsyncClient."""
+    cached = RESOLUTION_CACHE.get(url)
+    if cached is not None:
+        return cached["url"]
+
+    try:
+        await asyncio.sleep(random.uniform(2, 5))
+        response = await client.head(url, headers=get_random_headers(), follow_redirects=True, timeout=15)
+    except Exception as e:
+        logger.warning("Error resolving URL: %s", e, extra={"url": url})
+        # A put may write the cache file, so it stays off the event loop
+        await asyncio.to_thread(RESOLUTION_CACHE.put, url, url, False)
+        return url
+    return await asyncio.to_thread(_accept_resolution, url, str(response.url))
+
+def _accept_resolution(url, final_url):
+    """Cache and return the final URL if it is a product page, else fall back to the original."""
+    logger.debug("Resolved %s to %s", url, final_url)
+
+    # Ensure it's a valid Flipkart product URL
+    if "flipkart.com" in final_url and ("/p/" in final_url or "/dp/" in final_url):
+        RESOLUTION_CACHE.put(url, final_url, ok=True)
+        return final_url
+    logger.warning("Invalid final URL: %s", final_url, extra={"url": url})
+    RESOLUTION_CACHE.put(url, url, ok=False)
+    return url  # Return original URL if resolution fails
+
+def product_key(url):
+    """Canonical product key for a product URL: 'pid:<PID>', 'itm:<ITEM>' or the bare URL.
+
+    The pid identifies a concrete variant, so it wins over the listing item id
+    when both are present. Short links must be resolved before calling this.
+    """
+    parsed = urlparse(url)
+    pid = parse_qs(parsed.query).get("pid")
+    if pid and pid[0]:
+        return f"pid:{pid[0].upper()}"
+    match = ITEM_ID_PATTERN.search(parsed.path)
+    if match:
+        return f"itm:{match.group(1).lower()}"
+    return f"url:{parsed.netloc.lower()}{parsed.path.rstrip('/')}"
+
+def resolved_product_key(url):
+    """Product key for a URL returned by fetchable_url(), or None if it is still a short link.
+
+    A key made from the short link itself would never match the same product
+    added by its full URL, so unresolved links get no key at all.
+    """
+    return None if is_short_link(url) else product_key(url)
+
+def resolve_product_key(url):
+    """Product key for any Flipkart link, following short links when needed; None if that fails."""
+    return resolved_product_key(fetchable_url(url))
+
+def fetchable_url(url):
+    """URL to actually load for a link: short links are swapped for their cached target."""
+    return resolve_flipkart_url(url) if is_short_link(url) else url
+
+async def fetchable_url_async(url, client):
+    return await resolve_flipkart_url_async(url, client) if is_short_link(url) else url
@@ -0,0 +1,83 @@
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ==============================
+# CONFIG
+# ==============================
+
+# User agents pool to rotate
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+]
+
+HTTP_POOL_SIZE = 20
+
+# Transient server errors are retried with 0, 2, 4 s of backoff. 429 and 503
+# mean the host wants us to slow down: they are returned as-is so block
+# detection and the circuit breaker see them, instead of being re-sent.
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 1
+HTTP_RETRY_STATUS_CODES = [500, 502, 504]
+
+# ==============================
+# SESSIONS
+# ==============================
+
+def get_random_headers():
+    """Generate randomized headers to avoid detection."""
+    return {
+        "User-Agent": random.choice(USER_AGENTS),
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+        "Upgrade-Insecure-Requests": "1",
+        "Sec-Fetch-Dest": "document",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Site": "none",
+        "Sec-Fetch-User": "?1",
+        "Cache-Control": "max-age=0",
+        "DNT": "1",
+        "Sec-GPC": "1",
+    }
+
+def create_session(pool_size=HTTP_POOL_SIZE):
+    """Create a session with retry strategy and better configuration."""
+    session = requests.Session()
+
+    # Retry strategy
+    retry_strategy = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=HTTP_RETRY_STATUS_CODES,
+        # Hand back the last response instead of raising once retries run out
+        raise_on_status=False,
+        # urllib3 otherwise re-sends 413/429/503 responses that carry Retry-After
+        respect_retry_after_header=False,
+    )
+
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+def get_shared_session():
+    """Process-wide keep-alive session so repeated fetches reuse TCP/TLS connections."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
@@ -0,0 +1,104 @@
+import os
+import socket
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+# ==============================
+# JOB QUEUE
+# ==============================
+
+class JobQueue:
+    """Shared queue of fetch jobs between the coordinator and fetch nodes.
+
+    Backed by the jobs table of the shared SQLite database. The coordinator
+    submits one job per due product and collects finished ones. Nodes lease
+    jobs, renew their leases while fetching and report a result. A lease
+    that is not renewed expires and the job goes to the next node that asks,
+    so a dead node's work is picked up automatically. Results are only
+    accepted from the current lease holder, so a late or repeated report
+    is ignored.
+    """
+
+    def __init__(self, storage, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.storage = storage
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    # ------------------------------
+    # Coordinator side
+    # ------------------------------
+
+    def submit(self, product_key, url):
+        """Queue a product; returns False if it is already queued or being fetched."""
+        return self.storage.job_add(product_key, url)
+
+    def take_results(self, limit=100):
+        return self.storage.job_take_results(limit)
+
+    def stats(self):
+        return self.storage.job_counts()
+
+    # ------------------------------
+    # Node side
+    # ------------------------------
+
+    def lease(self, owner, limit=1):
+        return self.storage.job_lease(owner, self.lease_seconds, self.max_attempts, limit)
+
+    def heartbeat(self, job):
+        return self.storage.job_heartbeat(job["id"], job["token"], self.lease_seconds)
+
+    def complete(self, job, result):
+        return self.storage.job_complete(job["id"], job["token"], result)
+
+class LeaseKeeper:
+    """Background thread that renews the leases of every job a node is working on."""
+
+    def __init__(self, queue, interval=JOB_HEARTBEAT_INTERVAL):
+        self.queue = queue
+        self.interval = interval
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def hold(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = job
+
+    def release(self, job):
+        with self._lock:
+            self._jobs.pop(job["id"], None)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                try:
+                    if not self.queue.heartbeat(job):
+                        logger.warning("Lost lease on job %s (%s)", job["id"], job["product_key"])
+                        self.release(job)
+                except Exception as e:
+                    logger.error("Heartbeat failed for job %s: %s", job["id"], e)
+
+    def stop(self):
+        self._stop.set()
+
+def node_id():
+    """Identifier a fetch node leases jobs under."""
+    return f"{socket.gethostname()}-{os.getpid()}"
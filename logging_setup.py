@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Read when setup_logging() runs, so values from .env apply
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_LOG_FORMAT = "text"  # "text" or "json"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Structured fields callers pass with extra={...}; emitted as JSON keys or key=value
+LOG_FIELDS = ("product_key", "url", "chat_id", "tier", "outcome", "duration_ms",
+              "host", "job_id", "worker")
+
+# Chatty third-party loggers (httpx logs every Telegram poll at INFO)
+QUIET_LOGGERS = ("httpx", "httpcore", "urllib3", "selenium", "WDM", "telegram")
+
+# ==============================
+# FORMATTERS
+# ==============================
+
+def _fields(record):
+    return {name: getattr(record, name) for name in LOG_FIELDS if getattr(record, name, None) is not None}
+
+class TextFormatter(logging.Formatter):
+    """Same "[LEVEL] message" lines the bot always printed, plus any structured fields."""
+
+    def format(self, record):
+        line = f"[{record.levelname}] {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{name}={value}" for name, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# ==============================
+# QUEUE HANDLER
+# ==============================
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; drops (and counts) them if it falls behind.
+
+    Only the %-interpolation happens in the calling thread. Formatting and
+    the write to stdout happen in the listener thread, so a slow terminal or
+    log driver never stalls a fetch.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Freeze the message now (args may be mutated later), keep the rest for the formatter
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+_queue_handler = None
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """Route all logging through a bounded queue to one writer thread; safe to call twice."""
+    global _listener, _queue_handler
+    level = (level or os.getenv("LOG_LEVEL", DEFAULT_LOG_LEVEL)).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", DEFAULT_LOG_FORMAT)).lower()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return root
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return root
+
+def dropped_records():
+    """Records discarded because the writer thread could not keep up."""
+    return _queue_handler.dropped if _queue_handler else 0
@@ -1,24 +1,23 @@
-import requests
-from bs4 import BeautifulSoup
-import json
 import os
 import asyncio
 import time
+import logging
 import threading
-import re
 import random
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+from flipkart_urls import resolve_flipkart_url, resolve_product_key, product_key
+from storage import Storage
+from registry import ProductRegistry
+from outbox import Outbox
+from product_fetcher import fetch_product_snapshot, tier_stats
+from logging_setup import setup_logging
+from profiling import PROFILER
+
+logger = logging.getLogger("main")
+
 # ==============================
 # CONFIG
 # ==============================
@@ -29,303 +28,64 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 if not TELEGRAM_TOKEN:
     raise SystemExit("ERROR: Telegram token not found in environment variable TELEGRAM_TOKEN")
 
+# Legacy JSON store, imported once into the SQLite database
 DATA_FILE = "tracked_products.json"
-DATA_LOCK = threading.Lock()
 
-# User agents pool to rotate
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:120.0) Gecko/20100101 Firefox/120.0",
-    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-]
+STORAGE = Storage()
+# Reads (/list, duplicate checks, the sweep) come from memory; writes go through to SQLite
+REGISTRY = ProductRegistry(STORAGE)
+OUTBOX = Outbox(TELEGRAM_TOKEN, STORAGE)
 
 # ==============================
 # UTILITIES
 # ==============================
 
-def load_data():
-    """Load tracked products from JSON file."""
-    if not os.path.exists(DATA_FILE):
-        return []
-    with DATA_LOCK:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-
-def save_data(data):
-    """Save tracked products to JSON file."""
-    with DATA_LOCK:
-        with open(DATA_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-
-def get_random_headers():
-    """Generate randomized headers to avoid detection."""
-    return {
-        "User-Agent": random.choice(USER_AGENTS),
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "Sec-Fetch-Dest": "document",
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-Site": "none",
-        "Sec-Fetch-User": "?1",
-        "Cache-Control": "max-age=0",
-        "DNT": "1",
-        "Sec-GPC": "1",
-    }
-
-def create_session():
-    """Create a session with retry strategy and better configuration."""
-    session = requests.Session()
-    
-    # Retry strategy
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-    
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    return session
+def load_data(chat_id=None):
+    """Tracked products from the in-memory registry, optionally only those of one chat."""
+    return REGISTRY.all() if chat_id is None else REGISTRY.for_chat(chat_id)
 
 # ==============================
 # CORE FUNCTIONS
 # ==============================
 
-def resolve_flipkart_url(url):
-    """Resolve Flipkart short URLs to actual product URLs."""
-    try:
-        session = create_session()
-        headers = get_random_headers()
-        
-        # Add random delay
-        time.sleep(random.uniform(2, 5))
-        
-        # Follow redirects to get final URL
-        response = session.head(url, headers=headers, allow_redirects=True, timeout=15)
-        final_url = response.url
-        
-        print(f"Original: {url}")
-        print(f"Resolved: {final_url}")
-        
-        # Ensure it's a valid Flipkart product URL
-        if "flipkart.com" in final_url and ("/p/" in final_url or "/dp/" in final_url):
-            return final_url
-        else:
-            print(f"Invalid final URL: {final_url}")
-            return url  # Return original URL if resolution fails
-            
-    except Exception as e:
-        print(f"Error resolving URL: {e}")
-        return url
-
 def fetch_price(product_link):
-    """Alternative method using selenium (requires installation)."""
-    print(f"[DEBUG] Starting selenium price fetch for: {product_link}")
+    """Fetch the current price through a single browser page load."""
+    logger.debug("Starting selenium price fetch for: %s", product_link)
     
     resolved_url = resolve_flipkart_url(product_link)
     if not resolved_url:
-        print(f"Could not resolve URL: {product_link}")
+        logger.warning("Could not resolve URL: %s", product_link)
         return None
     
-    print(f"Using URL: {resolved_url}")
-    driver = None
-    try:
-        print("[DEBUG] Setting up Chrome options...")
-        # Chrome options for headless browsing
-        options = Options()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        
-        # User agents list (you'll need to define this or import it)
-        USER_AGENTS = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        ]
-        
-        selected_user_agent = random.choice(USER_AGENTS)
-        options.add_argument(f'--user-agent={selected_user_agent}')
-        print(f"[DEBUG] Using user agent: {selected_user_agent}")
-        
-        print("[DEBUG] Initializing Chrome webdriver...")
-        driver = webdriver.Chrome(options=options)
-        print("[DEBUG] Chrome webdriver initialized successfully")
-        
-        # Anti-detection measure
-        print("[DEBUG] Applying anti-detection measures...")
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        print("[DEBUG] Anti-detection measures applied")
-        
-        print(f"[DEBUG] Navigating to product page: {product_link}")
-        driver.get(product_link)
-        print("[DEBUG] Page loaded successfully")
-        
-        # Add a small delay to let the page fully load
-        time.sleep(2)
-        print("[DEBUG] Waited 2 seconds for page to stabilize")
-        
-        # Wait and try different selectors
-        price_selectors = [
-            ".Nx9bqj.CxhGGd",
-            "._30jeq3._16Jk6d", 
-            "._1_WHN1",
-            ".CEmiEU .Nx9bqj",
-            "._25b18c",
-        ]
-        
-        print(f"[DEBUG] Attempting to find price using {len(price_selectors)} different selectors...")
-        
-        price = None
-        for i, selector in enumerate(price_selectors, 1):
-            print(f"[DEBUG] Trying selector {i}/{len(price_selectors)}: {selector}")
-            
-            try:
-                print(f"[DEBUG] Waiting for element with selector: {selector}")
-                price_element = WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                )
-                print("[DEBUG] Price element found!")
-                
-                price_text = price_element.text
-                print(f"[DEBUG] Raw price text: '{price_text}'")
-                
-                if not price_text:
-                    print("[DEBUG] Price text is empty, trying next selector...")
-                    continue
-                
-                # Extract price from text
-                price_match = re.search(r'₹?([\d,]+)', price_text.replace(',', ''))
-                if price_match:
-                    price_str = price_match.group(1).replace(',', '')
-                    price = int(price_str)
-                    print(f"[DEBUG] Successfully extracted price: ₹{price}")
-                    break
-                else:
-                    print(f"[DEBUG] Could not extract price from text: '{price_text}'")
-                    
-            except TimeoutException:
-                print(f"[DEBUG] Timeout waiting for selector: {selector}")
-                continue
-            except NoSuchElementException:
-                print(f"[DEBUG] Element not found for selector: {selector}")
-                continue
-            except ValueError as e:
-                print(f"[DEBUG] Error converting price to integer: {e}")
-                continue
-            except Exception as e:
-                print(f"[DEBUG] Unexpected error with selector {selector}: {type(e).__name__}: {e}")
-                continue
-        
-        if price is None:
-            print("[WARNING] Could not find price with any selector")
-            # Try to get page source for debugging
-            try:
-                page_title = driver.title
-                print(f"[DEBUG] Page title: {page_title}")
-                
-                # Check if we're on the right page
-                if "404" in page_title.lower() or "not found" in page_title.lower():
-                    print("[ERROR] Page not found (404)")
-                elif "blocked" in page_title.lower() or "captcha" in page_title.lower():
-                    print("[ERROR] Page blocked or CAPTCHA detected")
-                else:
-                    print("[DEBUG] Page seems valid but price not found")
-                    
-            except Exception as e:
-                print(f"[DEBUG] Error getting page info: {e}")
-        else:
-            print(f"[SUCCESS] Price fetched successfully: ₹{price}")
-        
-        return price
-        
-    except WebDriverException as e:
-        print(f"[ERROR] WebDriver error: {e}")
-        print("[INFO] Make sure ChromeDriver is installed and in PATH")
-        return None
-    except Exception as e:
-        print(f"[ERROR] Unexpected error in selenium fetch: {type(e).__name__}: {e}")
-        import traceback
-        print(f"[DEBUG] Full traceback: {traceback.format_exc()}")
-        return None
-    
-    finally:
-        # Ensure driver is always closed
-        if driver:
-            try:
-                print("[DEBUG] Closing webdriver...")
-                driver.quit()
-                print("[DEBUG] Webdriver closed successfully")
-            except Exception as e:
-                print(f"[DEBUG] Error closing webdriver: {e}")
+    logger.debug("Using URL: %s", resolved_url)
+    price = fetch_product_snapshot(resolved_url).price
+    if price is not None:
+        logger.debug("Price fetched successfully: ₹%s", price)
+    return price
 
 def send_message(chat_id, message):
-    """Send Telegram message to a user."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+    """Queue a Telegram message to a user on the shared outbox."""
     try:
-        response = requests.post(
-            url, 
-            data={"chat_id": chat_id, "text": message}, 
-            timeout=15
-        )
-        response.raise_for_status()
-    except requests.RequestException as e:
-        print(f"Failed to send message: {e}")
-
-def get_product_title(product_link):
-    """Extract product title from Flipkart page."""
-    resolved_url = resolve_flipkart_url(product_link)
-    if not resolved_url:
-        return "Unknown Product"
-    
-    session = create_session()
-    headers = get_random_headers()
-    
-    try:
-        time.sleep(random.uniform(1, 3))
-        res = session.get(resolved_url, headers=headers, timeout=15)
-        
-        if res.status_code != 200:
-            return "Unknown Product"
-            
-        soup = BeautifulSoup(res.text, "html.parser")
-        
-        title_selectors = [
-            "h1.yhB1nd",
-            "h1._35KyD6", 
-            ".B_NuCI",
-            "span.B_NuCI",
-            "h1",
-            ".x-item-title-label h1",
-        ]
-        
-        for selector in title_selectors:
-            title_tag = soup.select_one(selector)
-            if title_tag:
-                return title_tag.get_text(strip=True)[:100]
-                
-        return "Unknown Product"
-        
+        OUTBOX.enqueue(chat_id, message)
     except Exception as e:
-        print(f"Error getting title: {e}")
-        return "Unknown Product"
+        logger.error("Failed to queue message: %s", e, extra={"chat_id": chat_id})
 
 def add_product(chat_id, product_link):
     """Add product to tracking list with its current price."""
     send_message(chat_id, "🔍 Fetching product details... (This may take a moment)")
     
-    price = fetch_price(product_link)
+    # An unresolved short link has no stable key, so it is not added at all
+    key = resolve_product_key(product_link)
+    if key is None:
+        send_message(chat_id, "❌ Could not open this short link right now. Please try again later or send the full product URL.")
+        return
+    if REGISTRY.get(chat_id, key):
+        send_message(chat_id, "⚠️ This product is already being tracked!")
+        return
+    
+    # Resolve once and read price and title from the same page load
+    snapshot = fetch_product_snapshot(resolve_flipkart_url(product_link))
+    price = snapshot.price
     if price is None:
         error_msg = (
             "❌ Could not fetch price. Possible reasons:\n\n"
@@ -341,26 +101,20 @@ def add_product(chat_id, product_link):
         send_message(chat_id, error_msg)
         return
 
-    title = get_product_title(product_link)
+    title = snapshot.title or "Unknown Product"
     
-    with DATA_LOCK:
-        data = load_data()
-        
-        # Check if product already exists
-        for item in data:
-            if item["product_link"] == product_link and item["chat_id"] == chat_id:
-                send_message(chat_id, "⚠️ This product is already being tracked!")
-                return
-        
-        data.append({
-            "chat_id": chat_id,
-            "product_link": product_link,
-            "title": title,
-            "initial_price": price,
-            "last_price": price,
-            "added_date": time.strftime("%Y-%m-%d %H:%M:%S")
-        })
-        save_data(data)
+    added = REGISTRY.add({
+        "chat_id": chat_id,
+        "product_link": product_link,
+        "product_key": key,
+        "title": title,
+        "initial_price": price,
+        "last_price": price,
+        "added_date": time.strftime("%Y-%m-%d %H:%M:%S")
+    })
+    if not added:
+        send_message(chat_id, "⚠️ This product is already being tracked!")
+        return
 
     send_message(
         chat_id, 
@@ -373,52 +127,68 @@ def add_product(chat_id, product_link):
 
 def check_prices():
     """Check all tracked products and send alerts if price drops."""
-    print(f"🔍 Checking prices at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info("🔍 Checking prices")
     
-    with DATA_LOCK:
-        data = load_data()
-        updated = False
-        failed_checks = 0
-
-        for item in data:
+    data = load_data()
+    failed_checks = 0
+
+    # Each unique product is fetched once no matter how many users track it
+    groups = {}
+    for item in data:
+        groups.setdefault(item["product_key"], []).append(item)
+
+    # Subscriptions come back in insertion order, so the position of a product
+    # is a stable cursor; a restart continues after the last product that was saved
+    cursor = STORAGE.sweep_cursor("main") or {"started_at": time.time(), "next": 0}
+    if cursor["next"]:
+        logger.info("↩️ Resuming interrupted check at %s/%s", cursor["next"], len(groups))
+
+    for position, (key, items) in enumerate(groups.items()):
+        if position < cursor["next"]:
+            continue
+        title = items[0].get("title", "Unknown Product")
+
+        logger.debug("Checking: %s (%s subscribers)", title, len(items))
+        current_price = fetch_price(items[0]["product_link"])
+        
+        if current_price is None:
+            failed_checks += 1
+            logger.warning("❌ Failed to fetch price for: %s", title, extra={"product_key": key})
+            cursor["next"] = position + 1
+            STORAGE.set_sweep_cursor("main", cursor)
+            continue
+
+        for item in items:
             chat_id = item["chat_id"]
-            product_link = item["product_link"]
             last_price = item["last_price"]
-            title = item.get("title", "Unknown Product")
-
-            print(f"Checking: {title}")
-            current_price = fetch_price(product_link)
-            
-            if current_price is None:
-                failed_checks += 1
-                print(f"❌ Failed to fetch price for: {title}")
-                continue
-
-            print(f"✅ {title}: ₹{current_price:,} (was ₹{last_price:,})")
+            logger.info("✅ %s: ₹%s (was ₹%s)", title, current_price, last_price, extra={"product_key": key, "chat_id": chat_id})
 
             if current_price < last_price:
                 discount_percent = ((last_price - current_price) / last_price) * 100
                 send_message(
                     chat_id,
                     f"🎉 **PRICE DROP ALERT!**\n\n"
-                    f"📱 **{title}**\n"
+                    f"📱 **{item.get('title', 'Unknown Product')}**\n"
                     f"💰 **New Price:** ₹{current_price:,}\n"
                     f"📉 **Was:** ₹{last_price:,}\n"
                     f"💸 **You Save:** ₹{last_price - current_price:,} ({discount_percent:.1f}% off)\n\n"
-                    f"🔗 {product_link}"
+                    f"🔗 {item['product_link']}"
                 )
                 
-            item["last_price"] = current_price
-            item["last_checked"] = time.strftime("%Y-%m-%d %H:%M:%S")
-            updated = True
-            
-            # Add delay between product checks
-            time.sleep(random.uniform(5, 15))
-
-        if updated:
-            save_data(data)
-            
-        print(f"✅ Price check complete. Failed: {failed_checks}/{len(data)}")
+            # Persist each result as it arrives instead of rewriting everything at the end
+            REGISTRY.update_price(
+                chat_id, key, current_price, time.strftime("%Y-%m-%d %H:%M:%S")
+            )
+        cursor["next"] = position + 1
+        STORAGE.set_sweep_cursor("main", cursor)
+        
+        # Add delay between product checks
+        time.sleep(random.uniform(5, 15))
+        
+    STORAGE.clear_sweep_cursor("main")
+    logger.info("✅ Price check complete. Failed: %s/%s products for %s subscriptions",
+                failed_checks, len(groups), len(data))
+    logger.info("📊 Fetch tiers: %s", tier_stats())
 
 # ==============================
 # TELEGRAM HANDLERS
@@ -478,9 +248,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_tracked_products(chat_id, context):
     """Show user's tracked products."""
-    with DATA_LOCK:
-        data = load_data()
-        user_products = [item for item in data if item["chat_id"] == chat_id]
+    user_products = load_data(chat_id)
     
     if not user_products:
         await context.bot.send_message(
@@ -515,22 +283,32 @@ def start_price_check_thread():
     def _loop():
         while True:
             try:
-                check_prices()
-            except Exception as e:
-                print(f"Error in price check: {e}")
+                # Profiled for the first PROFILE_CYCLES cycles; the sweep runs in this one thread
+                with PROFILER.cycle("main_check_prices"):
+                    PROFILER.run(check_prices)
+            except Exception:
+                logger.exception("Error in price check")
             # Longer interval to avoid detection
             time.sleep(60 * 60)  # 1 hour
             
     t = threading.Thread(target=_loop, daemon=True)
     t.start()
-    print("🔄 Price check thread started (1-hour intervals)")
+    logger.info("🔄 Price check thread started (1-hour intervals)")
 
 # ==============================
 # MAIN
 # ==============================
 
 if __name__ == "__main__":
-    print("🚀 Starting Advanced Flipkart Price Tracker...")
+    setup_logging()
+    logger.info("🚀 Starting Advanced Flipkart Price Tracker...")
+    
+    # Open the database and import the legacy JSON file on first run
+    STORAGE.init()
+    # Legacy entries are imported even if their short link cannot be resolved now
+    STORAGE.migrate_from_json(DATA_FILE, lambda link: resolve_product_key(link) or product_key(link))
+    REGISTRY.load()
+    OUTBOX.start()
     
     # Build application
     application = Application.builder().token(TELEGRAM_TOKEN).build()
@@ -540,7 +318,7 @@ if __name__ == "__main__":
     start_price_check_thread()
 
     # Start polling
-    print("🤖 Telegram bot started...")
-    print("📡 Polling for messages...")
-    print("⚠️  Note: Due to anti-bot measures, some requests may fail initially")
+    logger.info("🤖 Telegram bot started...")
+    logger.info("📡 Polling for messages...")
+    logger.info("⚠️  Note: Due to anti-bot measures, some requests may fail initially")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
\ No newline at end of file
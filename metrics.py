@@ -0,0 +1,328 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Local Prometheus endpoint; 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Seconds; covers a cache hit through a slow browser fetch
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+# ==============================
+# METRIC TYPES
+# ==============================
+
+def _label_values(labels):
+    return labels if isinstance(labels, tuple) else (labels,)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        labels = _label_values(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+                for labels, value in sorted(self.values().items())]
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for labels, value in values.items():
+                self._values[labels] = self._values.get(labels, 0) + value
+
+class Histogram:
+    """Bucketed distribution of observations (seconds, by default) per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        labels = _label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, labels=()):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+
+    def count(self, labels=None):
+        """Observations for one label combination, or for all of them with labels=None."""
+        return sum(sum(counts) for counts in self._counts(labels))
+
+    def _counts(self, labels):
+        snapshot = self.snapshot()
+        if labels is None:
+            return [counts for counts, _ in snapshot.values()]
+        series = snapshot.get(_label_values(labels))
+        return [series[0]] if series else []
+
+    def quantile(self, q, labels=()):
+        """Estimate a quantile by interpolating inside its bucket, like histogram_quantile().
+
+        labels=None pools the observations of every label combination.
+        """
+        per_series = self._counts(labels)
+        if not per_series:
+            return None
+        counts = [sum(column) for column in zip(*per_series)]
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return None
+
+    def render(self):
+        lines = []
+        for labels, (counts, total) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+    def drain(self):
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series):
+        with self._lock:
+            for labels, (counts, total) in series.items():
+                mine = self._series.get(labels)
+                if mine is None:
+                    self._series[labels] = [list(counts), total]
+                    continue
+                for index, count in enumerate(counts):
+                    mine[0][index] += count
+                mine[1] += total
+
+class CallbackMetric:
+    """Value read at scrape time from an existing stats() call.
+
+    `fn` returns a number, or a dict of label value to number when the
+    metric has one label.
+    """
+
+    def __init__(self, name, help_text, fn, kind="gauge", labelname=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.kind = kind
+        self.labelname = labelname
+
+    def values(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug("Metric %s unavailable: %s", self.name, e)
+            return {}
+        if isinstance(value, dict):
+            return {(label,): number for label, number in value.items()}
+        return {(): value}
+
+    def render(self):
+        names = (self.labelname,) if self.labelname else ()
+        return [f"{self.name}{_format_labels(names, labels)} {value}"
+                for labels, value in sorted(self.values().items())]
+
+# ==============================
+# REGISTRY
+# ==============================
+
+class MetricsRegistry:
+    """All metrics of one process, rendered in the Prometheus text format.
+
+    Fetch worker processes record into their own registry; drain() hands
+    the counts accumulated since the last drain to the parent, which
+    merge()s them, so the bot's endpoint covers work done in its workers.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name, help_text, fn, kind="gauge", labelname=None):
+        """Register (or replace) a metric computed from existing stats when scraped."""
+        metric = CallbackMetric(name, help_text, fn, kind, labelname)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def get(self, name):
+        with self._lock:
+            return self._metrics.get(name)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self):
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def drain(self):
+        """Counter and histogram data recorded since the last drain, then reset."""
+        return {metric.name: metric.drain() for metric in self.metrics() if hasattr(metric, "drain")}
+
+    def merge(self, drained):
+        for name, data in drained.items():
+            metric = self.get(name)
+            if metric is not None and data:
+                metric.merge(data)
+
+METRICS = MetricsRegistry()
+
+# Instruments shared by the fetch path, the bot and the outbox
+STAGE_SECONDS = METRICS.histogram(
+    "flipkart_stage_seconds",
+    "Time spent per pipeline stage (browser_launch, navigate, ready_wait, http_get, parse, "
+    "storage_write, telegram_send, add_product, check)",
+    ("stage",))
+FETCH_SECONDS = METRICS.histogram("flipkart_fetch_seconds", "Product page fetch time by final tier", ("tier",))
+FETCH_OUTCOMES = METRICS.counter("flipkart_fetch_outcomes_total", "Product page fetches by tier and outcome",
+                                 ("tier", "outcome"))
+BROWSER_LAUNCHES = METRICS.counter("flipkart_browser_launches_total", "Chrome webdrivers launched")
+CYCLE_SECONDS = METRICS.histogram("flipkart_check_cycle_seconds", "Duration of a full check_prices sweep")
+
+# ==============================
+# HTTP ENDPOINT
+# ==============================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(registry=METRICS, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics on a daemon thread; returns the server, or None if disabled or the port is taken."""
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Metrics available at http://%s:%s/metrics", host, port)
+    return server
+
+# ==============================
+# SUMMARY
+# ==============================
+
+def _ms(seconds):
+    return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+def summary_text(registry=METRICS):
+    """Short plain-text digest of latencies and counters for the /stats command."""
+    lines = []
+    for metric in registry.metrics():
+        if isinstance(metric, Histogram):
+            for labels, (counts, total) in sorted(metric.snapshot().items()):
+                count = sum(counts)
+                name = metric.name.replace("flipkart_", "") + (f"[{','.join(labels)}]" if labels else "")
+                lines.append(f"{name}: n={count} avg={_ms(total / count)}ms "
+                             f"p50={_ms(metric.quantile(0.5, labels))}ms p95={_ms(metric.quantile(0.95, labels))}ms")
+        else:
+            values = metric.values()
+            for labels, value in sorted(values.items()):
+                name = metric.name.replace("flipkart_", "") + (f"[{','.join(map(str, labels))}]" if labels else "")
+                lines.append(f"{name}: {round(value, 2) if isinstance(value, float) else value}")
+    return "\n".join(lines) or "No metrics recorded yet"
@@ -0,0 +1,224 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import httpx
+
+from scheduler import TokenBucket
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Telegram allows about 30 messages per second overall and 1 per second per chat
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_SENDERS = int(os.getenv("OUTBOX_SENDERS", "8"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# ==============================
+# OUTBOX
+# ==============================
+
+class Outbox:
+    """Single persistent queue for every outgoing Telegram message.
+
+    enqueue() is thread-safe and returns immediately after the message is
+    written to storage. Sender coroutines run on a private event loop in a
+    background thread, share one keep-alive HTTP client and respect the
+    global and per-chat token buckets. 429 and 5xx responses are retried
+    with backoff; anything still in storage at startup is re-sent.
+
+    Messages wait in a per-chat line and a chat is only handed to a sender
+    once its bucket has a token, so a busy chat or a message backing off
+    never holds a sender while other chats have messages ready. Each chat
+    gets its messages in order.
+    """
+
+    def __init__(self, token, storage, senders=OUTBOX_SENDERS,
+                 global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.storage = storage
+        self.senders = senders
+        self.chat_rate = chat_rate
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._paused_until = 0.0
+        self._loop = None
+        # {chat_id: deque of messages}; the head is being sent or waiting for its turn
+        self._chats = {}
+        # Chats whose head message may be sent now
+        self._due = None
+        self._pending = 0
+        self._ready = threading.Event()
+        self._accepting = False
+        self._accept_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    # ------------------------------
+    # Producer side
+    # ------------------------------
+
+    def enqueue(self, chat_id, text, parse_mode=None):
+        """Persist a message and hand it to the sender loop."""
+        with self._accept_lock:
+            message_id = self.storage.outbox_add(chat_id, text, parse_mode)
+            # Before start() the message waits in storage and is picked up there
+            if self._accepting:
+                message = {"id": message_id, "chat_id": chat_id, "text": text,
+                           "parse_mode": parse_mode, "attempts": 0}
+                self._loop.call_soon_threadsafe(self._add, message)
+        return message_id
+
+    def depth(self):
+        return self._pending
+
+    # ------------------------------
+    # Sender side
+    # ------------------------------
+
+    def start(self):
+        """Start the sender loop thread and re-queue undelivered messages."""
+        thread = threading.Thread(target=self._run, name="telegram-outbox", daemon=True)
+        thread.start()
+        self._ready.wait()
+        with self._accept_lock:
+            pending = self.storage.outbox_pending()
+            for message in pending:
+                self._loop.call_soon_threadsafe(self._add, message)
+            self._accepting = True
+        if pending:
+            logger.info("Re-queued %s undelivered messages", len(pending))
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._due = asyncio.Queue()
+        self._ready.set()
+        self._loop.run_until_complete(self._serve())
+
+    async def _serve(self):
+        limits = httpx.Limits(max_connections=self.senders, max_keepalive_connections=self.senders)
+        async with httpx.AsyncClient(timeout=15, limits=limits) as client:
+            await asyncio.gather(*(self._sender(client) for _ in range(self.senders)))
+
+    async def _take(self, bucket):
+        while True:
+            wait = bucket.try_take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    def _add(self, message):
+        """Put a message at the back of its chat's line (runs on the sender loop)."""
+        self._pending += 1
+        line = self._chats.get(message["chat_id"])
+        if line is not None:
+            line.append(message)
+            return
+        self._chats[message["chat_id"]] = deque([message])
+        self._schedule(message["chat_id"])
+
+    def _schedule(self, chat_id):
+        """Hand a chat to the senders once its bucket has a token, without holding a sender meanwhile."""
+        wait = self._chat_bucket(chat_id).try_take()
+        if wait > 0:
+            self._loop.call_later(wait, self._schedule, chat_id)
+        else:
+            self._due.put_nowait(chat_id)
+
+    async def _sender(self, client):
+        while True:
+            chat_id = await self._due.get()
+            line = self._chats[chat_id]
+            message = line[0]
+            retry_in = None
+            try:
+                retry_in = await self._deliver(client, message)
+            except Exception:
+                logger.exception("Outbox sender error")
+            if retry_in is not None:
+                # The message stays at the head so later ones for this chat keep their order
+                self._loop.call_later(retry_in, self._schedule, chat_id)
+                continue
+            line.popleft()
+            self._pending -= 1
+            if line:
+                self._schedule(chat_id)
+            else:
+                del self._chats[chat_id]
+
+    async def _deliver(self, client, message):
+        """One send attempt; returns seconds until the next attempt, or None when the message is done."""
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self._take(self.global_bucket)
+
+        parse_mode = message.get("parse_mode")
+        payload = {"chat_id": message["chat_id"], "text": message["text"]}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+
+        retry_after = None
+        try:
+            with STAGE_SECONDS.time("telegram_send"):
+                response = await client.post(self.url, data=payload)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            logger.debug("Outbox network error: %s: %s", type(e).__name__, e)
+            status = None
+
+        if status == 200:
+            self.storage.outbox_delete(message["id"])
+            self.sent += 1
+            return None
+        if status == 400 and parse_mode:
+            # Same fallback as before: retry once without Markdown
+            logger.debug("Markdown rejected, resending as plain text")
+            message["parse_mode"] = None
+            return 0
+        if status is not None and status not in RETRY_STATUS_CODES:
+            logger.error("Telegram rejected message: %s %s", status, response.text[:200],
+                         extra={"chat_id": message["chat_id"]})
+            self.storage.outbox_delete(message["id"])
+            self.failed += 1
+            return None
+
+        if status == 429:
+            try:
+                retry_after = float(response.json().get("parameters", {}).get("retry_after", 1))
+            except ValueError:
+                retry_after = 1.0
+            # A 429 applies to the whole bot, so pause every sender
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+        # Attempts restart per process run; the stored count is only informational
+        attempt = message["tries"] = message.get("tries", 0) + 1
+        self.storage.outbox_attempted(message["id"])
+        if attempt >= OUTBOX_MAX_ATTEMPTS:
+            # Leave it in storage; it will be retried after the next restart
+            logger.error("Giving up on message %s after %s attempts", message["id"], attempt,
+                         extra={"chat_id": message["chat_id"]})
+            self.failed += 1
+            return None
+        return retry_after if retry_after is not None else min(60, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def stats(self):
+        return {"queued": self.depth(), "sent": self.sent, "failed": self.failed}
@@ -0,0 +1,142 @@
+import re
+import json
+import html as html_lib
+
+# ==============================
+# PATTERNS
+# ==============================
+
+# Each pattern is a linear pre-scan over the raw page source; no DOM is built
+JSON_LD_PATTERN = re.compile(
+    r'<script[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Price fields found in the initial-state blob Flipkart embeds for hydration
+STATE_PRICE_PATTERN = re.compile(r'"(?:finalPrice|sellingPrice)"\s*:\s*\{[^{}]*?"value"\s*:\s*([0-9]+)')
+STATE_MRP_PATTERN = re.compile(r'"mrp"\s*:\s*\{[^{}]*?"value"\s*:\s*([0-9]+)')
+
+META_TAG_PATTERN = re.compile(r'<meta\s[^>]*>', re.IGNORECASE)
+META_ATTR_PATTERN = re.compile(r'([a-zA-Z:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+CANONICAL_PATTERN = re.compile(
+    r'<link\s[^>]*rel\s*=\s*["\']canonical["\'][^>]*href\s*=\s*["\']([^"\']+)["\']'
+    r'|<link\s[^>]*href\s*=\s*["\']([^"\']+)["\'][^>]*rel\s*=\s*["\']canonical["\']',
+    re.IGNORECASE,
+)
+
+# Stripped before scanning for stock markers so script payloads don't match
+NON_VISIBLE_PATTERN = re.compile(r'<(script|style|noscript)[^>]*>.*?</\1>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+PRICE_META_KEYS = ("product:price:amount", "og:price:amount", "price")
+TITLE_META_KEYS = ("og:title", "twitter:title")
+
+# ==============================
+# EXTRACTORS
+# ==============================
+
+def _to_int(value):
+    try:
+        return int(float(str(value).replace(",", "").replace("₹", "").strip()))
+    except (TypeError, ValueError):
+        return None
+
+def _iter_json_ld(page):
+    for match in JSON_LD_PATTERN.finditer(page):
+        try:
+            payload = json.loads(match.group(1).strip())
+        except ValueError:
+            continue
+        stack = [payload]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, dict):
+                if "@graph" in node:
+                    stack.append(node["@graph"])
+                yield node
+
+def _from_json_ld(page, data):
+    for node in _iter_json_ld(page):
+        node_type = node.get("@type")
+        if node_type != "Product" and not (isinstance(node_type, list) and "Product" in node_type):
+            continue
+        if node.get("name") and not data.get("title"):
+            data["title"] = str(node["name"]).strip()[:100]
+        offers = node.get("offers")
+        if isinstance(offers, list):
+            offers = offers[0] if offers else None
+        if not isinstance(offers, dict):
+            continue
+        price = _to_int(offers.get("price", offers.get("lowPrice")))
+        if price is None:
+            continue
+        data["price"] = price
+        availability = str(offers.get("availability", ""))
+        if availability:
+            data["in_stock"] = availability.endswith("InStock")
+        seller = offers.get("seller")
+        if isinstance(seller, dict) and seller.get("name"):
+            data["seller"] = seller["name"]
+        return True
+    return False
+
+def _meta_tags(page):
+    """{property or name: content} for every meta tag in the page."""
+    tags = {}
+    for tag in META_TAG_PATTERN.finditer(page):
+        attrs = {name.lower(): a if a is not None else b for name, a, b in META_ATTR_PATTERN.findall(tag.group(0))}
+        key = (attrs.get("property") or attrs.get("name") or attrs.get("itemprop") or "").lower()
+        if key and "content" in attrs and key not in tags:
+            tags[key] = html_lib.unescape(attrs["content"])
+    return tags
+
+def visible_text(page):
+    """Rough lowercase visible text of a page, without parsing it."""
+    return html_lib.unescape(TAG_PATTERN.sub(" ", NON_VISIBLE_PATTERN.sub(" ", page))).lower()
+
+def extract_embedded(page):
+    """Read product fields from structured data embedded in raw page source.
+
+    Works the same on HTTP responses and on driver.page_source. Sources are
+    tried in order of reliability: JSON-LD offers, the initial-state blob,
+    then meta tags. Returns a dict with whatever was found plus 'via', the
+    source that supplied the price (None when no price was found).
+    """
+    data = {"via": None}
+    if not page:
+        return data
+
+    if _from_json_ld(page, data):
+        data["via"] = "json_ld"
+
+    if data.get("price") is None:
+        match = STATE_PRICE_PATTERN.search(page)
+        if match:
+            data["price"] = int(match.group(1))
+            data["via"] = "state"
+    match = STATE_MRP_PATTERN.search(page)
+    if match:
+        data["mrp"] = int(match.group(1))
+
+    meta = _meta_tags(page)
+    if data.get("price") is None:
+        for key in PRICE_META_KEYS:
+            price = _to_int(meta.get(key))
+            if price is not None:
+                data["price"] = price
+                data["via"] = "meta"
+                break
+    if not data.get("title"):
+        for key in TITLE_META_KEYS:
+            if meta.get(key):
+                data["title"] = meta[key].strip()[:100]
+                break
+
+    match = CANONICAL_PATTERN.search(page)
+    if match:
+        data["canonical_url"] = html_lib.unescape(match.group(1) or match.group(2))
+    elif meta.get("og:url"):
+        data["canonical_url"] = meta["og:url"]
+    return data
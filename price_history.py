@@ -0,0 +1,191 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Points per raw segment before a new one is started
+HISTORY_SEGMENT_POINTS = int(os.getenv("HISTORY_SEGMENT_POINTS", "256"))
+
+# Retention policy: raw points, then hourly minima, then daily minima, then dropped
+HISTORY_RAW_DAYS = int(os.getenv("HISTORY_RAW_DAYS", "30"))
+HISTORY_HOURLY_DAYS = int(os.getenv("HISTORY_HOURLY_DAYS", "180"))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "730"))
+
+DAY = 86400
+HOUR = 3600
+
+# ==============================
+# ENCODING
+# ==============================
+
+def _encode_varint(value, out):
+    """Append a zigzag-encoded signed varint to a bytearray."""
+    value = (value << 1) ^ (value >> 63)
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_varints(blob):
+    values = []
+    shift = result = 0
+    for byte in blob:
+        result |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((result >> 1) ^ -(result & 1))
+        shift = result = 0
+    return values
+
+def _delta_encode(values, previous=0):
+    out = bytearray()
+    for value in values:
+        _encode_varint(value - previous, out)
+        previous = value
+    return bytes(out)
+
+def _delta_decode(blob):
+    values = []
+    previous = 0
+    for delta in _decode_varints(blob):
+        previous += delta
+        values.append(previous)
+    return values
+
+# ==============================
+# PRICE HISTORY
+# ==============================
+
+class PriceHistory:
+    """Append-only per-product price series stored as delta-encoded segments.
+
+    Each segment row holds two varint blobs (timestamps and prices, both
+    delta-encoded) so a point usually costs 3-5 bytes. Appends extend the
+    open segment's blobs in place, which keeps every write a single-row
+    UPDATE and loses nothing on a crash.
+    """
+
+    def __init__(self, storage, segment_points=HISTORY_SEGMENT_POINTS):
+        self.storage = storage
+        self.segment_points = segment_points
+        self._lock = threading.Lock()
+
+    def append(self, product_key, price, ts=None):
+        """Record one successful check."""
+        ts = int(ts if ts is not None else time.time())
+        conn = self.storage.connection()
+        with self._lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, end_ts, count, last_price FROM price_history "
+                "WHERE product_key = ? AND resolution = 0 ORDER BY end_ts DESC LIMIT 1",
+                (product_key,),
+            ).fetchone()
+            if row is not None and row["count"] < self.segment_points and ts >= row["end_ts"]:
+                conn.execute(
+                    # || yields TEXT in SQLite, so cast the concatenation back to a blob
+                    "UPDATE price_history SET ts_blob = CAST(ts_blob || ? AS BLOB), "
+                    "price_blob = CAST(price_blob || ? AS BLOB), "
+                    "end_ts = ?, count = count + 1, last_price = ? WHERE id = ?",
+                    (_delta_encode([ts], row["end_ts"]), _delta_encode([price], row["last_price"]),
+                     ts, price, row["id"]),
+                )
+            else:
+                self._insert_segment(conn, product_key, 0, [ts], [price])
+
+    def _insert_segment(self, conn, product_key, resolution, timestamps, prices):
+        conn.execute(
+            "INSERT INTO price_history (product_key, resolution, start_ts, end_ts, count, last_price, "
+            "ts_blob, price_blob) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (product_key, resolution, timestamps[0], timestamps[-1], len(timestamps), prices[-1],
+             _delta_encode(timestamps), _delta_encode(prices)),
+        )
+
+    def points(self, product_key, since=None, until=None):
+        """(timestamp, price) pairs in [since, until], oldest first."""
+        since = since if since is not None else 0
+        until = until if until is not None else int(time.time()) + 1
+        rows = self.storage.connection().execute(
+            "SELECT ts_blob, price_blob FROM price_history "
+            "WHERE product_key = ? AND end_ts >= ? AND start_ts <= ? ORDER BY start_ts",
+            (product_key, since, until),
+        ).fetchall()
+        result = []
+        for row in rows:
+            for ts, price in zip(_delta_decode(row["ts_blob"]), _delta_decode(row["price_blob"])):
+                if since <= ts <= until:
+                    result.append((ts, price))
+        result.sort()
+        return result
+
+    def last_days(self, product_key, days):
+        return self.points(product_key, since=int(time.time()) - days * DAY)
+
+    def stats(self, product_key, days=30):
+        """Min, max, average, first and last price over the last `days` days."""
+        prices = [price for _, price in self.last_days(product_key, days)]
+        if not prices:
+            return None
+        return {
+            "count": len(prices),
+            "min": min(prices),
+            "max": max(prices),
+            "avg": sum(prices) / len(prices),
+            "first": prices[0],
+            "last": prices[-1],
+        }
+
+    # ------------------------------
+    # Retention
+    # ------------------------------
+
+    def _downsample(self, conn, source_resolution, target_resolution, older_than):
+        """Fold closed segments older than a cutoff into per-bucket minimum prices."""
+        rows = conn.execute(
+            "SELECT id, product_key, ts_blob, price_blob FROM price_history "
+            "WHERE resolution = ? AND end_ts < ? ORDER BY product_key, start_ts",
+            (source_resolution, older_than),
+        ).fetchall()
+        if not rows:
+            return 0
+
+        buckets = {}
+        for row in rows:
+            series = buckets.setdefault(row["product_key"], {})
+            for ts, price in zip(_delta_decode(row["ts_blob"]), _delta_decode(row["price_blob"])):
+                bucket = ts - ts % target_resolution
+                if bucket not in series or price < series[bucket]:
+                    series[bucket] = price
+
+        conn.executemany("DELETE FROM price_history WHERE id = ?", [(row["id"],) for row in rows])
+        for product_key, series in buckets.items():
+            ordered = sorted(series.items())
+            for start in range(0, len(ordered), self.segment_points):
+                chunk = ordered[start:start + self.segment_points]
+                self._insert_segment(conn, product_key, target_resolution,
+                                     [ts for ts, _ in chunk], [price for _, price in chunk])
+        return len(rows)
+
+    def compact(self, raw_days=HISTORY_RAW_DAYS, hourly_days=HISTORY_HOURLY_DAYS,
+                retention_days=HISTORY_RETENTION_DAYS):
+        """Apply the retention policy so disk use stays bounded."""
+        now = int(time.time())
+        conn = self.storage.connection()
+        with self._lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            raw = self._downsample(conn, 0, HOUR, now - raw_days * DAY)
+            hourly = self._downsample(conn, HOUR, DAY, now - hourly_days * DAY)
+            dropped = conn.execute(
+                "DELETE FROM price_history WHERE end_ts < ?", (now - retention_days * DAY,)
+            ).rowcount
+        if raw or hourly or dropped:
+            logger.info("History compacted: %s raw and %s hourly segments downsampled, %s dropped",
+                        raw, hourly, dropped)
+        return raw, hourly, dropped
@@ -0,0 +1,567 @@
+import os
+import re
+import time
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+
+from bs4 import BeautifulSoup
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+
+from browser_pool import get_driver_pool, page_metrics
+from http_client import get_shared_session, get_random_headers, HTTP_RETRIES, HTTP_BACKOFF_FACTOR
+from page_data import extract_embedded, visible_text
+from selector_stats import SELECTOR_STATS
+from check_engine import OUTCOME_OK, OUTCOME_NOT_FOUND, OUTCOME_BLOCKED, OUTCOME_ERROR
+from metrics import STAGE_SECONDS, FETCH_SECONDS, FETCH_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+# Try a plain HTTP GET before launching a browser
+HTTP_FIRST = os.getenv("HTTP_FIRST", "1") != "0"
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+# Longest one HTTP-tier fetch can take: every attempt hitting both its connect
+# and read timeout, plus the session's retry backoff (0, 2, 4 s by default)
+HTTP_TIER_BUDGET = ((HTTP_RETRIES + 1) * 2 * HTTP_TIMEOUT
+                    + sum(HTTP_BACKOFF_FACTOR * 2 ** (retry - 1) for retry in range(2, HTTP_RETRIES + 1)))
+# Escalate HTTP misses to a browser; 0 for HTTP-only hosts without Chrome
+BROWSER_FALLBACK = os.getenv("BROWSER_FALLBACK", "1") != "0"
+
+# Overall budget for one browser fetch: navigation plus readiness wait
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", "20"))
+READINESS_POLL = 0.2
+
+# ==============================
+# SELECTORS
+# ==============================
+
+PRICE_SELECTORS = [
+    ".Nx9bqj.CxhGGd",
+    "._30jeq3._16Jk6d",
+    "._1_WHN1",
+    ".CEmiEU .Nx9bqj",
+    "._25b18c",
+]
+
+MRP_SELECTORS = [
+    ".yRaY8j.A6\\+E6v",
+    ".yRaY8j",
+    "._3I9_wc._2p6lqe",
+]
+
+TITLE_SELECTORS = [
+    "h1.yhB1nd",
+    "h1._35KyD6",
+    ".B_NuCI",
+    "span.B_NuCI",
+    "h1",
+    "[data-testid='product-title']",
+]
+
+SELLER_SELECTORS = [
+    "#sellerName span span",
+    "#sellerName span",
+]
+
+OUT_OF_STOCK_MARKERS = ["sold out", "currently unavailable", "coming soon"]
+
+INVALID_PAGE_MARKERS = ["404", "not found", "error"]
+
+BLOCK_STATUS_CODES = {403, 429, 503, 529}
+
+BLOCK_PAGE_MARKERS = [
+    "captcha",
+    "are you a human",
+    "access denied",
+    "unusual traffic",
+    "request blocked",
+]
+
+# ==============================
+# SNAPSHOT
+# ==============================
+
+@dataclass
+class ProductSnapshot:
+    """Everything we read from a single load of a product page."""
+    url: str
+    canonical_url: str = None
+    price: int = None
+    mrp: int = None
+    title: str = None
+    in_stock: bool = None
+    seller: str = None
+    source: str = None
+    blocked: bool = False
+    not_found: bool = False
+    fetched_at: float = field(default_factory=time.time)
+
+    def to_dict(self):
+        return asdict(self)
+
+def parse_price(text):
+    """Extract an integer rupee amount from text such as '₹51,999'."""
+    if not text:
+        return None
+    match = re.search(r'₹?[\s]*([0-9][0-9,]*)', text)
+    if not match:
+        return None
+    try:
+        return int(match.group(1).replace(',', ''))
+    except ValueError:
+        return None
+
+def _ranked_lookup(page_type, field, selectors, read):
+    """Try selectors best-first by past performance, recording each hit or miss.
+
+    `read(selector)` returns the value or None; the first value found wins.
+    """
+    for selector in SELECTOR_STATS.ranked(page_type, field, selectors):
+        started = time.perf_counter()
+        try:
+            value = read(selector)
+        except NoSuchElementException:
+            value = None
+        except Exception as e:
+            logger.debug("Error reading %s: %s", selector, e)
+            value = None
+        SELECTOR_STATS.record(page_type, field, selector, value is not None, time.perf_counter() - started)
+        if value is not None:
+            return value
+    return None
+
+def _first_text(driver, field, selectors):
+    """Return the first non-empty text among the given selectors."""
+    def read(selector):
+        for element in driver.find_elements(By.CSS_SELECTOR, selector):
+            text = element.text.strip()
+            if text:
+                return text
+        return None
+    return _ranked_lookup("browser", field, selectors, read)
+
+def _read_price(driver):
+    """Parse the price from the first matching selector; the page is already ready."""
+    def read(selector):
+        for element in driver.find_elements(By.CSS_SELECTOR, selector):
+            price = parse_price(element.text.strip())
+            if price is not None:
+                return price
+        return None
+    price = _ranked_lookup("browser", "price", PRICE_SELECTORS, read)
+    if price is not None:
+        logger.debug("Extracted price: ₹%s", price)
+    return price
+
+def _read_canonical_url(driver):
+    try:
+        link = driver.find_element(By.CSS_SELECTOR, "link[rel='canonical']")
+        href = link.get_attribute("href")
+        if href:
+            return href
+    except Exception:
+        pass
+    return driver.current_url
+
+def _read_in_stock(driver, price):
+    try:
+        body_text = driver.find_element(By.TAG_NAME, "body").text.lower()
+    except Exception:
+        return price is not None
+    if any(marker in body_text for marker in OUT_OF_STOCK_MARKERS):
+        return False
+    return price is not None
+
+# ==============================
+# READINESS
+# ==============================
+
+# Evaluated in the page on every poll; returns the first outcome that applies
+READINESS_SCRIPT = """
+const [priceSelectors, blockMarkers, notFoundMarkers] = arguments;
+for (const selector of priceSelectors) {
+    const el = document.querySelector(selector);
+    if (el && el.textContent.trim()) return 'price';
+}
+const title = (document.title || '').toLowerCase();
+if (blockMarkers.some(m => title.includes(m))) return 'blocked';
+if (document.querySelector("iframe[src*='captcha'], .g-recaptcha, #captcha")) return 'blocked';
+const body = document.body;
+// Block and error pages are small, so only scan short bodies for markers
+if (body && body.textContent.length < 20000) {
+    const text = body.textContent.toLowerCase();
+    if (blockMarkers.some(m => text.includes(m))) return 'blocked';
+}
+if (notFoundMarkers.some(m => title.includes(m))) return 'not_found';
+if (document.readyState === 'complete') return 'loaded';
+return null;
+"""
+
+def wait_for_page_ready(driver, timeout):
+    """Wait for whichever comes first: a price, a block/CAPTCHA page, a 404, or a full load.
+
+    Returns 'price', 'blocked', 'not_found', 'loaded' or 'timeout'. A miss
+    costs at most one timeout rather than one per selector.
+    """
+    def condition(d):
+        return d.execute_script(READINESS_SCRIPT, PRICE_SELECTORS, BLOCK_PAGE_MARKERS + ["blocked"],
+                                ["404", "not found", "page not found"])
+    try:
+        return WebDriverWait(driver, max(timeout, READINESS_POLL), poll_frequency=READINESS_POLL).until(condition)
+    except TimeoutException:
+        return "timeout"
+
+# ==============================
+# EMBEDDED DATA
+# ==============================
+
+EXTRACT_STATS = {"embedded": 0, "selectors": 0, "embedded_seconds": 0.0}
+EXTRACT_STATS_LOCK = threading.Lock()
+
+def apply_embedded_data(snapshot, page):
+    """Fill a snapshot from structured data in raw page source; True if it yielded a price.
+
+    Fields already set on the snapshot are kept. A miss leaves the partial
+    fields in place for the selector fallback to complete.
+    """
+    started = time.perf_counter()
+    data = extract_embedded(page)
+    for name in ("price", "mrp", "title", "seller", "canonical_url", "in_stock"):
+        if data.get(name) is not None and getattr(snapshot, name) is None:
+            setattr(snapshot, name, data[name])
+    hit = snapshot.price is not None
+    if hit and snapshot.in_stock is None:
+        text = visible_text(page)
+        snapshot.in_stock = not any(marker in text for marker in OUT_OF_STOCK_MARKERS)
+    elapsed = time.perf_counter() - started
+
+    with EXTRACT_STATS_LOCK:
+        EXTRACT_STATS["embedded" if hit else "selectors"] += 1
+        EXTRACT_STATS["embedded_seconds"] += elapsed
+    if hit:
+        logger.debug("Read price from embedded %s data in %.1f ms", data["via"], elapsed * 1000)
+    return hit
+
+def extract_stats():
+    """How often embedded data sufficed versus falling back to selectors."""
+    with EXTRACT_STATS_LOCK:
+        attempts = EXTRACT_STATS["embedded"] + EXTRACT_STATS["selectors"]
+        return dict(
+            EXTRACT_STATS,
+            embedded_rate=EXTRACT_STATS["embedded"] / attempts if attempts else 0.0,
+            avg_ms=EXTRACT_STATS["embedded_seconds"] * 1000 / attempts if attempts else 0.0,
+        )
+
+BROWSER_PAGE_STATS = {"pages": 0, "bytes": 0, "seconds": 0.0}
+BROWSER_PAGE_STATS_LOCK = threading.Lock()
+
+def _record_page(transferred, seconds):
+    with BROWSER_PAGE_STATS_LOCK:
+        BROWSER_PAGE_STATS["pages"] += 1
+        BROWSER_PAGE_STATS["bytes"] += transferred
+        BROWSER_PAGE_STATS["seconds"] += seconds
+
+def browser_page_stats():
+    """Totals and per-page averages of bytes transferred and navigation time."""
+    with BROWSER_PAGE_STATS_LOCK:
+        pages = BROWSER_PAGE_STATS["pages"]
+        return dict(
+            BROWSER_PAGE_STATS,
+            avg_bytes=BROWSER_PAGE_STATS["bytes"] / pages if pages else 0,
+            avg_seconds=BROWSER_PAGE_STATS["seconds"] / pages if pages else 0.0,
+        )
+
+def _read_loaded_page(driver, snapshot, product_link):
+    """Fill a snapshot from a page that is ready: embedded data first, then selectors."""
+    try:
+        page = driver.page_source
+    except WebDriverException:
+        page = ""
+    if apply_embedded_data(snapshot, page):
+        return
+
+    snapshot.price = _read_price(driver)
+    snapshot.canonical_url = snapshot.canonical_url or _read_canonical_url(driver)
+
+    if not snapshot.title:
+        title = _first_text(driver, "title", TITLE_SELECTORS)
+        snapshot.title = title[:100] if title else None
+    if snapshot.mrp is None:
+        snapshot.mrp = parse_price(_first_text(driver, "mrp", MRP_SELECTORS))
+    if not snapshot.seller:
+        snapshot.seller = _first_text(driver, "seller", SELLER_SELECTORS)
+    snapshot.in_stock = _read_in_stock(driver, snapshot.price)
+
+    if snapshot.price is None:
+        logger.warning("Could not find price with any selector", extra={"url": product_link})
+        try:
+            page_title = driver.title
+            logger.debug("Page title: %s", page_title)
+            if any(keyword in page_title.lower() for keyword in BLOCK_PAGE_MARKERS + ["blocked"]):
+                logger.warning("Page blocked or CAPTCHA detected", extra={"url": product_link})
+                snapshot.blocked = True
+            elif any(keyword in page_title.lower() for keyword in INVALID_PAGE_MARKERS):
+                logger.warning("Invalid page detected", extra={"url": product_link})
+                snapshot.not_found = True
+            else:
+                logger.debug("Valid page but price not found")
+        except Exception as e:
+            logger.debug("Error checking page: %s", e)
+
+def fetch_snapshot_browser(product_link):
+    """Load a product page once in a pooled browser and read everything we need from it."""
+    logger.debug("Fetching product snapshot in browser for: %s", product_link)
+
+    snapshot = ProductSnapshot(url=product_link, source="browser")
+    pool = get_driver_pool()
+    pooled = None
+    broken = False
+    try:
+        pooled = pool.checkout()
+        driver = pooled.driver
+
+        nav_started = time.monotonic()
+        deadline = nav_started + FETCH_DEADLINE
+        driver.set_page_load_timeout(FETCH_DEADLINE)
+        try:
+            driver.get(product_link)
+        except TimeoutException:
+            # Whatever has rendered so far may already hold the price
+            logger.debug("Navigation hit the fetch deadline")
+        nav_seconds = time.monotonic() - nav_started
+        STAGE_SECONDS.observe(nav_seconds, "navigate")
+
+        with STAGE_SECONDS.time("ready_wait"):
+            readiness = wait_for_page_ready(driver, deadline - time.monotonic())
+        logger.debug("Page ready (%s) after %.2fs", readiness, time.monotonic() - nav_started)
+
+        metrics = page_metrics(driver)
+        _record_page(metrics.get("bytes", 0), nav_seconds)
+        logger.debug("Page took %.2fs, %.0f KB over %s resources",
+                     nav_seconds, metrics.get("bytes", 0) / 1024, metrics.get("resources", 0))
+
+        if readiness == "blocked":
+            logger.warning("Page blocked or CAPTCHA detected", extra={"url": product_link})
+            snapshot.blocked = True
+            return snapshot
+        if readiness == "not_found":
+            logger.warning("Invalid page detected", extra={"url": product_link})
+            snapshot.not_found = True
+            return snapshot
+
+        with STAGE_SECONDS.time("parse"):
+            _read_loaded_page(driver, snapshot, product_link)
+        return snapshot
+
+    except WebDriverException as e:
+        logger.error("WebDriver error: %s", e, extra={"url": product_link})
+        broken = not pooled or not pooled.is_healthy()
+        return snapshot
+    except Exception:
+        logger.exception("Unexpected error in browser fetch", extra={"url": product_link})
+        return snapshot
+
+    finally:
+        if pooled:
+            pool.checkin(pooled, broken=broken)
+
+# ==============================
+# HTTP TIER
+# ==============================
+
+def _soup_text(soup, field, selectors):
+    def read(selector):
+        tag = soup.select_one(selector)
+        return (tag.get_text(strip=True) or None) if tag else None
+    return _ranked_lookup("http", field, selectors, read)
+
+def is_block_page(status_code, html):
+    """Detect anti-bot responses that a browser might still get past.
+
+    Like READINESS_SCRIPT, markers are only matched in the page title and in
+    short bodies: a full product page can mention "captcha" in its scripts.
+    """
+    if status_code in BLOCK_STATUS_CODES:
+        return True
+    html = html or ""
+    title = re.search(r"<title[^>]*>(.*?)</title>", html, re.IGNORECASE | re.DOTALL)
+    if title and any(marker in title.group(1).lower() for marker in BLOCK_PAGE_MARKERS + ["blocked"]):
+        return True
+    # Block and error pages are small
+    return len(html) < 20000 and any(marker in html.lower() for marker in BLOCK_PAGE_MARKERS)
+
+def parse_product_html(html, url):
+    """Build a snapshot from server-rendered product HTML.
+
+    Embedded structured data is read first; the page is only parsed into a
+    DOM for selector scraping when that yields no price.
+    """
+    snapshot = ProductSnapshot(url=url, source="http")
+    if apply_embedded_data(snapshot, html):
+        return snapshot
+
+    soup = BeautifulSoup(html, "html.parser")
+    def read_price(selector):
+        tag = soup.select_one(selector)
+        return parse_price(tag.get_text(strip=True)) if tag else None
+    snapshot.price = _ranked_lookup("http", "price", PRICE_SELECTORS, read_price)
+
+    if not snapshot.title:
+        title = _soup_text(soup, "title", TITLE_SELECTORS)
+        snapshot.title = title[:100] if title else None
+    if snapshot.mrp is None:
+        snapshot.mrp = parse_price(_soup_text(soup, "mrp", MRP_SELECTORS))
+    if not snapshot.seller:
+        snapshot.seller = _soup_text(soup, "seller", SELLER_SELECTORS)
+
+    canonical = soup.find("link", rel="canonical")
+    if canonical and canonical.get("href") and not snapshot.canonical_url:
+        snapshot.canonical_url = canonical["href"]
+
+    if snapshot.in_stock is None:
+        page_text = soup.get_text(" ", strip=True).lower()
+        snapshot.in_stock = snapshot.price is not None and not any(
+            marker in page_text for marker in OUT_OF_STOCK_MARKERS
+        )
+    return snapshot
+
+def fetch_snapshot_http(product_link):
+    """Fetch a product page over pooled HTTP and parse it without a browser."""
+    logger.debug("Fetching product snapshot over HTTP for: %s", product_link)
+    try:
+        with STAGE_SECONDS.time("http_get"):
+            response = get_shared_session().get(product_link, headers=get_random_headers(), timeout=HTTP_TIMEOUT)
+    except Exception as e:
+        logger.debug("HTTP fetch failed: %s: %s", type(e).__name__, e)
+        return ProductSnapshot(url=product_link, source="http")
+    return snapshot_from_response(product_link, response.status_code, response.text, response.url)
+
+def snapshot_from_response(product_link, status_code, html, final_url):
+    """Turn a fetched product page into a snapshot; shared by the blocking and asyncio clients."""
+    if status_code in BLOCK_STATUS_CODES:
+        logger.debug("Block page detected over HTTP (status %s)", status_code)
+        return ProductSnapshot(url=product_link, source="http", blocked=True)
+    if status_code != 200:
+        logger.debug("HTTP fetch returned status %s", status_code)
+        return ProductSnapshot(url=product_link, source="http", not_found=status_code in (404, 410))
+
+    with STAGE_SECONDS.time("parse"):
+        snapshot = parse_product_html(html, product_link)
+    # A page that yielded a price is never a block page, whatever its scripts mention
+    if snapshot.price is None and is_block_page(status_code, html):
+        logger.debug("Block page detected over HTTP (status %s)", status_code)
+        return ProductSnapshot(url=product_link, source="http", blocked=True)
+    if not snapshot.canonical_url:
+        snapshot.canonical_url = final_url
+    return snapshot
+
+# ==============================
+# TIERED FETCH
+# ==============================
+
+TIER_STATS = {tier: {"attempts": 0, "hits": 0} for tier in ("http", "browser")}
+TIER_STATS_LOCK = threading.Lock()
+
+def record_tier(tier, hit):
+    with TIER_STATS_LOCK:
+        TIER_STATS[tier]["attempts"] += 1
+        if hit:
+            TIER_STATS[tier]["hits"] += 1
+
+def tier_stats():
+    """Attempts, hits and hit rate for each fetch tier, plus browser page costs."""
+    with TIER_STATS_LOCK:
+        stats = {
+            tier: dict(counts, hit_rate=counts["hits"] / counts["attempts"] if counts["attempts"] else 0.0)
+            for tier, counts in TIER_STATS.items()
+        }
+    stats["browser_pages"] = browser_page_stats()
+    stats["extract"] = extract_stats()
+    return stats
+
+def drain_fetch_stats():
+    """Tier, extraction, browser page and selector counts since the last drain, then reset.
+
+    Fetch workers send this back with every reply; merge_fetch_stats() adds
+    it to the parent's totals, so nothing is lost when a worker is retired.
+    """
+    with TIER_STATS_LOCK:
+        tiers = {tier: dict(counts) for tier, counts in TIER_STATS.items()}
+        for counts in TIER_STATS.values():
+            counts.update(attempts=0, hits=0)
+    with EXTRACT_STATS_LOCK:
+        extract = dict(EXTRACT_STATS)
+        EXTRACT_STATS.update(embedded=0, selectors=0, embedded_seconds=0.0)
+    with BROWSER_PAGE_STATS_LOCK:
+        pages = dict(BROWSER_PAGE_STATS)
+        BROWSER_PAGE_STATS.update(pages=0, bytes=0, seconds=0.0)
+    return {"tiers": tiers, "extract": extract, "browser_pages": pages, "selectors": SELECTOR_STATS.drain()}
+
+def merge_fetch_stats(drained):
+    """Add counts drained in a fetch worker to this process's stats."""
+    with TIER_STATS_LOCK:
+        for tier, counts in drained.get("tiers", {}).items():
+            for name, value in counts.items():
+                TIER_STATS[tier][name] += value
+    for lock, totals, key in ((EXTRACT_STATS_LOCK, EXTRACT_STATS, "extract"),
+                              (BROWSER_PAGE_STATS_LOCK, BROWSER_PAGE_STATS, "browser_pages")):
+        with lock:
+            for name, value in drained.get(key, {}).items():
+                totals[name] += value
+    SELECTOR_STATS.merge(drained.get("selectors", []))
+
+def classify_snapshot(snapshot):
+    """Map a fetch result to a check_engine outcome for the host circuit breaker."""
+    if snapshot is None:
+        return OUTCOME_ERROR
+    if snapshot.blocked:
+        return OUTCOME_BLOCKED
+    if snapshot.price is not None:
+        return OUTCOME_OK
+    if snapshot.not_found:
+        return OUTCOME_NOT_FOUND
+    return OUTCOME_ERROR
+
+def wants_browser(snapshot):
+    """True when an HTTP-tier miss is worth retrying in a browser."""
+    # A browser would only load the same missing page
+    return snapshot.price is None and not snapshot.not_found and BROWSER_FALLBACK
+
+def record_fetch(snapshot, started):
+    """Record the fetch in the metrics and, at DEBUG, log a structured summary."""
+    elapsed = time.perf_counter() - started
+    outcome = classify_snapshot(snapshot)
+    FETCH_SECONDS.observe(elapsed, snapshot.source)
+    FETCH_OUTCOMES.inc((snapshot.source, outcome))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Fetched product page", extra={
+            "url": snapshot.url, "tier": snapshot.source, "outcome": outcome,
+            "duration_ms": round(elapsed * 1000, 1),
+        })
+
+def fetch_product_snapshot(product_link, http_first=HTTP_FIRST):
+    """Read a product page, trying cheap HTTP first and escalating to the browser.
+
+    http_first=False goes straight to the browser, for callers that already
+    tried the HTTP tier themselves.
+    """
+    started = time.perf_counter()
+    if http_first:
+        snapshot = fetch_snapshot_http(product_link)
+        record_tier("http", snapshot.price is not None)
+        if not wants_browser(snapshot):
+            record_fetch(snapshot, started)
+            return snapshot
+        logger.debug("HTTP tier missed, escalating to browser")
+
+    snapshot = fetch_snapshot_browser(product_link)
+    record_tier("browser", snapshot.price is not None)
+    record_fetch(snapshot, started)
+    return snapshot
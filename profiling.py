@@ -0,0 +1,307 @@
+import io
+import os
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# "sample" sees every thread; "cprofile" traces each profiled check exactly
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "30"))
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "1") != "0"
+# Keep samples of threads parked in a lock/condition/queue wait
+PROFILE_IDLE = os.getenv("PROFILE_IDLE", "0") != "0"
+
+# Profile the first N check_prices cycles, or the first N scheduled checks, after startup
+PROFILE_CYCLES = int(os.getenv("PROFILE_CYCLES", "0"))
+PROFILE_CHECKS = int(os.getenv("PROFILE_CHECKS", "0"))
+
+# Frames that mean a thread is parked rather than working
+IDLE_FILES = ("threading.py", "queue.py")
+
+# ==============================
+# SAMPLING PROFILER
+# ==============================
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """Samples the Python stack of every thread at a fixed interval.
+
+    Stacks are kept in collapsed form ("thread;outer;...;inner" -> count),
+    the input format of flamegraph.pl, speedscope and inferno. The cost is
+    one stack walk per thread per interval, regardless of how much code
+    runs in between.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL, include_idle=PROFILE_IDLE):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if not self.include_idle and os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, n=PROFILE_TOP_N):
+        """Functions by own samples and by samples anywhere on the stack."""
+        own, inclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        total = self.samples or 1
+        lines = [f"{self.samples} samples every {self.interval * 1000:.1f} ms "
+                 f"({self.idle_samples} idle samples {'kept' if self.include_idle else 'dropped'})", "",
+                 f"Top {n} by own time:"]
+        lines += [f"{count:>8} {count * 100 / total:5.1f}%  {frame}" for frame, count in own.most_common(n)]
+        lines += ["", f"Top {n} by total time:"]
+        lines += [f"{count:>8} {count * 100 / total:5.1f}%  {frame}" for frame, count in inclusive.most_common(n)]
+        return "\n".join(lines) + "\n"
+
+# ==============================
+# PROFILE SESSION
+# ==============================
+
+class ProfileSession:
+    """One profiling run: start(), run the work (through wrap() in cprofile mode), stop().
+
+    stop() writes into PROFILE_DIR and returns the paths:
+      sample mode    <name>.collapsed (flame graph input) and <name>-top.txt
+      cprofile mode  <name>.prof (pstats; snakeviz/flameprof) and <name>-top.txt
+      tracemalloc    <name>-alloc.txt, the allocation sites that grew the most
+    """
+
+    def __init__(self, name, mode=PROFILE_MODE, directory=PROFILE_DIR, top_n=PROFILE_TOP_N,
+                 track_allocations=PROFILE_TRACEMALLOC):
+        self.name = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}"
+        self.mode = mode if mode in ("sample", "cprofile") else "sample"
+        self.directory = directory
+        self.top_n = top_n
+        self.track_allocations = track_allocations
+        self._sampler = None
+        self._global_profile = None
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._started_tracemalloc = False
+        self._alloc_start = None
+        self._started_at = None
+
+    def start(self):
+        if self.track_allocations:
+            if not tracemalloc.is_tracing():
+                # Only the allocating line is compared, so one frame is enough
+                tracemalloc.start(1)
+                self._started_tracemalloc = True
+            self._alloc_start = tracemalloc.take_snapshot()
+        if self.mode == "sample":
+            self._sampler = SamplingProfiler()
+            self._sampler.start()
+        elif sys.version_info >= (3, 12):
+            # cProfile sits on sys.monitoring here: one profiler sees every thread,
+            # and a second one cannot be enabled alongside it
+            self._global_profile = cProfile.Profile()
+            self._global_profile.enable()
+        self._started_at = time.monotonic()
+        logger.info("Profiling %s (%s mode)", self.name, self.mode)
+        return self
+
+    def wrap(self, fn, *args, **kwargs):
+        """Call fn; in cprofile mode before 3.12, under a per-thread profiler merged at stop()."""
+        if self.mode != "cprofile" or self._global_profile is not None:
+            return fn(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args, **kwargs)
+        finally:
+            with self._profiles_lock:
+                self._profiles.append(profile)
+
+    def stop(self):
+        elapsed = time.monotonic() - self._started_at
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, self.name)
+        paths = []
+
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler.write_collapsed(f"{base}.collapsed")
+            paths.append(f"{base}.collapsed")
+            summary = self._sampler.top(self.top_n)
+        else:
+            with self._profiles_lock:
+                profiles, self._profiles = self._profiles, []
+            if self._global_profile is not None:
+                self._global_profile.disable()
+                profiles = [self._global_profile]
+            if profiles:
+                stats = pstats.Stats(profiles[0])
+                for profile in profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(f"{base}.prof")
+                paths.append(f"{base}.prof")
+                out = io.StringIO()
+                stats.stream = out
+                stats.sort_stats("cumulative").print_stats(self.top_n)
+                stats.sort_stats("tottime").print_stats(self.top_n)
+                summary = out.getvalue()
+            else:
+                summary = "No calls were profiled\n"
+        with open(f"{base}-top.txt", "w") as f:
+            f.write(f"{self.name}: {elapsed:.1f}s wall\n\n{summary}")
+        paths.append(f"{base}-top.txt")
+
+        if self._alloc_start is not None:
+            alloc_end = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            growth = alloc_end.filter_traces(ignore).compare_to(self._alloc_start.filter_traces(ignore), "lineno")
+            with open(f"{base}-alloc.txt", "w") as f:
+                f.write(f"Traced memory: {current / 1048576:.1f} MB now, {peak / 1048576:.1f} MB peak\n\n")
+                f.write(f"Top {self.top_n} allocation sites by growth:\n")
+                for stat in growth[:self.top_n]:
+                    f.write(f"{stat}\n")
+            paths.append(f"{base}-alloc.txt")
+
+        logger.info("Profile %s written: %s", self.name, ", ".join(paths))
+        return paths
+
+# ==============================
+# PROFILER
+# ==============================
+
+class Profiler:
+    """Arms a profile over the next N checks or check cycles; at most one runs at a time.
+
+    Checks go through run() and report check_done() when they finish; the
+    session stops after the Nth. Cycles use the cycle() context manager.
+    on_done(paths) is called with the written files.
+    """
+
+    def __init__(self, cycles=PROFILE_CYCLES):
+        self._lock = threading.Lock()
+        self._session = None
+        self._remaining = 0
+        self._on_done = None
+        self.cycles = cycles
+
+    def active(self):
+        with self._lock:
+            return self._session is not None
+
+    def profile_checks(self, count, on_done=None):
+        """Start profiling now and stop after `count` checks; False if a profile is already running."""
+        if count < 1:
+            raise ValueError(f"Cannot profile {count} checks")
+        with self._lock:
+            if self._session is not None:
+                return False
+            session = self._session = ProfileSession(f"checks-{count}")
+            self._remaining = 0
+        # start() takes a tracemalloc snapshot; checks finishing meanwhile are not counted
+        session.start()
+        with self._lock:
+            self._remaining = count
+            self._on_done = on_done
+        return True
+
+    def run(self, fn, *args):
+        session = self._session
+        return session.wrap(fn, *args) if session is not None else fn(*args)
+
+    def check_done(self):
+        with self._lock:
+            if self._session is None or self._remaining <= 0:
+                return
+            self._remaining -= 1
+            if self._remaining:
+                return
+            session, on_done = self._session, self._on_done
+        # The caller may be the event loop, and writing the files can take
+        # seconds; a writer thread does it so checks keep running meanwhile.
+        # No new profile starts until it has finished.
+        threading.Thread(target=self._finish, args=(session, on_done), name="profile-writer", daemon=True).start()
+
+    def _finish(self, session, on_done):
+        try:
+            paths = session.stop()
+        except Exception:
+            logger.exception("Failed to write profile %s", session.name)
+            paths = None
+        with self._lock:
+            self._session = None
+        if on_done and paths:
+            on_done(paths)
+
+    @contextmanager
+    def cycle(self, name, force=False, on_done=None):
+        """Profile the enclosed cycle if forced or PROFILE_CYCLES has cycles left."""
+        with self._lock:
+            take = self._session is None and (force or self.cycles > 0)
+            if take:
+                if not force:
+                    self.cycles -= 1
+                session = self._session = ProfileSession(name).start()
+                self._remaining = 0
+        if not take:
+            yield
+            return
+        try:
+            yield
+        finally:
+            paths = session.stop()
+            with self._lock:
+                self._session = None
+            if on_done:
+                on_done(paths)
+
+PROFILER = Profiler()
@@ -0,0 +1,109 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# PRODUCT REGISTRY
+# ==============================
+
+class ProductRegistry:
+    """Process-wide in-memory view of all subscriptions, indexed by chat and product.
+
+    Loaded from storage once; every mutation writes through to storage first
+    and then updates the indexes, so reads never touch the disk. Callers get
+    copies of the stored dicts and must go through the registry to change them.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._by_chat = {}
+        self._by_key = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def load(self):
+        """(Re)build the indexes from storage."""
+        items = self.storage.list_subscriptions()
+        with self._lock:
+            self._by_chat = {}
+            self._by_key = {}
+            for item in items:
+                self._index(item)
+            self._loaded = True
+        logger.debug("Registry loaded %s subscriptions", len(items))
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _index(self, item):
+        self._by_chat.setdefault(item["chat_id"], {})[item["product_key"]] = item
+        self._by_key.setdefault(item["product_key"], {})[item["chat_id"]] = item
+
+    # ------------------------------
+    # Reads
+    # ------------------------------
+
+    def for_chat(self, chat_id):
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(item) for item in self._by_chat.get(chat_id, {}).values()]
+
+    def subscribers(self, product_key):
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(item) for item in self._by_key.get(product_key, {}).values()]
+
+    def get(self, chat_id, product_key):
+        self._ensure_loaded()
+        with self._lock:
+            item = self._by_chat.get(chat_id, {}).get(product_key)
+            return dict(item) if item else None
+
+    def all(self):
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(item) for items in self._by_chat.values() for item in items.values()]
+
+    def product_keys(self):
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._by_key)
+
+    def subscriber_counts(self):
+        """{product_key: number of subscribers} for every tracked product."""
+        self._ensure_loaded()
+        with self._lock:
+            return {key: len(items) for key, items in self._by_key.items()}
+
+    def __len__(self):
+        self._ensure_loaded()
+        with self._lock:
+            return sum(len(items) for items in self._by_chat.values())
+
+    # ------------------------------
+    # Writes
+    # ------------------------------
+
+    def add(self, item):
+        """Add a subscription; returns False if the chat already tracks that product."""
+        self._ensure_loaded()
+        with self._lock:
+            if item["product_key"] in self._by_chat.get(item["chat_id"], {}):
+                return False
+            if not self.storage.add_subscription(item):
+                return False
+            self._index(dict(item))
+            return True
+
+    def update_price(self, chat_id, product_key, price, checked_at, title=None):
+        self._ensure_loaded()
+        with self._lock:
+            self.storage.update_subscription_price(chat_id, product_key, price, checked_at, title)
+            item = self._by_chat.get(chat_id, {}).get(product_key)
+            if item is not None:
+                item["last_price"] = price
+                item["last_checked"] = checked_at
+                if title:
+                    item["title"] = title
@@ -0,0 +1,221 @@
+import os
+import math
+import time
+import heapq
+import random
+import threading
+
+# ==============================
+# CONFIG
+# ==============================
+
+CHECK_INTERVAL = float(os.getenv("CHECK_INTERVAL", "1800"))
+CHECK_MIN_INTERVAL = float(os.getenv("CHECK_MIN_INTERVAL", "300"))
+CHECK_MAX_INTERVAL = float(os.getenv("CHECK_MAX_INTERVAL", str(6 * 3600)))
+CHECKS_PER_MINUTE = float(os.getenv("CHECKS_PER_MINUTE", "30"))
+
+# How much faster a product is checked after its price moved, and how much
+# slower after each unchanged check
+VOLATILE_SPEEDUP = 2.0
+STABLE_BACKOFF = 1.25
+
+# ==============================
+# TOKEN BUCKET
+# ==============================
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now=None):
+        """Take a token if one is available; otherwise return seconds until one is."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+# ==============================
+# SCHEDULER
+# ==============================
+
+class ProductState:
+    def __init__(self, product_key, subscribers, next_check_at, interval):
+        self.product_key = product_key
+        self.subscribers = subscribers
+        self.next_check_at = next_check_at
+        self.interval = interval
+        self.last_price = None
+        self.in_flight = False
+        self.version = 0
+
+class CheckScheduler:
+    """Min-heap of products ordered by their own next_check_at.
+
+    Intervals shrink when a price moves and for heavily subscribed products,
+    and grow while a price stays flat. A global token bucket caps checks per
+    minute so load is spread over time instead of arriving in bursts.
+
+    With a `storage`, each product's due time, interval and last price are
+    written after every check, so a restarted checker picks up each product
+    where it left off instead of starting a new cycle.
+    """
+
+    def __init__(self, base_interval=CHECK_INTERVAL, min_interval=CHECK_MIN_INTERVAL,
+                 max_interval=CHECK_MAX_INTERVAL, checks_per_minute=CHECKS_PER_MINUTE, storage=None):
+        self.storage = storage
+        self._saved = None
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.bucket = TokenBucket(checks_per_minute / 60.0, max(1.0, checks_per_minute / 6.0))
+        self._states = {}
+        self._heap = []
+        self._cond = threading.Condition()
+
+    def _push(self, state):
+        state.version += 1
+        heapq.heappush(self._heap, (state.next_check_at, state.version, state.product_key))
+        self._cond.notify_all()
+
+    def _effective_interval(self, state):
+        # Each doubling of subscribers checks the product a bit more often
+        weight = 1 + math.log2(max(1, state.subscribers))
+        return min(self.max_interval, max(self.min_interval, state.interval / weight))
+
+    def _restore(self, key, count, now):
+        """State for a product the scheduler has not seen in this process."""
+        saved = self._saved.pop(key, None) if self._saved else None
+        if saved is None:
+            # Spread first checks over one interval to avoid a startup burst
+            return ProductState(key, count, now + random.uniform(0, self.base_interval), self.base_interval)
+        next_check_at = saved["next_check_at"]
+        if next_check_at < now:
+            # Overdue after downtime: still spread them, but over the shortest interval
+            next_check_at = now + random.uniform(0, self.min_interval)
+        state = ProductState(key, count, next_check_at, saved["interval"])
+        state.last_price = saved["last_price"]
+        return state
+
+    def sync(self, subscriber_counts):
+        """Add new products, drop removed ones and refresh subscriber counts."""
+        now = time.time()
+        if self._saved is None and self.storage is not None:
+            self._saved = self.storage.load_schedule()
+        with self._cond:
+            for key in list(self._states):
+                if key not in subscriber_counts:
+                    # Stale heap entries are skipped lazily by version
+                    del self._states[key]
+                    if self.storage is not None:
+                        self.storage.delete_schedule(key)
+            for key, count in subscriber_counts.items():
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = self._restore(key, count, now)
+                    self._push(state)
+                else:
+                    state.subscribers = count
+            if self._saved:
+                # Persisted products nobody tracks any more
+                for key in self._saved:
+                    self.storage.delete_schedule(key)
+                self._saved = {}
+
+    def _pop_due_locked(self):
+        """(key, None) for a product that may be checked now, else (None, seconds to wait or None)."""
+        while self._heap:
+            due_at, version, key = self._heap[0]
+            state = self._states.get(key)
+            if state is None or state.version != version or state.in_flight:
+                heapq.heappop(self._heap)
+                continue
+            wait = due_at - time.time()
+            if wait <= 0:
+                wait = self.bucket.try_take()
+                if wait <= 0:
+                    heapq.heappop(self._heap)
+                    state.in_flight = True
+                    return key, None
+            return None, wait
+        return None, None
+
+    def poll_due(self):
+        """Non-blocking next_due() for event loops: (key, None), or (None, seconds to wait or None)."""
+        with self._cond:
+            return self._pop_due_locked()
+
+    def next_due(self, timeout=None):
+        """Block until a product is due and the rate budget allows a check; returns its key.
+
+        Returns None if `timeout` elapses first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                key, wait = self._pop_due_locked()
+                if key is not None:
+                    return key
+
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def complete(self, product_key, price):
+        """Reschedule a product after a check; price is None when the check failed."""
+        with self._cond:
+            state = self._states.get(product_key)
+            if state is None:
+                return
+            state.in_flight = False
+            if price is None:
+                # Failed checks retry at the base cadence
+                state.interval = self.base_interval
+            elif state.last_price is not None and price != state.last_price:
+                state.interval = max(self.min_interval, state.interval / VOLATILE_SPEEDUP)
+            else:
+                state.interval = min(self.max_interval, state.interval * STABLE_BACKOFF)
+            if price is not None:
+                state.last_price = price
+            # Small jitter keeps products that share an interval from re-aligning
+            interval = self._effective_interval(state) * random.uniform(0.9, 1.1)
+            state.next_check_at = time.time() + interval
+            self._push(state)
+            saved = (state.next_check_at, state.interval, state.last_price)
+        # Written outside the lock: a busy database must not stall next_due() and poll_due()
+        if self.storage is not None:
+            self.storage.save_schedule(product_key, *saved)
+
+    def requeue(self, product_key):
+        """Hand back a check that never finished, keeping its due time and interval."""
+        with self._cond:
+            state = self._states.get(product_key)
+            if state is None or not state.in_flight:
+                return
+            state.in_flight = False
+            # The persisted row still holds these values, so a restart sees the same schedule
+            self._push(state)
+
+    def stats(self):
+        with self._cond:
+            if not self._states:
+                return {"products": 0}
+            next_at = min(state.next_check_at for state in self._states.values())
+            return {
+                "products": len(self._states),
+                "in_flight": sum(1 for state in self._states.values() if state.in_flight),
+                "next_check_in": max(0.0, next_at - time.time()),
+            }
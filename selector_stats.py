@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+SELECTOR_STATS_FILE = os.getenv("SELECTOR_STATS_FILE", "selector_stats.json")
+SELECTOR_STATS_SAVE_INTERVAL = float(os.getenv("SELECTOR_STATS_SAVE_INTERVAL", "60"))
+
+# Weight of the newest observation in the moving hit rate and latency
+SELECTOR_EWMA_ALPHA = 0.2
+# A selector whose moving hit rate drops below this after enough tries is demoted
+SELECTOR_DEAD_RATE = 0.05
+SELECTOR_MIN_TRIES = 10
+
+# ==============================
+# SELECTOR STATS
+# ==============================
+
+class SelectorStats:
+    """Persistent per-selector hit rate and latency, keyed by page type and field.
+
+    ranked() orders a field's selectors so the one that has been working
+    lately is tried first. Selectors that keep missing sink behind the rest
+    but are still tried last, so one that starts matching again climbs back.
+    """
+
+    def __init__(self, path=SELECTOR_STATS_FILE, alpha=SELECTOR_EWMA_ALPHA,
+                 dead_rate=SELECTOR_DEAD_RATE, min_tries=SELECTOR_MIN_TRIES,
+                 save_interval=SELECTOR_STATS_SAVE_INTERVAL):
+        self.path = path
+        self.alpha = alpha
+        self.dead_rate = dead_rate
+        self.min_tries = min_tries
+        self.save_interval = save_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        # Set by forward(): records kept for drain() instead of being saved here
+        self._forwarded = None
+
+    def load(self):
+        with self._lock:
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                return
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error("Failed to load selector stats: %s", e)
+                return
+            logger.debug("Loaded selector stats for %s fields", len(self._entries))
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _save_locked(self):
+        self._saved_at = time.monotonic()
+        if not self.path or not self._dirty or self._forwarded is not None:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.error("Failed to save selector stats: %s", e)
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def forward(self):
+        """Keep every record() for drain() and never save; for fetch workers, whose parent persists the stats."""
+        with self._lock:
+            if self._forwarded is None:
+                self._forwarded = []
+
+    def drain(self):
+        """Records kept since the last drain, in order, as (page_type, field, selector, hit, seconds)."""
+        with self._lock:
+            if self._forwarded is None:
+                return []
+            records, self._forwarded = self._forwarded, []
+            return records
+
+    def merge(self, records):
+        """Replay records drained in another process, as if they had been recorded here."""
+        for record in records:
+            self.record(*record)
+
+    def _is_dead(self, entry):
+        return entry["tries"] >= self.min_tries and entry["rate"] < self.dead_rate
+
+    def ranked(self, page_type, field, selectors):
+        """The given selectors, best first; unseen selectors rank ahead of dead ones."""
+        self._ensure_loaded()
+        with self._lock:
+            entries = self._entries.get(f"{page_type}:{field}", {})
+            live, dead = [], []
+            for position, selector in enumerate(selectors):
+                entry = entries.get(selector)
+                if entry is None:
+                    # Keep the declared order among selectors we know nothing about
+                    live.append((-0.5, 0.0, position, selector))
+                elif self._is_dead(entry):
+                    dead.append((-entry["last_hit"], position, selector))
+                else:
+                    live.append((-entry["rate"], entry["ms"], position, selector))
+        live.sort()
+        dead.sort()
+        return [item[-1] for item in live] + [item[-1] for item in dead]
+
+    def record(self, page_type, field, selector, hit, seconds):
+        self._ensure_loaded()
+        with self._lock:
+            entries = self._entries.setdefault(f"{page_type}:{field}", {})
+            entry = entries.get(selector)
+            ms = seconds * 1000
+            if entry is None:
+                entry = entries[selector] = {"tries": 0, "hits": 0, "rate": float(hit), "ms": ms, "last_hit": 0}
+            else:
+                entry["rate"] += self.alpha * (float(hit) - entry["rate"])
+                entry["ms"] += self.alpha * (ms - entry["ms"])
+            entry["tries"] += 1
+            if hit:
+                entry["hits"] += 1
+                entry["last_hit"] = int(time.time())
+            self._dirty = True
+            if self._forwarded is not None:
+                self._forwarded.append((page_type, field, selector, hit, seconds))
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._save_locked()
+
+    def stats(self):
+        """Current best selector and number of demoted selectors per field."""
+        with self._lock:
+            summary = {}
+            for name, entries in self._entries.items():
+                if not entries:
+                    continue
+                best = max(entries, key=lambda selector: entries[selector]["rate"])
+                summary[name] = {
+                    "best": best,
+                    "rate": round(entries[best]["rate"], 3),
+                    "ms": round(entries[best]["ms"], 1),
+                    "dead": sum(1 for entry in entries.values() if self._is_dead(entry)),
+                }
+            return summary
+
+SELECTOR_STATS = SelectorStats()
+atexit.register(SELECTOR_STATS.save)
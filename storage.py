@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# CONFIG
+# ==============================
+
+DB_FILE = os.getenv("DB_FILE", "tracked_products.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    product_key TEXT PRIMARY KEY,
+    product_link TEXT NOT NULL,
+    title TEXT,
+    last_price INTEGER,
+    mrp INTEGER,
+    in_stock INTEGER,
+    last_checked TEXT
+);
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    product_key TEXT NOT NULL,
+    product_link TEXT NOT NULL,
+    title TEXT,
+    initial_price INTEGER,
+    last_price INTEGER,
+    added_date TEXT,
+    last_checked TEXT,
+    UNIQUE (chat_id, product_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_subscriptions_chat_id ON subscriptions (chat_id);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_product_key ON subscriptions (product_key);
+
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_key TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    price INTEGER,
+    ok INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_checks_product_key ON checks (product_key, checked_at);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_key TEXT NOT NULL,
+    resolution INTEGER NOT NULL DEFAULT 0,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    last_price INTEGER NOT NULL,
+    ts_blob BLOB NOT NULL,
+    price_blob BLOB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_price_history_product ON price_history (product_key, end_ts);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    parse_mode TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_key TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, lease_until);
+
+CREATE TABLE IF NOT EXISTS schedule (
+    product_key TEXT PRIMARY KEY,
+    next_check_at REAL NOT NULL,
+    interval REAL NOT NULL,
+    last_price INTEGER
+);
+"""
+
+SUBSCRIPTION_FIELDS = (
+    "chat_id", "product_link", "product_key", "title",
+    "initial_price", "last_price", "added_date", "last_checked",
+)
+
+# ==============================
+# STORAGE
+# ==============================
+
+class Storage:
+    """SQLite (WAL) store for products, subscriptions and check results.
+
+    Rows are handed out as plain dicts shaped like the old JSON entries, so
+    callers keep using item["last_price"] and friends. Each thread gets its
+    own connection; every write touches only the rows that changed.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def connection(self):
+        """Connection for the calling thread, creating the schema on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+        return conn
+
+    def init(self):
+        """Create the database file and schema if they do not exist yet."""
+        self.connection()
+
+    # ------------------------------
+    # Subscriptions
+    # ------------------------------
+
+    def list_subscriptions(self, chat_id=None):
+        conn = self.connection()
+        if chat_id is None:
+            rows = conn.execute("SELECT * FROM subscriptions ORDER BY id").fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM subscriptions WHERE chat_id = ? ORDER BY id", (chat_id,)
+            ).fetchall()
+        return [{field: row[field] for field in SUBSCRIPTION_FIELDS} for row in rows]
+
+    def find_subscription(self, chat_id, product_key):
+        row = self.connection().execute(
+            "SELECT * FROM subscriptions WHERE chat_id = ? AND product_key = ?",
+            (chat_id, product_key),
+        ).fetchone()
+        return {field: row[field] for field in SUBSCRIPTION_FIELDS} if row else None
+
+    def add_subscription(self, item):
+        """Insert a subscription; returns False if the user already tracks that product."""
+        cursor = self.connection().execute(
+            "INSERT INTO subscriptions (chat_id, product_key, product_link, title, initial_price, "
+            "last_price, added_date, last_checked) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, product_key) DO NOTHING",
+            (item["chat_id"], item["product_key"], item["product_link"], item.get("title"),
+             item.get("initial_price"), item.get("last_price"), item.get("added_date"),
+             item.get("last_checked")),
+        )
+        return cursor.rowcount > 0
+
+    def update_subscription_price(self, chat_id, product_key, price, checked_at, title=None):
+        """Single-row update of one subscriber's last seen price."""
+        self.connection().execute(
+            "UPDATE subscriptions SET last_price = ?, last_checked = ?, title = COALESCE(?, title) "
+            "WHERE chat_id = ? AND product_key = ?",
+            (price, checked_at, title, chat_id, product_key),
+        )
+
+    # ------------------------------
+    # Products and checks
+    # ------------------------------
+
+    def record_check(self, product_key, product_link, snapshot=None):
+        """Upsert the product row and log the check outcome in one transaction."""
+        price = snapshot.price if snapshot else None
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN")
+            if price is not None:
+                conn.execute(
+                    "INSERT INTO products (product_key, product_link, title, last_price, mrp, in_stock, last_checked) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (product_key) DO UPDATE SET "
+                    "title = COALESCE(excluded.title, title), last_price = excluded.last_price, "
+                    "mrp = COALESCE(excluded.mrp, mrp), in_stock = excluded.in_stock, "
+                    "last_checked = excluded.last_checked",
+                    (product_key, product_link, snapshot.title, price, snapshot.mrp,
+                     None if snapshot.in_stock is None else int(snapshot.in_stock),
+                     time.strftime("%Y-%m-%d %H:%M:%S")),
+                )
+            conn.execute(
+                "INSERT INTO checks (product_key, checked_at, price, ok) VALUES (?, ?, ?, ?)",
+                (product_key, time.time(), price, int(price is not None)),
+            )
+
+    def prune_checks(self, older_than):
+        """Drop check log rows older than a unix timestamp."""
+        cursor = self.connection().execute("DELETE FROM checks WHERE checked_at < ?", (older_than,))
+        return cursor.rowcount
+
+    def checked_since(self, since):
+        """Product keys with a successful check logged at or after a unix timestamp."""
+        rows = self.connection().execute(
+            "SELECT DISTINCT product_key FROM checks WHERE checked_at >= ? AND ok = 1", (since,)
+        ).fetchall()
+        return {row["product_key"] for row in rows}
+
+    # ------------------------------
+    # Check cycles
+    # ------------------------------
+
+    def sweep_cursor(self, name):
+        """Progress of an unfinished check cycle, or None if the last one completed."""
+        row = self.connection().execute("SELECT value FROM meta WHERE key = ?", (f"sweep:{name}",)).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def set_sweep_cursor(self, name, cursor):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"sweep:{name}", json.dumps(cursor))
+        )
+
+    def clear_sweep_cursor(self, name):
+        self.connection().execute("DELETE FROM meta WHERE key = ?", (f"sweep:{name}",))
+
+    def load_schedule(self):
+        """{product_key: row} of the persisted per-product schedule."""
+        rows = self.connection().execute("SELECT * FROM schedule").fetchall()
+        return {row["product_key"]: dict(row) for row in rows}
+
+    def save_schedule(self, product_key, next_check_at, interval, last_price):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO schedule (product_key, next_check_at, interval, last_price) "
+            "VALUES (?, ?, ?, ?)",
+            (product_key, next_check_at, interval, last_price),
+        )
+
+    def delete_schedule(self, product_key):
+        self.connection().execute("DELETE FROM schedule WHERE product_key = ?", (product_key,))
+
+    # ------------------------------
+    # Outbox
+    # ------------------------------
+
+    def outbox_add(self, chat_id, text, parse_mode=None):
+        """Persist an outgoing message and return its id."""
+        cursor = self.connection().execute(
+            "INSERT INTO outbox (chat_id, text, parse_mode, created_at) VALUES (?, ?, ?, ?)",
+            (chat_id, text, parse_mode, time.time()),
+        )
+        return cursor.lastrowid
+
+    def outbox_pending(self):
+        rows = self.connection().execute("SELECT * FROM outbox ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def outbox_attempted(self, message_id):
+        self.connection().execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (message_id,))
+
+    def outbox_delete(self, message_id):
+        self.connection().execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+    # ------------------------------
+    # Job queue
+    # ------------------------------
+
+    def job_add(self, product_key, url):
+        """Queue a fetch job; returns False if the product already has an open job."""
+        cursor = self.connection().execute(
+            "INSERT INTO jobs (product_key, url, created_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (product_key) DO NOTHING",
+            (product_key, url, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def job_lease(self, owner, lease_seconds, max_attempts, limit=1):
+        """Lease up to `limit` pending jobs, or jobs whose lease has expired, to `owner`.
+
+        Each lease gets a fresh token; only the holder of the current token
+        can renew or complete the job. Expired jobs that have used up
+        `max_attempts` are completed with no result instead.
+        """
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            # IMMEDIATE takes the write lock up front so two nodes never lease the same row
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET state = 'done', result = NULL, finished_at = ?, lease_token = NULL "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, max_attempts),
+            )
+            rows = conn.execute(
+                "SELECT id, product_key, url, attempts FROM jobs "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) "
+                "ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            jobs = []
+            for row in rows:
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE jobs SET state = 'leased', lease_owner = ?, lease_token = ?, "
+                    "lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    (owner, token, now + lease_seconds, row["id"]),
+                )
+                jobs.append(dict(row, token=token, attempts=row["attempts"] + 1))
+        return jobs
+
+    def job_heartbeat(self, job_id, token, lease_seconds):
+        """Extend a lease; returns False if the lease was lost to another node."""
+        cursor = self.connection().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND lease_token = ? AND state = 'leased'",
+            (time.time() + lease_seconds, job_id, token),
+        )
+        return cursor.rowcount > 0
+
+    def job_complete(self, job_id, token, result):
+        """Store a job's result; repeated or stale reports are ignored and return False."""
+        cursor = self.connection().execute(
+            "UPDATE jobs SET state = 'done', result = ?, finished_at = ?, lease_token = NULL "
+            "WHERE id = ? AND lease_token = ? AND state = 'leased'",
+            (json.dumps(result), time.time(), job_id, token),
+        )
+        return cursor.rowcount > 0
+
+    def job_take_results(self, limit=100):
+        """Remove and return finished jobs; `result` is None for jobs that gave up."""
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, product_key, url, attempts, result FROM jobs WHERE state = 'done' "
+                "ORDER BY finished_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+        return [dict(row, result=json.loads(row["result"]) if row["result"] else None) for row in rows]
+
+    def job_counts(self):
+        rows = self.connection().execute(
+            "SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"
+        ).fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    # ------------------------------
+    # Migration
+    # ------------------------------
+
+    def migrate_from_json(self, json_path, key_fn):
+        """One-time import of the legacy JSON file; returns the number of rows imported."""
+        conn = self.connection()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0
+        if not os.path.exists(json_path):
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (time.time(),))
+            return 0
+
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Could not read %s for migration: %s", json_path, e)
+            return 0
+
+        imported = 0
+        with conn:
+            conn.execute("BEGIN")
+            for item in data:
+                item = dict(item)
+                if not item.get("product_key"):
+                    item["product_key"] = key_fn(item["product_link"])
+                cursor = conn.execute(
+                    "INSERT INTO subscriptions (chat_id, product_key, product_link, title, initial_price, "
+                    "last_price, added_date, last_checked) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (chat_id, product_key) DO NOTHING",
+                    (item["chat_id"], item["product_key"], item["product_link"], item.get("title"),
+                     item.get("initial_price"), item.get("last_price"), item.get("added_date"),
+                     item.get("last_checked")),
+                )
+                imported += cursor.rowcount
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (time.time(),))
+        logger.info("Migrated %s tracked products from %s", imported, json_path)
+        return imported
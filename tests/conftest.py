@@ -0,0 +1,31 @@
+import pytest
+
+import flipkart_urls
+import product_fetcher
+from flipkart_urls import ResolutionCache
+from selector_stats import SelectorStats
+
+
+@pytest.fixture(autouse=True)
+def resolution_cache(monkeypatch):
+    """A fresh in-memory resolution cache, so tests never touch url_cache.json."""
+    cache = ResolutionCache(path=None)
+    monkeypatch.setattr(flipkart_urls, "RESOLUTION_CACHE", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def selector_stats(monkeypatch):
+    """Fresh in-memory selector stats, so parsing in tests never writes selector_stats.json."""
+    stats = SelectorStats(path=None)
+    monkeypatch.setattr(product_fetcher, "SELECTOR_STATS", stats)
+    return stats
+
+
+@pytest.fixture
+def storage(tmp_path):
+    from storage import Storage
+
+    storage = Storage(str(tmp_path / "test.db"))
+    storage.init()
+    return storage
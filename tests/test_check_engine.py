@@ -0,0 +1,172 @@
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from check_engine import (CheckEngine, CircuitOpenError, HostBreaker, HostThrottle,
+                          OUTCOME_BLOCKED, OUTCOME_ERROR, OUTCOME_NOT_FOUND, OUTCOME_OK)
+from product_fetcher import classify_snapshot, fetch_snapshot_http
+
+
+def breaker(**kwargs):
+    options = dict(max_limit=8, window=20, threshold=3, cooldown=300, max_cooldown=3600)
+    options.update(kwargs)
+    return HostBreaker("www.flipkart.com", **options)
+
+
+def run(breaker, outcome):
+    breaker.acquire()
+    breaker.release(outcome)
+
+
+def end_cooldown(breaker):
+    breaker.open_until = 0.0
+
+
+def test_block_halves_the_limit_and_successes_add_back():
+    b = breaker()
+    run(b, OUTCOME_BLOCKED)
+    assert b.limit == 4
+    for _ in range(4):
+        run(b, OUTCOME_OK)
+    # About +1 per round of `limit` successes
+    assert b.limit == pytest.approx(5, abs=0.2)
+    run(b, OUTCOME_BLOCKED)
+    assert b.limit == pytest.approx(2.5, abs=0.1)
+    assert b.state == HostBreaker.CLOSED
+
+
+def test_limit_never_exceeds_max_or_drops_below_one():
+    b = breaker(max_limit=2, threshold=100)
+    for _ in range(10):
+        run(b, OUTCOME_OK)
+    assert b.limit == 2
+    for _ in range(10):
+        run(b, OUTCOME_BLOCKED)
+    assert b.limit == 1
+
+
+def test_limit_caps_concurrent_slots():
+    b = breaker(max_limit=2)
+    assert b.try_acquire() and b.try_acquire()
+    assert not b.try_acquire()
+    b.release(OUTCOME_OK)
+    assert b.try_acquire()
+
+
+def test_errors_and_not_found_do_not_open_the_circuit():
+    b = breaker()
+    for _ in range(10):
+        run(b, OUTCOME_ERROR)
+        run(b, OUTCOME_NOT_FOUND)
+    assert b.state == HostBreaker.CLOSED
+    assert b.limit == 8
+
+
+def test_blocks_open_the_circuit_and_fail_fast():
+    b = breaker()
+    for _ in range(3):
+        run(b, OUTCOME_BLOCKED)
+    assert b.state == HostBreaker.OPEN
+    assert b.opens == 1
+    with pytest.raises(CircuitOpenError) as error:
+        b.try_acquire()
+    assert error.value.retry_in > 0
+
+
+def test_good_probe_closes_at_limit_one():
+    b = breaker()
+    for _ in range(3):
+        run(b, OUTCOME_BLOCKED)
+    end_cooldown(b)
+    assert b.try_acquire()
+    assert b.state == HostBreaker.HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        b.try_acquire()
+    b.release(OUTCOME_OK)
+    assert (b.state, b.limit, b.cooldown) == (HostBreaker.CLOSED, 1.0, 300)
+
+
+def test_blocked_probe_reopens_with_doubled_cooldown():
+    b = breaker(cooldown=300, max_cooldown=1000)
+    for _ in range(3):
+        run(b, OUTCOME_BLOCKED)
+    for expected in (600, 1000, 1000):
+        end_cooldown(b)
+        run(b, OUTCOME_BLOCKED)
+        assert b.state == HostBreaker.OPEN
+        assert b.cooldown == expected
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        self.send_response(429)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(b"Too Many Requests")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rate_limited_server():
+    RateLimitedHandler.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_run_of_429s_opens_the_breaker(rate_limited_server):
+    engine = CheckEngine(workers=1, max_in_flight=4, throttle=HostThrottle(0, 0), classify=classify_snapshot)
+    url = f"http://127.0.0.1:{rate_limited_server.server_port}/phone/p/itm1?pid=PID1"
+    try:
+        for _ in range(3):
+            assert engine.fetch(url, fetch_snapshot_http).blocked
+        assert engine.breaker(url).state == HostBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            engine.fetch(url, fetch_snapshot_http)
+    finally:
+        engine.shutdown()
+    # The shared session hands 429s back instead of retrying them
+    assert RateLimitedHandler.requests == 3
+
+
+def test_priority_fetch_skips_scheduled_fetches_waiting_on_the_throttle():
+    engine = CheckEngine(workers=1, max_in_flight=64, throttle=HostThrottle(0.05, 0.05), throttle_waiters=2)
+    url = "https://www.flipkart.com/phone/p/itm1"
+    started = []
+
+    async def fetch(url):
+        started.append(time.monotonic())
+        return url
+
+    async def run():
+        scheduled = [asyncio.ensure_future(engine.fetch_async(url, fetch)) for _ in range(30)]
+        await asyncio.sleep(0.01)
+        began = time.monotonic()
+        await engine.fetch_async(url, fetch, priority=True)
+        waited = time.monotonic() - began
+        await asyncio.gather(*scheduled)
+        return waited
+
+    try:
+        waited = asyncio.run(run())
+    finally:
+        engine.shutdown()
+    # Behind at most the two scheduled fetches holding a slot, not all thirty
+    assert waited < 0.5
+    assert len(started) == 31
+    # Starts stay spaced by the politeness delay
+    gaps = [b - a for a, b in zip(started, started[1:])]
+    assert min(gaps) > 0.04
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+
+from check_engine import CheckEngine, HostThrottle
+from check_pipeline import CheckPipeline
+from product_fetcher import ProductSnapshot, classify_snapshot
+from scheduler import CheckScheduler
+
+URL = "https://www.flipkart.com/phone/p/itm1?pid=PID1"
+ITEM = {"chat_id": 1, "product_key": "pid:PID1", "product_link": URL, "title": "Phone"}
+
+
+def make_pipeline(storage, fetch):
+    engine = CheckEngine(workers=1, throttle=HostThrottle(0, 0), classify=classify_snapshot)
+    scheduler = CheckScheduler(base_interval=1000, min_interval=100, max_interval=10000,
+                               checks_per_minute=6000, storage=storage)
+    scheduler.sync({"pid:PID1": 1})
+    pipeline = CheckPipeline(engine, lambda key: [dict(ITEM)], lambda items, snapshot: snapshot, scheduler)
+
+    async def resolve(link):
+        return link
+    pipeline.resolve = resolve
+    pipeline.fetch = fetch
+    return pipeline, scheduler
+
+
+def test_completed_checks_are_rescheduled_on_the_storage_thread(storage, monkeypatch):
+    threads = []
+    save_schedule = storage.save_schedule
+
+    def record_thread(*args):
+        threads.append(threading.current_thread().name)
+        save_schedule(*args)
+
+    monkeypatch.setattr(storage, "save_schedule", record_thread)
+
+    async def fetch(url, key=None, max_age=0, priority=False):
+        return ProductSnapshot(url=url, price=999)
+
+    pipeline, scheduler = make_pipeline(storage, fetch)
+    scheduler._states["pid:PID1"].in_flight = True
+
+    async def run():
+        pipeline.start()
+        await pipeline.submit("pid:PID1")
+        await pipeline.join()
+        await pipeline.stop()
+
+    asyncio.run(run())
+    assert pipeline.checked == 1
+    assert threads and all(name.startswith("pipeline-storage") for name in threads)
+    assert storage.load_schedule()["pid:PID1"]["last_price"] == 999
+
+
+def test_stop_hands_unfinished_checks_back_unchanged(storage):
+    fetching = None
+
+    async def fetch(url, key=None, max_age=0, priority=False):
+        fetching.set()
+        await asyncio.sleep(60)
+
+    pipeline, scheduler = make_pipeline(storage, fetch)
+    state = scheduler._states["pid:PID1"]
+    with scheduler._cond:
+        state.interval = 2500
+        state.next_check_at = 0
+        scheduler._push(state)
+
+    async def run():
+        nonlocal fetching
+        fetching = asyncio.Event()
+        pipeline.start()
+        assert scheduler.poll_due()[0] == "pid:PID1"
+        await pipeline.submit("pid:PID1")
+        await asyncio.wait_for(fetching.wait(), 5)
+        await pipeline.stop()
+
+    asyncio.run(run())
+    assert (pipeline.checked, pipeline.failed) == (0, 0)
+    assert not state.in_flight
+    assert (state.next_check_at, state.interval) == (0, 2500)
+    # Nothing was written, so a restart resumes from the previous schedule as well
+    assert storage.load_schedule() == {}
+    assert scheduler.poll_due()[0] == "pid:PID1"
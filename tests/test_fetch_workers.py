@@ -0,0 +1,79 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fetch_workers import FetchWorkerPool
+from product_fetcher import drain_fetch_stats, merge_fetch_stats, record_tier, tier_stats
+
+# No embedded data, so the price comes from the selector fallback
+PAGE = b"""<html><head><title>Lamp</title></head>
+<body><h1 class="yhB1nd">Lamp</h1><div class="Nx9bqj CxhGGd">&#8377;2,450</div></body></html>"""
+
+
+@pytest.fixture(autouse=True)
+def fresh_fetch_stats():
+    drain_fetch_stats()
+    yield
+    drain_fetch_stats()
+
+
+def test_drain_resets_and_merge_adds_back(selector_stats):
+    selector_stats.forward()
+    record_tier("http", True)
+    record_tier("browser", False)
+    selector_stats.record("http", "price", "._a", True, 0.001)
+    drained = drain_fetch_stats()
+    assert drained["tiers"]["http"] == {"attempts": 1, "hits": 1}
+    assert drained["selectors"] == [("http", "price", "._a", True, 0.001)]
+    assert tier_stats()["http"]["attempts"] == 0
+
+    merge_fetch_stats(drained)
+    merge_fetch_stats(drained)
+    stats = tier_stats()
+    assert stats["http"] == {"attempts": 2, "hits": 2, "hit_rate": 1.0}
+    assert stats["browser"]["attempts"] == 2
+    assert selector_stats._entries["http:price"]["._a"]["tries"] == 3
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def page_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_worker_stats_survive_retirement(page_server, selector_stats, monkeypatch, tmp_path):
+    stats_file = tmp_path / "selector_stats.json"
+    monkeypatch.setenv("BROWSER_FALLBACK", "0")
+    monkeypatch.setenv("SELECTOR_STATS_FILE", str(stats_file))
+    # Every worker is retired after one job
+    pool = FetchWorkerPool(processes=1, max_jobs=1, job_timeout=60)
+    url = f"http://127.0.0.1:{page_server.server_port}/lamp/p/itm1?pid=PID1"
+    try:
+        for _ in range(2):
+            assert pool.fetch(url, True).price == 2450
+    finally:
+        pool.shutdown()
+    assert pool.restarts == 2
+
+    stats = tier_stats()
+    assert stats["http"]["attempts"] == 2 and stats["http"]["hits"] == 2
+    assert stats["extract"]["selectors"] == 2
+    # Selector results reach the parent; the workers never write the file
+    assert sum(entry["hits"] for entry in selector_stats._entries["http:price"].values()) == 2
+    assert not stats_file.exists()
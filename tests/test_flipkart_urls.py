@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import httpx
+
+import flipkart_urls
+from flipkart_urls import ResolutionCache, product_key, resolve_product_key, resolved_product_key
+
+SHORT_LINK = "https://dl.flipkart.com/s/abc123"
+
+
+def test_pid_wins_over_item_id():
+    url = "https://www.flipkart.com/phone/p/itmABC123?pid=mobg6vf5q7zzxyzw&lid=LST1"
+    assert product_key(url) == "pid:MOBG6VF5Q7ZZXYZW"
+
+
+def test_item_id_when_there_is_no_pid():
+    assert product_key("https://www.flipkart.com/phone/p/itmABC123?lid=LST1") == "itm:itmabc123"
+
+
+def test_tracking_parameters_do_not_change_the_key():
+    plain = "https://www.flipkart.com/phone/p/itm1?pid=PID1"
+    tracked = "https://www.flipkart.com/phone/p/itm1?pid=PID1&affid=x&marketplace=FLIPKART"
+    assert product_key(plain) == product_key(tracked)
+
+
+def test_url_key_fallback_ignores_query_and_trailing_slash():
+    assert product_key("https://WWW.flipkart.com/some/page/?x=1") == "url:www.flipkart.com/some/page"
+
+
+def test_resolved_product_key_rejects_short_links():
+    assert resolved_product_key(SHORT_LINK) is None
+    assert resolved_product_key("https://www.flipkart.com/x/p/itm1?pid=PID1") == "pid:PID1"
+
+
+def test_resolve_product_key_follows_short_links(monkeypatch):
+    monkeypatch.setattr(flipkart_urls, "resolve_flipkart_url",
+                        lambda url: "https://www.flipkart.com/x/p/itm1?pid=PID1")
+    assert resolve_product_key(SHORT_LINK) == "pid:PID1"
+
+
+def test_unresolved_short_link_has_no_key(monkeypatch):
+    # resolve_flipkart_url() hands the short link back when resolution fails
+    monkeypatch.setattr(flipkart_urls, "resolve_flipkart_url", lambda url: url)
+    assert resolve_product_key(SHORT_LINK) is None
+
+
+def test_resolution_cache_expires_and_evicts(resolution_cache):
+    resolution_cache.max_size = 2
+    resolution_cache.put("a", "https://www.flipkart.com/x/p/itm1", ok=True)
+    resolution_cache.put("b", "https://www.flipkart.com/x/p/itm2", ok=True)
+    resolution_cache.get("a")
+    resolution_cache.put("c", "https://www.flipkart.com/x/p/itm3", ok=True)
+    # "b" was least recently used
+    assert resolution_cache.get("b") is None
+    assert resolution_cache.get("a")["key"] == "itm:itm1"
+
+    resolution_cache.negative_ttl = -1
+    resolution_cache.put("d", "d", ok=False)
+    assert resolution_cache.get("d") is None
+
+
+def test_resolution_cache_saves_when_asked(tmp_path):
+    path = tmp_path / "cache.json"
+    cache = ResolutionCache(path=str(path), save_interval=3600)
+    cache.put("a", "https://www.flipkart.com/x/p/itm1", ok=True)
+    # Debounced: nothing is written until the interval passes or save() runs
+    assert not path.exists()
+    cache.save()
+    assert ResolutionCache(path=str(path)).get("a")["key"] == "itm:itm1"
+
+
+def test_async_resolution_caches_off_the_event_loop(resolution_cache, monkeypatch):
+    monkeypatch.setattr(flipkart_urls.random, "uniform", lambda low, high: 0)
+    target = "https://www.flipkart.com/x/p/itm1?pid=PID1"
+    put_threads = []
+    put = resolution_cache.put
+
+    def recording_put(*args, **kwargs):
+        put_threads.append(threading.current_thread())
+        put(*args, **kwargs)
+
+    monkeypatch.setattr(resolution_cache, "put", recording_put)
+
+    def redirect(request):
+        if request.url.host == "dl.flipkart.com":
+            return httpx.Response(302, headers={"Location": target})
+        return httpx.Response(200)
+
+    async def resolve():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(redirect)) as client:
+            return await flipkart_urls.resolve_flipkart_url_async(SHORT_LINK, client)
+
+    assert asyncio.run(resolve()) == target
+    assert resolution_cache.get(SHORT_LINK)["key"] == "pid:PID1"
+    assert put_threads and threading.main_thread() not in put_threads
@@ -0,0 +1,77 @@
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(storage):
+    return JobQueue(storage, lease_seconds=60, max_attempts=3)
+
+
+def expire_leases(queue):
+    queue.storage.connection().execute("UPDATE jobs SET lease_until = 0 WHERE state = 'leased'")
+
+
+def test_submit_skips_products_already_queued(queue):
+    assert queue.submit("pid:A", "https://www.flipkart.com/a")
+    assert not queue.submit("pid:A", "https://www.flipkart.com/a")
+    assert queue.stats() == {"pending": 1}
+
+
+def test_a_leased_job_is_not_handed_out_twice(queue):
+    queue.submit("pid:A", "https://www.flipkart.com/a")
+    queue.submit("pid:B", "https://www.flipkart.com/b")
+    first = queue.lease("node-1")
+    second = queue.lease("node-2", limit=5)
+    assert [job["product_key"] for job in first] == ["pid:A"]
+    assert [job["product_key"] for job in second] == ["pid:B"]
+    assert queue.lease("node-3") == []
+    assert first[0]["attempts"] == 1
+
+
+def test_expired_lease_moves_to_the_next_node(queue):
+    queue.submit("pid:A", "https://www.flipkart.com/a")
+    [stale] = queue.lease("node-1")
+    expire_leases(queue)
+    [fresh] = queue.lease("node-2")
+    assert fresh["id"] == stale["id"]
+    assert fresh["token"] != stale["token"]
+    assert fresh["attempts"] == 2
+
+    # The old holder can neither renew nor report once its lease moved on
+    assert not queue.heartbeat(stale)
+    assert not queue.complete(stale, {"price": 1})
+    assert queue.heartbeat(fresh)
+    assert queue.complete(fresh, {"price": 2})
+    # A repeated report is ignored too
+    assert not queue.complete(fresh, {"price": 3})
+    [result] = queue.take_results()
+    assert result["result"] == {"price": 2}
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    queue.submit("pid:A", "https://www.flipkart.com/a")
+    [job] = queue.lease("node-1")
+    assert queue.heartbeat(job)
+    assert queue.lease("node-2") == []
+
+
+def test_job_gives_up_after_max_attempts(queue):
+    queue.submit("pid:A", "https://www.flipkart.com/a")
+    for attempt in range(1, 4):
+        [job] = queue.lease(f"node-{attempt}")
+        assert job["attempts"] == attempt
+        expire_leases(queue)
+    assert queue.lease("node-4") == []
+    [result] = queue.take_results()
+    assert (result["product_key"], result["attempts"], result["result"]) == ("pid:A", 3, None)
+
+
+def test_take_results_frees_the_product_for_the_next_cycle(queue):
+    queue.submit("pid:A", "https://www.flipkart.com/a")
+    [job] = queue.lease("node-1")
+    queue.complete(job, {"price": 1})
+    assert not queue.submit("pid:A", "https://www.flipkart.com/a")
+    assert len(queue.take_results()) == 1
+    assert queue.take_results() == []
+    assert queue.submit("pid:A", "https://www.flipkart.com/a")
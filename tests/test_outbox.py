@@ -0,0 +1,64 @@
+import asyncio
+
+import httpx
+
+import outbox as outbox_module
+from outbox import Outbox
+
+
+class FakeClient:
+    """Stands in for the httpx client; answers each post with the next queued status."""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.sent = []
+
+    async def post(self, url, data):
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.sent.append((data["chat_id"], data["text"], status))
+        return httpx.Response(status, json={})
+
+
+def run_outbox(outbox, client, messages, senders=1):
+    async def run():
+        outbox._loop = asyncio.get_running_loop()
+        outbox._due = asyncio.Queue()
+        for chat_id, text in messages:
+            message_id = outbox.storage.outbox_add(chat_id, text)
+            outbox._add({"id": message_id, "chat_id": chat_id, "text": text, "parse_mode": None})
+        tasks = [asyncio.create_task(outbox._sender(client)) for _ in range(senders)]
+        while outbox.depth():
+            await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def test_waiting_chat_does_not_hold_the_sender(storage):
+    outbox = Outbox("token", storage, senders=1, global_rate=1000, chat_rate=10)
+    client = FakeClient()
+    run_outbox(outbox, client, [(1, "a"), (1, "b"), (1, "c"), (2, "x")])
+    texts = [text for _, text, _ in client.sent]
+    # Chat 2 goes out while chat 1 waits for its next token
+    assert texts.index("x") < texts.index("b")
+    assert [text for chat_id, text, _ in client.sent if chat_id == 1] == ["a", "b", "c"]
+    assert outbox.sent == 4
+    assert storage.outbox_pending() == []
+
+
+def test_retry_keeps_chat_order(storage, monkeypatch):
+    monkeypatch.setattr(outbox_module.random, "uniform", lambda low, high: 0.01)
+    outbox = Outbox("token", storage, senders=2, global_rate=1000, chat_rate=1000)
+    client = FakeClient([502, 200, 200])
+    run_outbox(outbox, client, [(1, "a"), (1, "b")], senders=2)
+    assert client.sent == [(1, "a", 502), (1, "a", 200), (1, "b", 200)]
+
+
+def test_permanent_rejection_moves_on(storage):
+    outbox = Outbox("token", storage, senders=1, global_rate=1000, chat_rate=1000)
+    client = FakeClient([403])
+    run_outbox(outbox, client, [(1, "a"), (1, "b")])
+    assert (outbox.sent, outbox.failed) == (1, 1)
+    assert storage.outbox_pending() == []
@@ -0,0 +1,78 @@
+from page_data import extract_embedded, visible_text
+from product_fetcher import parse_product_html
+
+URL = "https://www.flipkart.com/item/p/itm1"
+
+JSON_LD = """<html><head>
+<script type="application/ld+json">{"@context": "http://schema.org", "@graph": [
+  {"@type": "BreadcrumbList"},
+  {"@type": "Product", "name": "Phone",
+   "offers": [{"@type": "Offer", "price": "12,999", "availability": "http://schema.org/OutOfStock",
+               "seller": {"name": "RetailNet"}}]}]}</script>
+<script type="application/ld+json">{not json</script>
+</head><body></body></html>"""
+
+STATE = """<html><body><script>window.__INITIAL_STATE__={"pricing":
+{"finalPrice":{"currency":"INR","value":499},"mrp":{"currency":"INR","value":999}}}</script></body></html>"""
+
+META = """<html><head>
+<meta property="og:title" content="Kettle &amp; Lid">
+<meta content="1,299" property="product:price:amount">
+<meta property="og:url" content="https://www.flipkart.com/kettle/p/itm2">
+</head><body></body></html>"""
+
+SELECTORS_ONLY = """<html><head><title>Lamp</title>
+<link href="https://www.flipkart.com/lamp/p/itm3" rel="canonical"></head>
+<body><h1 class="yhB1nd">Lamp</h1><div class="Nx9bqj CxhGGd">₹2,450</div></body></html>"""
+
+
+def test_json_ld_product_offer():
+    data = extract_embedded(JSON_LD)
+    assert data == {"via": "json_ld", "title": "Phone", "price": 12999,
+                    "in_stock": False, "seller": "RetailNet"}
+
+
+def test_state_blob_price_and_mrp():
+    data = extract_embedded(STATE)
+    assert data["via"] == "state"
+    assert (data["price"], data["mrp"]) == (499, 999)
+
+
+def test_json_ld_price_wins_over_state_blob():
+    page = JSON_LD.replace("</body>", STATE + "</body>")
+    data = extract_embedded(page)
+    assert (data["via"], data["price"], data["mrp"]) == ("json_ld", 12999, 999)
+
+
+def test_meta_tags_in_any_attribute_order():
+    data = extract_embedded(META)
+    assert data["via"] == "meta"
+    assert data["price"] == 1299
+    assert data["title"] == "Kettle & Lid"
+    assert data["canonical_url"] == "https://www.flipkart.com/kettle/p/itm2"
+
+
+def test_canonical_link_wins_over_og_url():
+    page = META.replace("</head>", '<link rel="canonical" href="https://www.flipkart.com/k/p/itm9?a=1&amp;b=2"></head>')
+    assert extract_embedded(page)["canonical_url"] == "https://www.flipkart.com/k/p/itm9?a=1&b=2"
+
+
+def test_no_embedded_price():
+    assert extract_embedded(SELECTORS_ONLY) == {"via": None, "canonical_url": "https://www.flipkart.com/lamp/p/itm3"}
+    assert extract_embedded("") == {"via": None}
+
+
+def test_parse_falls_back_to_selectors_without_embedded_price():
+    snapshot = parse_product_html(SELECTORS_ONLY, URL)
+    assert snapshot.price == 2450
+    assert snapshot.title == "Lamp"
+    assert snapshot.canonical_url == "https://www.flipkart.com/lamp/p/itm3"
+    assert snapshot.in_stock is True
+
+
+def test_parse_uses_embedded_price_and_visible_text_for_stock():
+    page = META.replace("<body>", "<body><script>var s = 'sold out';</script><p>Currently unavailable</p>")
+    snapshot = parse_product_html(page, URL)
+    assert snapshot.price == 1299
+    assert snapshot.in_stock is False
+    assert "sold out" not in visible_text(page)
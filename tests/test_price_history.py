@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from price_history import (PriceHistory, DAY, HOUR, _encode_varint, _decode_varints,
+                           _delta_encode, _delta_decode)
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 63, -64, 64, 127, 128, -129, 2 ** 31, -(2 ** 31), 2 ** 62])
+def test_zigzag_varint_round_trip(value):
+    out = bytearray()
+    _encode_varint(value, out)
+    assert _decode_varints(bytes(out)) == [value]
+
+
+def test_small_deltas_take_one_byte():
+    for value in (0, 1, -1, 63, -64):
+        out = bytearray()
+        _encode_varint(value, out)
+        assert len(out) == 1
+    out = bytearray()
+    _encode_varint(64, out)
+    assert len(out) == 2
+
+
+def test_delta_round_trip():
+    values = [1700000000, 1700000600, 1700000600, 1699999000, 1700086400]
+    assert _delta_decode(_delta_encode(values)) == values
+    # Blobs encoded against a previous value concatenate into one series
+    assert _delta_decode(_delta_encode(values[:2]) + _delta_encode(values[2:], values[1])) == values
+
+
+@pytest.fixture
+def history(storage):
+    return PriceHistory(storage, segment_points=4)
+
+
+def segments(history, resolution=None):
+    query = "SELECT * FROM price_history"
+    args = ()
+    if resolution is not None:
+        query += " WHERE resolution = ?"
+        args = (resolution,)
+    return history.storage.connection().execute(query + " ORDER BY start_ts", args).fetchall()
+
+
+def test_appends_extend_the_open_segment(history):
+    start = int(time.time()) - 3600
+    for i, price in enumerate([1000, 990, 1010, 980, 975, 999]):
+        history.append("pid:A", price, ts=start + i * 60)
+    rows = segments(history)
+    assert [row["count"] for row in rows] == [4, 2]
+    assert all(isinstance(row["ts_blob"], bytes) and isinstance(row["price_blob"], bytes) for row in rows)
+    assert history.points("pid:A") == [(start + i * 60, price) for i, price in enumerate([1000, 990, 1010, 980, 975, 999])]
+    assert history.points("pid:B") == []
+
+
+def test_out_of_order_point_starts_a_new_segment(history):
+    now = int(time.time())
+    history.append("pid:A", 100, ts=now)
+    history.append("pid:A", 90, ts=now - 60)
+    assert len(segments(history)) == 2
+    assert history.points("pid:A") == [(now - 60, 90), (now, 100)]
+
+
+def test_stats(history):
+    now = int(time.time())
+    for i, price in enumerate([500, 300, 400]):
+        history.append("pid:A", price, ts=now - 100 + i)
+    assert history.stats("pid:A") == {"count": 3, "min": 300, "max": 500, "avg": 400, "first": 500, "last": 400}
+    assert history.stats("pid:B") is None
+
+
+def test_compact_keeps_the_minimum_per_bucket(history):
+    now = int(time.time())
+    old = now - 40 * DAY
+    old -= old % HOUR
+    for i, price in enumerate([1000, 900, 950, 1200, 800]):
+        history.append("pid:A", price, ts=old + i * 900)
+    history.append("pid:A", 700, ts=now)
+
+    raw, hourly, dropped = history.compact(raw_days=30, hourly_days=180, retention_days=730)
+    assert (raw, hourly, dropped) == (1, 0, 0)
+    assert [(ts, price) for ts, price in history.points("pid:A", until=now - DAY)] == [(old, 900), (old + HOUR, 800)]
+    assert history.points("pid:A")[-1] == (now, 700)
+    assert {row["resolution"] for row in segments(history)} == {0, HOUR}
+
+
+def test_compact_drops_points_past_retention(history):
+    now = int(time.time())
+    history.segment_points = 2
+    history.append("pid:A", 100, ts=now - 800 * DAY)
+    history.append("pid:A", 100, ts=now - 800 * DAY + 60)
+    history.append("pid:A", 90, ts=now)
+    # Raw points fold to hourly, then daily, and the daily segment is past retention
+    assert history.compact() == (1, 1, 1)
+    assert history.points("pid:A") == [(now, 90)]
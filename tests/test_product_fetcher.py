@@ -0,0 +1,32 @@
+from product_fetcher import is_block_page, snapshot_from_response
+
+URL = "https://www.flipkart.com/item/p/itm1"
+
+BLOCK_PAGE = """<html><head><title>Are you a human?</title></head>
+<body><div class="g-recaptcha"></div></body></html>"""
+
+PRODUCT_PAGE = """<html><head><title>Phone | Flipkart</title>
+<script>window.config = {"captchaEnabled": true, "errors": ["access denied"]};</script>
+</head><body><h1 class="yhB1nd">Phone</h1><div class="Nx9bqj CxhGGd">₹12,999</div>
+<p>{}</p></body></html>""".replace("{}", "Specifications " * 2000)
+
+
+def test_status_codes_and_short_block_pages_are_blocks():
+    assert is_block_page(429, "")
+    assert is_block_page(200, BLOCK_PAGE)
+    assert snapshot_from_response(URL, 403, "", URL).blocked
+    assert snapshot_from_response(URL, 200, BLOCK_PAGE, URL).blocked
+
+
+def test_markers_in_scripts_of_a_full_page_are_not_a_block():
+    assert not is_block_page(200, PRODUCT_PAGE)
+    snapshot = snapshot_from_response(URL, 200, PRODUCT_PAGE, URL)
+    assert not snapshot.blocked
+    assert snapshot.price == 12999
+
+
+def test_a_page_with_a_price_is_never_a_block():
+    page = BLOCK_PAGE.replace("</body>", '<div class="Nx9bqj CxhGGd">₹499</div></body>')
+    snapshot = snapshot_from_response(URL, 200, page, URL)
+    assert not snapshot.blocked
+    assert snapshot.price == 499
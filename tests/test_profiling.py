@@ -0,0 +1,38 @@
+import functools
+import threading
+
+import pytest
+
+import profiling
+from profiling import Profiler, ProfileSession
+
+
+@pytest.fixture
+def profiler(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "ProfileSession",
+                        functools.partial(ProfileSession, directory=str(tmp_path), track_allocations=False))
+    return Profiler(cycles=0)
+
+
+def test_counts_below_one_are_refused(profiler):
+    for count in (0, -1):
+        with pytest.raises(ValueError):
+            profiler.profile_checks(count)
+    assert not profiler.active()
+
+
+def test_session_stops_after_the_last_check(profiler, tmp_path):
+    written = threading.Event()
+    assert profiler.profile_checks(2, on_done=lambda paths: written.set())
+    assert not profiler.profile_checks(1)
+    profiler.check_done()
+    assert profiler.active()
+    profiler.check_done()
+    assert written.wait(5)
+    assert not profiler.active()
+    assert any(path.name.endswith("-top.txt") for path in tmp_path.iterdir())
+    # A new profile can start once the previous one is written
+    written.clear()
+    assert profiler.profile_checks(1, on_done=lambda paths: written.set())
+    profiler.check_done()
+    assert written.wait(5)
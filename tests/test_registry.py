@@ -0,0 +1,39 @@
+from registry import ProductRegistry
+
+ITEM = {
+    "chat_id": 1,
+    "product_link": "https://www.flipkart.com/x/p/itm1?pid=PID1",
+    "product_key": "pid:PID1",
+    "title": "Phone",
+    "initial_price": 1000,
+    "last_price": 1000,
+}
+
+
+def test_reads_are_served_from_memory(storage):
+    registry = ProductRegistry(storage)
+    assert registry.add(ITEM)
+    assert registry.add(dict(ITEM, chat_id=2))
+    assert not registry.add(ITEM)
+    # A row written behind the registry's back is not seen until load()
+    storage.add_subscription(dict(ITEM, chat_id=3))
+    assert len(registry) == 2
+    assert [item["chat_id"] for item in registry.subscribers("pid:PID1")] == [1, 2]
+    registry.load()
+    assert registry.subscriber_counts() == {"pid:PID1": 3}
+
+
+def test_writes_go_through_to_storage(storage):
+    registry = ProductRegistry(storage)
+    registry.add(ITEM)
+    registry.update_price(1, "pid:PID1", 900, "2024-01-02 00:00:00", title="New title")
+    assert registry.get(1, "pid:PID1")["last_price"] == 900
+    stored = storage.find_subscription(1, "pid:PID1")
+    assert (stored["last_price"], stored["title"]) == (900, "New title")
+
+
+def test_callers_get_copies(storage):
+    registry = ProductRegistry(storage)
+    registry.add(ITEM)
+    registry.for_chat(1)[0]["last_price"] = 1
+    assert registry.get(1, "pid:PID1")["last_price"] == 1000
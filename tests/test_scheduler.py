@@ -0,0 +1,104 @@
+import time
+import threading
+
+import pytest
+
+from scheduler import CheckScheduler, TokenBucket, VOLATILE_SPEEDUP, STABLE_BACKOFF
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    assert [bucket.try_take(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_take(now) == pytest.approx(0.5)
+    assert bucket.try_take(now + 0.5) == 0.0
+
+
+def scheduler(**kwargs):
+    options = dict(base_interval=1000, min_interval=100, max_interval=10000, checks_per_minute=6000)
+    options.update(kwargs)
+    return CheckScheduler(**options)
+
+
+def make_due(s, *keys):
+    with s._cond:
+        for key in keys:
+            s._states[key].next_check_at = 0
+            s._push(s._states[key])
+
+
+def test_due_products_come_out_once_until_completed():
+    s = scheduler()
+    s.sync({"pid:A": 1, "pid:B": 1})
+    assert s.poll_due()[0] is None
+    make_due(s, "pid:A")
+    assert s.poll_due() == ("pid:A", None)
+    # In flight: not handed out again
+    make_due(s, "pid:A")
+    assert s.poll_due()[0] is None
+    s.complete("pid:A", 100)
+    assert s.stats()["in_flight"] == 0
+
+
+def test_interval_adapts_to_price_changes():
+    s = scheduler()
+    s.sync({"pid:A": 1})
+    state = s._states["pid:A"]
+    s.complete("pid:A", 100)
+    assert state.interval == 1000 * STABLE_BACKOFF
+    s.complete("pid:A", 90)
+    assert state.interval == 1000 * STABLE_BACKOFF / VOLATILE_SPEEDUP
+    s.complete("pid:A", None)
+    assert state.interval == 1000
+    assert state.last_price == 90
+
+
+def test_removed_products_are_skipped():
+    s = scheduler()
+    s.sync({"pid:A": 1, "pid:B": 1})
+    make_due(s, "pid:A", "pid:B")
+    s.sync({"pid:B": 1})
+    assert s.poll_due() == ("pid:B", None)
+    assert s.poll_due()[0] is None
+
+
+def test_rate_limit_holds_back_due_products():
+    s = scheduler(checks_per_minute=6)
+    s.sync({f"pid:{n}": 1 for n in range(3)})
+    make_due(s, *s._states)
+    # Burst capacity is one check; the next waits about ten seconds
+    assert s.poll_due()[0] is not None
+    key, wait = s.poll_due()
+    assert key is None and wait == pytest.approx(10, abs=0.5)
+
+
+def test_schedule_survives_a_restart(storage):
+    first = scheduler(storage=storage)
+    first.sync({"pid:A": 1})
+    first.complete("pid:A", 100)
+    saved = storage.load_schedule()["pid:A"]
+
+    second = scheduler(storage=storage)
+    second.sync({"pid:A": 1})
+    state = second._states["pid:A"]
+    assert (state.next_check_at, state.interval, state.last_price) == (
+        saved["next_check_at"], saved["interval"], 100)
+    assert state.next_check_at > time.time()
+
+
+def test_schedule_is_written_outside_the_lock(storage, monkeypatch):
+    s = scheduler(storage=storage)
+    s.sync({"pid:A": 1})
+    polled = []
+    save_schedule = storage.save_schedule
+
+    def save_while_polling(*args):
+        # Another thread can use the scheduler while the row is written
+        poller = threading.Thread(target=lambda: polled.append(s.poll_due()))
+        poller.start()
+        poller.join(2)
+        save_schedule(*args)
+
+    monkeypatch.setattr(storage, "save_schedule", save_while_polling)
+    s.complete("pid:A", 100)
+    assert len(polled) == 1
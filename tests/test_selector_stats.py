@@ -0,0 +1,103 @@
+import json
+
+from selector_stats import SelectorStats
+
+SELECTORS = ["._a", "._b", "._c"]
+
+
+def stats(**kwargs):
+    options = dict(path=None, alpha=0.5, dead_rate=0.05, min_tries=4, save_interval=3600)
+    options.update(kwargs)
+    return SelectorStats(**options)
+
+
+def test_unseen_selectors_keep_declared_order():
+    assert stats().ranked("http", "price", SELECTORS) == SELECTORS
+
+
+def test_hits_rank_first_and_misses_sink():
+    s = stats()
+    s.record("http", "price", "._c", True, 0.001)
+    s.record("http", "price", "._a", False, 0.001)
+    # Unseen ._b ranks between a working and a missing selector
+    assert s.ranked("http", "price", SELECTORS) == ["._c", "._b", "._a"]
+
+
+def test_faster_selector_wins_a_tie():
+    s = stats()
+    s.record("http", "price", "._a", True, 0.020)
+    s.record("http", "price", "._b", True, 0.002)
+    assert s.ranked("http", "price", SELECTORS)[:2] == ["._b", "._a"]
+
+
+def test_fields_and_page_types_are_ranked_separately():
+    s = stats()
+    s.record("http", "price", "._c", True, 0.001)
+    assert s.ranked("browser", "price", SELECTORS) == SELECTORS
+    assert s.ranked("http", "title", SELECTORS) == SELECTORS
+
+
+def test_failing_selector_is_demoted_but_still_tried():
+    s = stats()
+    s.record("http", "price", "._a", True, 0.001)
+    for _ in range(6):
+        s.record("http", "price", "._a", False, 0.001)
+    assert s.stats()["http:price"]["dead"] == 1
+    # Behind unseen selectors, but not dropped
+    assert s.ranked("http", "price", SELECTORS) == ["._b", "._c", "._a"]
+
+
+def test_demoted_selector_climbs_back_when_it_matches_again():
+    s = stats()
+    for _ in range(5):
+        s.record("http", "price", "._a", False, 0.001)
+    assert s.ranked("http", "price", SELECTORS)[-1] == "._a"
+    s.record("http", "price", "._a", True, 0.001)
+    s.record("http", "price", "._a", True, 0.001)
+    assert s.ranked("http", "price", SELECTORS)[0] == "._a"
+
+
+def test_demoted_selectors_order_by_last_hit():
+    s = stats()
+    for selector in ("._a", "._b"):
+        for _ in range(5):
+            s.record("http", "price", selector, False, 0.001)
+    s._entries["http:price"]["._b"]["last_hit"] = 100
+    assert s.ranked("http", "price", SELECTORS) == ["._c", "._b", "._a"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "selector_stats.json")
+    s = stats(path=path)
+    s.record("http", "price", "._c", True, 0.004)
+    s.record("http", "price", "._a", False, 0.001)
+    s.save()
+    with open(path) as f:
+        assert set(json.load(f)["http:price"]) == {"._a", "._c"}
+
+    restored = stats(path=path)
+    assert restored.ranked("http", "price", SELECTORS) == ["._c", "._b", "._a"]
+    assert restored.stats() == s.stats()
+
+
+def test_save_only_writes_when_dirty(tmp_path):
+    path = tmp_path / "selector_stats.json"
+    s = stats(path=str(path))
+    s.save()
+    assert not path.exists()
+    s.record("http", "price", "._a", True, 0.001)
+    s.save()
+    assert path.exists()
+
+
+def test_record_saves_after_the_interval(tmp_path):
+    path = tmp_path / "selector_stats.json"
+    s = stats(path=str(path), save_interval=0)
+    s.record("http", "price", "._a", True, 0.001)
+    assert path.exists()
+
+
+def test_corrupt_file_starts_empty(tmp_path):
+    path = tmp_path / "selector_stats.json"
+    path.write_text("{not json")
+    assert stats(path=str(path)).ranked("http", "price", SELECTORS) == SELECTORS
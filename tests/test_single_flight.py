@@ -0,0 +1,93 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from check_engine import CheckEngine, HostThrottle, SingleFlight
+
+
+def run_concurrently(flight, fn, callers=5):
+    """Start `callers` do() calls while the leader is still inside fn."""
+    release = threading.Event()
+    started = threading.Event()
+
+    def leader_fn():
+        started.set()
+        release.wait(5)
+        return fn()
+
+    with ThreadPoolExecutor(callers) as pool:
+        leader = pool.submit(flight.do, "pid:A", leader_fn)
+        started.wait(5)
+        followers = [pool.submit(flight.do, "pid:A", leader_fn) for _ in range(callers - 1)]
+        # Followers are counted before they block on the leader's result
+        while flight.stats()["coalesced"] < callers - 1:
+            time.sleep(0.001)
+        release.set()
+        return [leader] + followers
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    calls = []
+    futures = run_concurrently(flight, lambda: calls.append(1) or "result")
+    assert [future.result() for future in futures] == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "fresh_hits": 0, "in_flight": 0}
+
+
+def test_waiters_get_the_leaders_exception():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("blocked")
+
+    for future in run_concurrently(flight, fail):
+        with pytest.raises(ValueError):
+            future.result()
+    # A failure is not remembered; the next call runs again
+    assert flight.do("pid:A", lambda: "again", max_age=60) == "again"
+
+
+def test_fresh_results_are_reused_only_when_asked():
+    flight = SingleFlight(ttl=60)
+    assert flight.do("pid:A", lambda: 1) == 1
+    assert flight.do("pid:A", lambda: 2) == 2
+    assert flight.do("pid:A", lambda: 3, max_age=60) == 2
+    assert flight.fresh("pid:A", 60) == 2
+    assert flight.fresh("pid:A", 0) is None
+    assert flight.stats()["fresh_hits"] == 2
+
+
+def test_rejected_results_are_not_remembered():
+    flight = SingleFlight(keep=lambda result: result is not None)
+    flight.do("pid:A", lambda: None)
+    assert flight.fresh("pid:A", 60) is None
+
+
+def test_async_fetches_of_one_key_share_a_task():
+    engine = CheckEngine(workers=1, max_in_flight=4, throttle=HostThrottle(0, 0),
+                         classify=lambda result: "ok")
+    calls = []
+
+    async def fetch(url):
+        calls.append(url)
+        await asyncio.sleep(0.05)
+        return {"url": url}
+
+    async def run():
+        url = "https://www.flipkart.com/x/p/itm1?pid=PID1"
+        results = await asyncio.gather(*(engine.fetch_async(url, fetch, key="pid:PID1") for _ in range(5)))
+        later = await engine.fetch_async(url, fetch, key="pid:PID1", max_age=60)
+        return results, later
+
+    try:
+        results, later = asyncio.run(run())
+    finally:
+        engine.shutdown()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert later is results[0]
+    assert engine.flights.stats()["coalesced"] == 4
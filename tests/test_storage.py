@@ -0,0 +1,87 @@
+import json
+
+from product_fetcher import ProductSnapshot
+
+ITEM = {
+    "chat_id": 1,
+    "product_link": "https://www.flipkart.com/x/p/itm1?pid=PID1",
+    "product_key": "pid:PID1",
+    "title": "Phone",
+    "initial_price": 1000,
+    "last_price": 1000,
+    "added_date": "2024-01-01 00:00:00",
+    "last_checked": "2024-01-01 00:00:00",
+}
+
+
+def test_schema_has_every_table(storage):
+    rows = storage.connection().execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    tables = {row["name"] for row in rows}
+    assert {"meta", "products", "subscriptions", "checks", "price_history", "outbox", "jobs", "schedule"} <= tables
+    assert storage.connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_duplicate_subscription_is_rejected(storage):
+    assert storage.add_subscription(ITEM)
+    assert not storage.add_subscription(dict(ITEM, last_price=1))
+    # A second chat may track the same product
+    assert storage.add_subscription(dict(ITEM, chat_id=2))
+    assert [item["chat_id"] for item in storage.list_subscriptions()] == [1, 2]
+    assert storage.list_subscriptions(2)[0]["last_price"] == 1000
+
+
+def test_update_subscription_price_touches_one_row(storage):
+    storage.add_subscription(ITEM)
+    storage.add_subscription(dict(ITEM, chat_id=2))
+    storage.update_subscription_price(1, "pid:PID1", 900, "2024-01-02 00:00:00")
+    assert storage.find_subscription(1, "pid:PID1")["last_price"] == 900
+    assert storage.find_subscription(2, "pid:PID1")["last_price"] == 1000
+
+
+def test_record_check_logs_failures_without_a_product_row(storage):
+    storage.record_check("pid:PID1", ITEM["product_link"], None)
+    assert storage.connection().execute("SELECT COUNT(*) FROM products").fetchone()[0] == 0
+    storage.record_check("pid:PID1", ITEM["product_link"], ProductSnapshot(url=ITEM["product_link"], price=950, in_stock=True))
+    row = storage.connection().execute("SELECT * FROM products").fetchone()
+    assert (row["last_price"], row["in_stock"]) == (950, 1)
+    checks = storage.connection().execute("SELECT ok FROM checks ORDER BY id").fetchall()
+    assert [check["ok"] for check in checks] == [0, 1]
+    assert storage.checked_since(0) == {"pid:PID1"}
+
+
+def test_checked_since_skips_failed_checks(storage):
+    # A product whose check failed just before a crash is checked again on resume
+    storage.record_check("pid:PID2", ITEM["product_link"], None)
+    storage.record_check("pid:PID3", ITEM["product_link"], ProductSnapshot(url=ITEM["product_link"]))
+    assert storage.checked_since(0) == set()
+
+
+def test_sweep_cursor_round_trip(storage):
+    assert storage.sweep_cursor("main") is None
+    storage.set_sweep_cursor("main", {"started_at": 1.0, "next": 3})
+    assert storage.sweep_cursor("main") == {"started_at": 1.0, "next": 3}
+    storage.clear_sweep_cursor("main")
+    assert storage.sweep_cursor("main") is None
+
+
+def test_migrate_from_json_runs_once(storage, tmp_path):
+    legacy = dict(ITEM)
+    del legacy["product_key"]
+    path = tmp_path / "tracked_products.json"
+    path.write_text(json.dumps([legacy, dict(legacy, chat_id=2), legacy]))
+    keys = []
+
+    def key_fn(link):
+        keys.append(link)
+        return "pid:PID1"
+
+    # The duplicate entry for chat 1 is dropped by the unique constraint
+    assert storage.migrate_from_json(str(path), key_fn) == 2
+    assert len(keys) == 3
+    assert storage.find_subscription(2, "pid:PID1")["title"] == "Phone"
+    assert storage.migrate_from_json(str(path), key_fn) == 0
+
+
+def test_migrate_without_json_file_marks_done(storage, tmp_path):
+    assert storage.migrate_from_json(str(tmp_path / "missing.json"), None) == 0
+    assert storage.connection().execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone()